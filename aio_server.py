@@ -0,0 +1,362 @@
+"""
+aio_server.py – event-loop server engine.
+
+Runs the same handshake → register → create/join → relay state machine as
+`server.Client`, but every connection is a coroutine on one asyncio loop
+instead of its own thread. Rooms and the room registry are the regular
+`server.Room` / `server.Server` objects; since everything runs on the loop
+thread their locks are never contended.
+
+Enable with "SERVER_ENGINE": "asyncio" in settings/server_settings.json.
+"""
+
+import asyncio, json, struct, secrets, itertools, time
+from server import (Server, SETTINGS, HOST, PORT,
+                    encode_for, stamp_media, sealed_media, wants_room_key, handle_control,
+                    key_exchange, resume_keys, issue_ticket, take_seat, room_created, is_viewer, join_listener,
+                    COALESCE_MAX, COALESCE_BYTES, SEND_PRIORITY, SEND_LOWAT, split_size, frames_for, BAD_INPUT)
+import protocol
+from framing import limit_unsent, MAX_FRAME
+from encryption import CryptoSession
+from outbound import OutboundQueue
+from congestion import BandwidthEstimator
+from metrics import METRICS
+from udp import UdpRelay
+
+
+#HELPERS-------------------------
+
+def _pack(payload: dict) -> bytes:
+    data = json.dumps(payload).encode()
+    return struct.pack("!I", len(data)) + data
+
+async def _read_payload(reader: asyncio.StreamReader, ln: int) -> bytes:
+    # A peer-supplied length; past MAX_FRAME it is a broken peer, as in framing.FrameReader.
+    if ln > MAX_FRAME:
+        raise ConnectionError(f"Frame of {ln} bytes")
+    return await reader.readexactly(ln)
+
+async def _recv(reader: asyncio.StreamReader) -> dict:
+    try:
+        hdr = await reader.readexactly(4)
+        (ln,) = struct.unpack("!I", hdr)
+        buf = await _read_payload(reader, ln)
+    except asyncio.IncompleteReadError:
+        raise ConnectionError
+    return json.loads(buf.decode())
+
+async def _recv_v1(reader: asyncio.StreamReader, sym_key: bytes, nonce: bytes, session=None) -> dict:
+    try:
+        (ln,) = struct.unpack("!I", await reader.readexactly(4))
+        return protocol.unpack_v1(await _read_payload(reader, ln), sym_key, nonce, session)
+    except asyncio.IncompleteReadError:
+        raise ConnectionError
+
+async def _recv_v2(reader: asyncio.StreamReader, partials: dict) -> tuple[tuple, bytes, bytes]:
+    """
+    Async counterpart of `protocol.recv_v2`.
+    :param partials: The connection's messages still arriving in fragments.
+    """
+    try:
+        while True:
+            raw = await reader.readexactly(protocol.HEADER.size)
+            header = protocol.HEADER.unpack(raw)
+            whole = protocol.reassemble(partials, header, raw, await _read_payload(reader, header[-1]))
+            if whole is not None:
+                return whole
+    except asyncio.IncompleteReadError:
+        raise ConnectionError
+
+#CLASSES-----------------------------
+
+class AsyncClient:
+    """
+    A connected user served by the event loop. Mirrors `server.Client`.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, server: "AsyncServer"):
+        self.reader, self.writer, self.server = reader, writer, server
+        self.addr = writer.get_extra_info("peername")
+        self.room_code = None
+        self.name = ""
+        self.user_id = secrets.token_hex(16)
+        self.stream_id = server.next_stream_id()
+        self.sym_key = None
+        self.crypto: CryptoSession | None = None
+        self.nonce = secrets.token_bytes(8)
+        self.wire = protocol.WIRE_V1
+        self._seq = itertools.count()
+        self.outbox = OutboundQueue(SETTINGS.get("SEND_QUEUE_SIZE", 32),
+                                    SETTINGS.get("SEND_QUEUE_POLICY", "video_first"),
+                                    observe_wait=server.queue_wait_observer, prioritize=SEND_PRIORITY)
+        self._ready = asyncio.Event()
+        self._partials: dict = {}       # see protocol.reassemble
+        limit_unsent(writer.get_extra_info("socket"), SEND_LOWAT)
+        self.bwe = BandwidthEstimator(writer.get_extra_info("socket"))
+        self.media_key = None
+        self.room_keyed = False
+        self.layer_prefs: dict[str, int] = {}
+        self.pinned: str | None = None
+        self.udp = None
+        self.resume_join: dict | None = None
+        self.resumable = False
+        self.superseded = False
+        self.viewer = False
+        self.relay: tuple | None = None
+
+    async def run(self):
+        writer_task = asyncio.create_task(self._write_loop())
+        METRICS.inc("zoombo_connections_opened_total")
+        try:
+            # 0. Initial handshake: must exchange symmetric key first. If not, reject.
+            first = await _recv(self.reader)
+            started = time.perf_counter()
+            if first["type"] == "resume":
+                if not await self._resume(first):
+                    return
+            elif first["type"] != "exchange_sym":
+                self.writer.write(_pack({"type": "reject", "reason": "Must exchange symmetric key first "}))
+                return
+            else:
+                self.sym_key, key_fields = key_exchange(first)
+                self.crypto = CryptoSession(self.sym_key, self.nonce, protocol.TO_CLIENT)
+                self.wire = protocol.negotiate(first.get("wire"))
+                self.writer.write(_pack({
+                    "type": "exchange_sym_response",
+                    **key_fields,
+                    "nonce": self.nonce.hex(),
+                    "wire": self.wire
+                }))
+
+                # 1. Wait for registration request to get ID from server.
+                msg = await self.recv()
+                if msg["type"] != "register":
+                    self.send({"type": "reject", "reason": "Must register first"})
+                    return
+                self.user_id = secrets.token_hex(16)
+                self.name = msg["name"]
+                self.send({"type": "register_response", "user_id": self.user_id, "stream_id": self.stream_id})
+            METRICS.observe("zoombo_handshake_seconds", time.perf_counter() - started)
+
+            # 2. Wait for join/create_room request.
+            room_code = await self.create_or_join_room(self.resume_join)
+            if room_code is None:
+                return
+            room = self.server.get_room(room_code, create=False)
+
+            # 3. Main message loop
+            while True:
+                msg = await self.recv()
+                if msg.get("type") == "leave":
+                    self.resumable = False
+                    break  # Explicit leave request
+                if handle_control(self, room, msg):
+                    continue
+                room.broadcast(msg, exclude_client_id=self.user_id)
+        except BAD_INPUT:
+            pass
+        finally:
+            if self.udp:
+                self.server.udp.forget(self)
+            if self.resumable:
+                self.server.park(self)
+            elif not self.superseded:
+                self.server.drop(self.room_code, self)
+            self.close()
+            try:
+                await asyncio.wait_for(writer_task, timeout=1.0)
+            except asyncio.TimeoutError:
+                pass
+            self.writer.close()
+            METRICS.inc("zoombo_connections_closed_total")
+
+    async def _resume(self, first: dict) -> bool:
+        """
+        Resumption handshake (see `server.Client._handshake`).
+        :returns: False if the ticket or the proof was no good.
+        """
+        keys = resume_keys(first)
+        if keys is None:
+            self.writer.write(_pack({"type": "reject", "reason": "Session expired"}))
+            return False
+        ticket, self.sym_key, server_random = keys
+        self.crypto = CryptoSession(self.sym_key, self.nonce, protocol.TO_CLIENT)
+        self.wire = protocol.negotiate(first.get("wire"))
+        self.writer.write(_pack({
+            "type": "resume_response",
+            "server_random": server_random.hex(),
+            "nonce": self.nonce.hex(),
+            "wire": self.wire
+        }))
+        msg = await self.recv()
+        if msg.get("type") != "resume_seat" or not secrets.compare_digest(str(msg.get("proof")), ticket["proof"]):
+            self.send({"type": "reject", "reason": "Session expired"})
+            return False
+        self.resume_join = {"type": "resume_seat", "room_code": ticket["room_code"], "user_id": ticket["user_id"]}
+        return True
+
+    async def recv(self) -> dict:
+        if self.wire == protocol.WIRE_V1:
+            return stamp_media(self, await _recv_v1(self.reader, self.sym_key, self.nonce, self.crypto))
+        header, raw, payload = await _recv_v2(self.reader, self._partials)
+        sealed = sealed_media(self, header, raw, payload)
+        if sealed is not None:
+            return sealed
+        return stamp_media(self, protocol.unpack_v2(header, payload, self.sym_key, self.nonce,
+                                                     session=self.crypto))
+
+    def send(self, msg):
+        # Only enqueue; _write_loop applies transport backpressure via drain().
+        if self.udp and self.server.udp.send(self, msg):
+            return
+        if self.outbox.put(msg):
+            self._ready.set()
+
+    async def _write_loop(self):
+        try:
+            while True:
+                # No coalescing window here: waiting would stall the loop. What is queued goes together.
+                msgs = self.outbox.get_many(COALESCE_MAX, COALESCE_BYTES, timeout=0, split=split_size(self))
+                if not msgs:
+                    if self.outbox.closed:
+                        break
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+                frames = []
+                for msg in msgs:
+                    frames += frames_for(self, msg)
+                self.writer.writelines(frames)
+                METRICS.inc("zoombo_messages_sent_total", n=len(msgs))
+                METRICS.inc("zoombo_send_calls_total")
+                self.bwe.on_sent(sum(map(len, frames)))
+                self.bwe.update(self.outbox.queued_bytes, self.writer.transport.get_write_buffer_size())
+                await self.writer.drain()
+        except ConnectionError:
+            pass
+        self.outbox.close()
+
+    def close(self):
+        self.outbox.close()
+        self._ready.set()
+
+    def kick(self):
+        # See `server.Client.kick`.
+        self.superseded, self.resumable = True, False
+        self.writer.transport.abort()
+
+    def peer_info(self) -> dict:
+        return {"type": "peer", "user_id": self.user_id, "name": self.name, "stream_id": self.stream_id}
+
+    async def create_or_join_room(self, msg: dict | None = None):
+        """
+        Async counterpart of `server.Client.create_or_join_room`.
+        :param msg: Already-received request to act on instead of waiting for one.
+        :returns: The room code if a room is created or joined, otherwise None.
+        """
+        while True:
+            msg = msg or await self.recv()
+            if msg["type"] == "resume_seat" and msg is self.resume_join:
+                if not self.server.owns(msg["room_code"]):
+                    return self._not_owned()
+                return take_seat(self, msg)
+
+            if msg["type"] == "create_room":
+                code = self.server.new_room_code()
+
+                self.room_code = code
+                room = self.server.get_room(self.room_code, create=True)
+                payload = room_created(room, msg)
+                room.add(self)
+                print("Room created:", self.room_code)
+                self.send(payload)
+                # Wait for the client to join the room after creation.
+                msg = None
+                continue
+
+            if msg["type"] == "join":
+                room_code = msg["room_code"].upper()
+                if not self.server.owns(room_code):
+                    return self._not_owned()
+                if room_code not in self.server.rooms:
+                    self.send({"type": "reject", "reason": "Room does not exist"})
+                    return None
+
+                room = self.server.get_room(room_code, create=False)
+                self.viewer = is_viewer(self, room, msg)
+                if self.viewer is None:
+                    return None
+                if msg.get("relay") is not None or (self.viewer and self.server.relays):
+                    return join_listener(self, room, msg)
+                self.room_code = room_code
+                self.media_key = room.media_key
+                self.room_keyed = wants_room_key(self, msg)
+                if not room.add(self):
+                    return None
+
+                payload = {
+                    "type": "room_joined",
+                    "room_code": self.room_code,
+                    "user_id": self.user_id
+                }
+                if self.room_keyed:
+                    payload["media_key"] = room.media_key.hex()
+                if self.viewer:
+                    payload["viewer"] = True
+                issue_ticket(self, payload)
+                self.send(payload)
+                return self.room_code
+
+            self.send({"type": "reject", "reason": "Must join or create room after registration"})
+            return None
+
+    def _not_owned(self):
+        # As server.Client checks, though this engine has no workers to hand the connection to
+        # (shard.py is threaded only), so a room owned elsewhere is one we can't serve.
+        self.send({"type": "reject", "reason": "Room does not exist"})
+        return None
+
+
+class AsyncServer(Server):
+    """
+    `Server` whose connections all live on a single asyncio event loop.
+    """
+
+    def _start_mixer(self, mixer):
+        # Called from a connection coroutine, so the loop is running.
+        asyncio.get_running_loop().create_task(mixer.run_async())
+
+    def _call_later(self, delay, fn, *args):
+        asyncio.get_running_loop().call_later(delay, fn, *args)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        await AsyncClient(reader, writer, self).run()
+
+    async def _start_udp_async(self, host):
+        if not self.udp_port:
+            return
+        relay = self.udp = UdpRelay(self, self.udp_port)
+
+        class Endpoint(asyncio.DatagramProtocol):
+            def datagram_received(self, data, addr):
+                relay.handle(data, addr)
+
+        transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            Endpoint, local_addr=(host, self.udp_port))
+        relay.sendto = transport.sendto
+
+    async def _serve(self, host, port):
+        self.start_metrics()
+        await self._start_udp_async(host)
+        srv = await asyncio.start_server(self._handle, host, port,
+                                         backlog=SETTINGS.get("LISTEN_BACKLOG", 128))
+        print(f"Server (asyncio) listening on {host}:{port}")
+        async with srv:
+            await srv.serve_forever()
+
+    def serve_forever(self, host=HOST, port=PORT):
+        asyncio.run(self._serve(host, port))
+
+
+if __name__ == "__main__":
+    AsyncServer().serve_forever()
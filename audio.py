@@ -1,23 +1,25 @@
-import pyaudio, threading, queue, time
+import pyaudio, threading, time
 from typing import Callable
+from playout import PlayoutMixer
 
 RATE   = 16_000
 CHUNK  = 320          # 20ms
 FORMAT = pyaudio.paInt16
 CHANNELS = 1
+PLAYOUT_DELAY = 0.06  # 60ms sync cushion: a packet stamped ts is played at ts + this (playout.py, jitter.py)
 
 class AudioIO:
     """Bi‑directional audio with selectable devices."""
 
     def __init__(self,
                  on_capture: Callable[[bytes], None],
-                 play_q: queue.Queue[tuple[bytes, float]],
+                 mixer: PlayoutMixer,
                  input_dev: int | None = None,
                  output_dev: int | None = None):
         print(f"Opening AudioIO with input_dev={input_dev}, output_dev={output_dev}")
         self.p = pyaudio.PyAudio()
         self.on_capture = on_capture
-        self.play_q = play_q
+        self.mixer = mixer
 
         self.in_stream = self.p.open(format=FORMAT,
                                      channels=CHANNELS,
@@ -55,18 +57,9 @@ class AudioIO:
             self.p.terminate()
 
     def _play_loop(self):
-        DELAY = 0.06  # 60ms sync cushion
+        # One mixed 20 ms frame per write; the blocking write is the playout clock.
         while self._running:
-            try:
-                frame, ts = self.play_q.get(timeout=0.1)
-                if frame == b"-1":
-                    break
-                wait = (ts + DELAY) - time.time()
-                if wait > 0:
-                    time.sleep(wait)
-                self.out_stream.write(frame)
-            except queue.Empty:
-                pass
+            self.out_stream.write(self.mixer.mix())
 
     def close(self):
         self._running = False
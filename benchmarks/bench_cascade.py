@@ -0,0 +1,96 @@
+"""
+bench_cascade.py – broadcast rooms served by the origin alone vs through relays.
+
+Starts an origin server and 0…K relay nodes (relay.py) on local ports, runs
+loadgen with one presenter per room and many viewers, and reports per
+process the CPU it burned and, for the origin, how many connections it
+had to fan out to. With relays the origin's fan-out per room is
+presenters + relays however many viewers there are; each relay carries at
+most RELAY_CAPACITY of them.
+
+Run from the repository root (Linux: CPU time is read from /proc):
+    python -m benchmarks.bench_cascade --relays 0 3 --viewers 150
+"""
+
+import argparse, os, socket, subprocess, sys, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SECRET = "bench-cascade"
+ORIGIN = """
+import {module} as m, server
+server.SETTINGS['RELAYS'] = {relays!r}
+server.SETTINGS['ROOM_CAPACITY'] = {capacity}    # let the origin alone take every viewer, to compare
+server.RELAY_SECRET = {secret!r}
+m.{cls}().serve_forever(host='127.0.0.1', port={port})
+"""
+ENGINES = {"threaded": ("server", "Server"), "asyncio": ("aio_server", "AsyncServer")}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _wait_for(port: int):
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"nothing listening on {port}")
+
+def _cpu(pid: int) -> float:
+    # utime + stime, seconds
+    fields = open(f"/proc/{pid}/stat").read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+def run(engine: str, relays: int, args) -> list[tuple[str, float]]:
+    origin = _free_port()
+    relay_ports = [_free_port() for _ in range(relays)]
+    module, cls = ENGINES[engine]
+    code = ORIGIN.format(module=module, cls=cls, port=origin, secret=SECRET, capacity=args.viewers + 1,
+                         relays=[f"127.0.0.1:{p}" for p in relay_ports])
+    procs = [("origin", subprocess.Popen([sys.executable, "-c", code], cwd=ROOT,
+                                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))]
+    try:
+        _wait_for(origin)
+        for i, port in enumerate(relay_ports):
+            procs.append((f"relay {i + 1}", subprocess.Popen(
+                [sys.executable, "relay.py", "--host", "127.0.0.1", "--port", str(port),
+                 "--origin", f"127.0.0.1:{origin}", "--secret", SECRET],
+                cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)))
+        for port in relay_ports:
+            _wait_for(port)
+        before = {name: _cpu(p.pid) for name, p in procs}
+        subprocess.run([sys.executable, "loadgen.py", "--port", str(origin), "--rooms", str(args.rooms),
+                        "--room-size", "1", "--video-senders", "1", "--viewers", str(args.viewers),
+                        "--duration", str(args.duration), "--wire", str(args.wire),
+                        *(["--room-key"] if args.room_key else []), "--procs", str(args.procs)],
+                       cwd=ROOT, check=True)
+        return [(name, (_cpu(p.pid) - before[name]) / args.duration) for name, p in procs]
+    finally:
+        for _, p in procs:
+            p.kill()
+            p.wait()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--engine", choices=ENGINES, default="threaded")
+    ap.add_argument("--relays", type=int, nargs="+", default=[0, 3], help="relay counts to compare")
+    ap.add_argument("--rooms", type=int, default=1)
+    ap.add_argument("--viewers", type=int, default=100, help="viewers per room")
+    ap.add_argument("--duration", type=float, default=10)
+    ap.add_argument("--wire", type=int, default=3)
+    ap.add_argument("--room-key", action="store_true")
+    ap.add_argument("--procs", type=int, default=2, help="loadgen processes")
+    args = ap.parse_args()
+
+    for relays in args.relays:
+        print(f"\n── {args.rooms} room(s) x {args.viewers} viewers, {relays} relay(s), {args.engine} origin")
+        rows = run(args.engine, relays, args)
+        fan_out = (1 + relays if relays else 1 + args.viewers) * args.rooms
+        print(f"origin fan-out: {fan_out} connections; per process CPU (cores busy):")
+        for name, cores in rows:
+            print(f"  {name:<8} {cores:6.2f}")
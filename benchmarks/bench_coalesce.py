@@ -0,0 +1,96 @@
+"""
+bench_coalesce.py – server writers sending each message on its own vs
+coalescing queued messages into one sendmsg.
+
+Starts the threaded server once per setting, drives it with loadgen
+(audio-heavy rooms by default: the 20 ms packets are the many-small-sends
+case) and reports:
+  • send calls per message sent, from the server's own counters (/metrics)
+  • server CPU in cores busy, from /proc
+  • loadgen's end-to-end audio latency, to check the window doesn't cost any
+
+Run from the repository root (Linux):
+    python -m benchmarks.bench_coalesce --rooms 20 --room-size 8 --duration 10
+"""
+
+import argparse, os, re, socket, subprocess, sys, time, urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER = """
+import server
+server.SETTINGS['METRICS_PORT'] = {metrics}
+server.COALESCE_MAX, server.COALESCE_WINDOW = {max_msgs}, {window_ms} / 1000
+server.Server().serve_forever(host='127.0.0.1', port={port})
+"""
+# label -> (SEND_COALESCE_MAX, SEND_COALESCE_MS)
+SETTINGS = {
+    "one send per message": (1, 0),
+    "coalesce queued": (64, 0),
+    "coalesce, 2 ms window": (64, 2),
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _wait_for(port: int):
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"nothing listening on {port}")
+
+def _cpu(pid: int) -> float:
+    # utime + stime, seconds
+    fields = open(f"/proc/{pid}/stat").read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+def _counters(metrics: int) -> dict[str, float]:
+    text = urllib.request.urlopen(f"http://127.0.0.1:{metrics}/metrics").read().decode()
+    return {name: float(value) for name, value in re.findall(r"^(zoombo_\w+_total) (\S+)$", text, re.M)}
+
+def run(max_msgs: int, window_ms: float, args) -> dict:
+    port, metrics = _free_port(), _free_port()
+    proc = subprocess.Popen([sys.executable, "-c", SERVER.format(port=port, metrics=metrics, max_msgs=max_msgs,
+                                                                 window_ms=window_ms)],
+                            cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _wait_for(port)
+        _wait_for(metrics)
+        before, cpu = _counters(metrics), _cpu(proc.pid)
+        out = subprocess.run([sys.executable, "loadgen.py", "--port", str(port), "--rooms", str(args.rooms),
+                              "--room-size", str(args.room_size), "--video-senders", str(args.video_senders),
+                              "--duration", str(args.duration), "--wire", "3", "--room-key",
+                              "--chat-every", "0", "--procs", str(args.procs)],
+                             cwd=ROOT, check=True, capture_output=True, text=True).stdout
+        cpu, after = _cpu(proc.pid) - cpu, _counters(metrics)
+    finally:
+        proc.kill()
+        proc.wait()
+    sent = after["zoombo_messages_sent_total"] - before.get("zoombo_messages_sent_total", 0)
+    calls = after["zoombo_send_calls_total"] - before.get("zoombo_send_calls_total", 0)
+    audio = re.search(r"latency audio ms: p50 (\S+)\s+p90 \S+\s+p99 (\S+)", out)
+    return {"sent": sent, "calls": calls, "cores": cpu / args.duration,
+            "p50": audio and float(audio[1]), "p99": audio and float(audio[2])}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rooms", type=int, default=20)
+    ap.add_argument("--room-size", type=int, default=8)
+    ap.add_argument("--video-senders", type=int, default=0)
+    ap.add_argument("--duration", type=float, default=10)
+    ap.add_argument("--procs", type=int, default=2, help="loadgen processes")
+    args = ap.parse_args()
+
+    print(f"{args.rooms} rooms x {args.room_size}, {args.video_senders} video sender(s) per room")
+    print(f"{'writer':<24} {'msgs sent':>10} {'send calls':>11} {'msgs/call':>10} {'CPU':>6} "
+          f"{'audio p50':>10} {'p99 ms':>7}")
+    for label, (max_msgs, window_ms) in SETTINGS.items():
+        r = run(max_msgs, window_ms, args)
+        print(f"{label:<24} {r['sent']:>10,.0f} {r['calls']:>11,.0f} {r['sent'] / max(r['calls'], 1):>10.2f} "
+              f"{r['cores']:>6.2f} {r['p50'] or 0:>10.1f} {r['p99'] or 0:>7.1f}")
@@ -0,0 +1,55 @@
+"""
+bench_crypto.py – per-message AES-CTR cost: a new cipher per message
+(encryption.aes_encrypt) vs a connection's CryptoSession.
+
+Rows, per message:
+  • aes_encrypt      – AES.new + key schedule every time (wire 1/2 before sessions)
+  • session          – CryptoSession.encrypt, fresh bytes out
+  • session, output= – encrypting into a reused buffer
+  • batch of N       – CryptoSession.encrypt_many, one cipher call for N messages
+  • pack v2 / v3     – the whole protocol.pack, header included
+
+Run from the repository root:
+    python -m benchmarks.bench_crypto --n 20000
+"""
+
+import argparse, secrets, time, timeit
+import protocol
+from encryption import aes_encrypt, CryptoSession
+
+KEY, NONCE = secrets.token_bytes(16), secrets.token_bytes(8)
+SIZES = {"audio 640B": 640, "video 45KB": 45_000}
+BATCH = (8, 32)
+
+def _us(fn, n: int, per: int = 1) -> float:
+    return timeit.timeit(fn, number=n) / n / per * 1e6
+
+def rows(size: int, n: int):
+    session = CryptoSession(KEY, NONCE, protocol.TO_SERVER)
+    data = secrets.token_bytes(size)
+    out = bytearray(size)
+    msg = {"type": "audio", "ts": time.time(), "data": data}
+    yield "aes_encrypt", _us(lambda: aes_encrypt(data, KEY, NONCE), n)
+    yield "session", _us(lambda: session.encrypt(data, 1), n)
+    yield "session, output=", _us(lambda: session.encrypt(data, 1, out), n)
+    for b in BATCH:
+        batch = [(seq, data) for seq in range(b)]
+        outs = [bytearray(size) for _ in range(b)]
+        yield f"batch of {b}", _us(lambda: session.encrypt_many(batch, outs), max(1, n // b), b)
+    yield "pack v2", _us(lambda: protocol.pack(msg, KEY, NONCE, protocol.WIRE_V2, 7, 1), n)
+    yield "pack v3", _us(lambda: protocol.pack(msg, KEY, NONCE, protocol.WIRE_V3, 7, 1, session=session), n)
+
+def main(n: int):
+    print(f"{'message':<12} {'path':<18} {'µs/msg':>8} {'vs aes_encrypt':>15}")
+    for name, size in SIZES.items():
+        count = n if size < 10_000 else max(1, n // 20)
+        base = None
+        for path, us in rows(size, count):
+            base = base or us
+            print(f"{name:<12} {path:<18} {us:>8.2f} {base / us:>14.2f}x")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--n", type=int, default=20000, help="messages per row")
+    args = ap.parse_args()
+    main(args.n)
@@ -0,0 +1,178 @@
+"""
+bench_engines.py – threaded vs asyncio server engine.
+
+Starts each engine in its own process on a local port, connects N headless
+clients (rooms of ROOM_SIZE), and reports:
+  • server RSS per connection → connections per GB
+  • relayed messages per second with every client sending audio-sized packets
+
+Run from the repository root (Linux, reads /proc for RSS):
+    python -m benchmarks.bench_engines --conns 1000 --msgs 50
+"""
+
+import argparse, asyncio, base64, json, os, secrets, socket, struct, subprocess, sys, time
+
+from encryption import generate_rsa_keypair, rsa_decrypt, aes_encrypt
+from aio_server import _recv_v1 as _recv_encrypted
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROOM_SIZE = 4
+PCM_BYTES = 640       # one 20 ms chunk of 16 kHz int16 mono
+
+ENGINES = {
+    "threaded": "from server import Server as S",
+    "asyncio":  "from aio_server import AsyncServer as S",
+}
+
+# ───────────────────── helpers ───────────────────────
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _rss(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+def _pack(payload: dict) -> bytes:
+    data = json.dumps(payload).encode()
+    return struct.pack("!I", len(data)) + data
+
+async def _read_frame(reader) -> bytes:
+    (ln,) = struct.unpack("!I", await reader.readexactly(4))
+    return await reader.readexactly(ln)
+
+async def _read_json(reader) -> dict:
+    return json.loads(await _read_frame(reader))
+
+
+class BenchClient:
+    """Just enough of the client protocol to join a room and push packets."""
+
+    def __init__(self, port: int, keypair):
+        self.port, (self.pub, self.priv) = port, keypair
+        self.received = 0
+
+    async def connect(self, room_code: str | None) -> str:
+        self.reader, self.writer = await asyncio.open_connection("127.0.0.1", self.port)
+        self.writer.write(_pack({"type": "exchange_sym", "public_key": self.pub}))
+        resp = await _read_json(self.reader)
+        self.key = rsa_decrypt(base64.b64decode(resp["sym_key"]), self.priv)
+        self.nonce = bytes.fromhex(resp["nonce"])
+
+        self.send({"type": "register", "name": "bench"})
+        self.user_id = (await _recv_encrypted(self.reader, self.key, self.nonce))["user_id"]
+        if room_code is None:
+            self.send({"type": "create_room", "user_id": self.user_id})
+            room_code = (await _recv_encrypted(self.reader, self.key, self.nonce))["room_code"]
+        self.send({"type": "join", "room_code": room_code})
+        while (await _recv_encrypted(self.reader, self.key, self.nonce))["type"] != "room_joined":
+            pass
+        return room_code
+
+    def send(self, msg: dict):
+        enc = aes_encrypt(json.dumps(msg).encode(), self.key, self.nonce)
+        self.writer.write(_pack({"type": "aes_blob", "data": base64.b64encode(enc).decode("ascii")}))
+
+    async def drain_forever(self):
+        # Count relayed audio from the others; layout and status messages arrive on the same stream.
+        try:
+            while True:
+                msg = await _recv_encrypted(self.reader, self.key, self.nonce)
+                if msg.get("type") == "audio" and msg.get("from") != self.user_id:
+                    self.received += 1
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+
+# ───────────────────── benchmark ─────────────────────
+async def _run(port: int, pid: int, conns: int, msgs: int) -> dict:
+    keypair = generate_rsa_keypair()
+    base_rss = _rss(pid)
+
+    clients, sem = [], asyncio.Semaphore(64)
+    async def join_room(n: int):
+        async with sem:
+            first = BenchClient(port, keypair)
+            code = await first.connect(None)
+        members = [first]
+        for _ in range(n - 1):
+            async with sem:
+                c = BenchClient(port, keypair)
+                await c.connect(code)
+            members.append(c)
+        return members
+
+    t0 = time.perf_counter()
+    sizes = [ROOM_SIZE] * (conns // ROOM_SIZE) + ([conns % ROOM_SIZE] if conns % ROOM_SIZE else [])
+    for members in await asyncio.gather(*(join_room(n) for n in sizes)):
+        clients.extend(members)
+    setup = time.perf_counter() - t0
+    await asyncio.sleep(0.5)
+    per_conn = max(_rss(pid) - base_rss, 1) / len(clients)
+
+    # Status broadcasts from the joins may still be in flight; count from here.
+    drains = [asyncio.create_task(c.drain_forever()) for c in clients]
+    await asyncio.sleep(0.5)
+    for c in clients:
+        c.received = 0
+    expected = sum((n - 1) * n * msgs for n in sizes)
+
+    pcm = base64.b64encode(secrets.token_bytes(PCM_BYTES)).decode()
+    t0 = time.perf_counter()
+    for i in range(msgs):
+        for c in clients:
+            c.send({"type": "audio", "from": c.user_id, "name": "bench", "ts": time.time(), "data": pcm})
+        await asyncio.gather(*(c.writer.drain() for c in clients))
+    while sum(c.received for c in clients) < expected and time.perf_counter() - t0 < 60:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - t0
+    delivered = sum(c.received for c in clients)
+    assert delivered <= expected, f"counted {delivered} audio deliveries, only {expected} were sent"
+
+    for c in clients:
+        c.writer.close()
+    for d in drains:
+        d.cancel()
+    return {
+        "conns": len(clients),
+        "setup_per_s": len(clients) / setup,
+        "rss_per_conn_kb": per_conn / 1024,
+        "conns_per_gb": (1 << 30) / per_conn,
+        "relayed_per_s": delivered / elapsed,
+        "delivered": f"{delivered}/{expected}",
+    }
+
+def bench(engine: str, conns: int, msgs: int) -> dict:
+    port = _free_port()
+    code = f"{ENGINES[engine]}; S().serve_forever(host='127.0.0.1', port={port})"
+    proc = subprocess.Popen([sys.executable, "-c", code], cwd=ROOT,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", port)).close()
+                break
+            except OSError:
+                time.sleep(0.05)
+        return asyncio.run(_run(port, proc.pid, conns, msgs))
+    finally:
+        proc.kill()
+        proc.wait()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--engine", choices=[*ENGINES, "both"], default="both")
+    ap.add_argument("--conns", type=int, default=400)
+    ap.add_argument("--msgs", type=int, default=50, help="audio packets sent per client")
+    args = ap.parse_args()
+
+    for name in (ENGINES if args.engine == "both" else [args.engine]):
+        r = bench(name, args.conns, args.msgs)
+        print(f"{name:>9}: {r['conns']} conns, {r['setup_per_s']:.0f} joins/s, "
+              f"{r['rss_per_conn_kb']:.1f} KiB/conn ({r['conns_per_gb']:.0f} conns/GB), "
+              f"{r['relayed_per_s']:.0f} msgs/s relayed ({r['delivered']})")
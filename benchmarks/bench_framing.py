@@ -0,0 +1,107 @@
+"""
+bench_framing.py – receive-side framing: the old `buf += part` loop vs
+framing.FrameReader (recv_into a reused buffer, several frames per read).
+
+A writer thread streams pre-built v2 frames over loopback TCP as fast as
+it can. The reader pulls them apart without decrypting, so the numbers
+isolate framing. For audio-, chat- and video-sized messages it reports
+frames/s, MB/s and recv syscalls per frame.
+
+Run from the repository root:
+    python -m benchmarks.bench_framing --seconds 2
+"""
+
+import argparse, secrets, socket, threading, time
+import protocol
+from framing import FrameReader
+
+SIZES = {"audio 640B": 640, "chat 120B": 120, "video 45KB": 45_000}
+BURST = 1 << 20     # bytes handed to sendall at a time
+
+
+class _Counting:
+    # Wraps a socket to count recv calls for the old reader.
+    def __init__(self, sock):
+        self.sock, self.reads = sock, 0
+
+    def recv(self, n):
+        self.reads += 1
+        return self.sock.recv(n)
+
+def _recv_exact(sock, n: int) -> bytes:
+    # What protocol.py and server.py did before framing.py.
+    buf = b""
+    while len(buf) < n:
+        part = sock.recv(n - len(buf))
+        if not part:
+            raise ConnectionError
+        buf += part
+    return buf
+
+def _old(sock):
+    counting = _Counting(sock)
+    def read():
+        header = protocol.HEADER.unpack(_recv_exact(counting, protocol.HEADER.size))
+        return _recv_exact(counting, header[-1])
+    return read, lambda: counting.reads
+
+def _new(sock):
+    reader = FrameReader(sock)
+    def read():
+        _header, _raw, payload = protocol.recv_v2(reader)
+        return payload
+    return read, lambda: reader.reads
+
+READERS = {"buf += part": _old, "FrameReader": _new}
+
+def _frame(size: int) -> bytes:
+    return protocol.HEADER.pack(protocol.WIRE_V2, protocol.KIND_AUDIO, 0, 7, 1, time.time(), size) + secrets.token_bytes(size)
+
+def run(size: int, make_reader, seconds: float) -> tuple[float, float, float]:
+    """
+    :returns: (frames/s, MB/s of payload, recv calls per frame)
+    """
+    frame = _frame(size)
+    burst = frame * max(1, BURST // len(frame))
+    with socket.create_server(("127.0.0.1", 0)) as srv:
+        tx = socket.create_connection(srv.getsockname())
+        rx, _addr = srv.accept()
+    stop = threading.Event()
+
+    def write():
+        try:
+            while not stop.is_set():
+                tx.sendall(burst)
+        except OSError:
+            pass
+        finally:
+            tx.close()
+
+    writer = threading.Thread(target=write, daemon=True)
+    writer.start()
+    read, reads = make_reader(rx)
+    frames, t0 = 0, time.perf_counter()
+    while (elapsed := time.perf_counter() - t0) < seconds:
+        for _ in range(64):
+            read()
+        frames += 64
+    stop.set()
+    calls = reads()
+    rx.close()
+    writer.join()
+    return frames / elapsed, frames * size / elapsed / 1e6, calls / frames
+
+def main(seconds: float):
+    print(f"{'message':<12} {'reader':<12} {'frames/s':>10} {'MB/s':>8} {'recv/frame':>11} {'speedup':>8}")
+    for name, size in SIZES.items():
+        base = None
+        for label, make_reader in READERS.items():
+            rate, mbs, calls = run(size, make_reader, seconds)
+            base = base or rate
+            print(f"{name:<12} {label:<12} {rate:>10,.0f} {mbs:>8.1f} {calls:>11.3f} {rate / base:>7.2f}x")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--seconds", type=float, default=2, help="per row")
+    args = ap.parse_args()
+    main(args.seconds)
@@ -0,0 +1,131 @@
+"""
+bench_handshake.py – cost of joining: RSA vs X25519 key exchange.
+
+Per end, CPU time of each step of exchange_sym:
+  • client: key generation (fresh RSA-1024, RSA from the background pool, X25519)
+  • server: producing the session key (RSA construct + OAEP encrypt, X25519 keygen + ECDH)
+  • client: recovering it (RSA OAEP decrypt, X25519 ECDH)
+and end to end, the wall time a client waits from connect to register_response
+against a server engine started on a local port.
+
+Run from the repository root:
+    python -m benchmarks.bench_handshake --n 100
+"""
+
+import argparse, base64, json, os, secrets, socket, subprocess, sys, time, timeit
+
+import protocol
+from framing import FrameReader
+from encryption import (generate_rsa_keypair, rsa_encrypt, rsa_decrypt,
+                        generate_x25519_keypair, x25519_shared_key, CryptoSession)
+from server import key_exchange
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ("rsa", "rsa-pool", "x25519")
+ENGINES = {
+    "threaded": "from server import Server as S",
+    "asyncio":  "from aio_server import AsyncServer as S",
+}
+
+# ───────────────────── per end ───────────────────────
+def _ms(fn, n: int) -> float:
+    return timeit.timeit(fn, number=n) / n * 1000
+
+def bench_steps(n: int):
+    rsa_pub, rsa_priv = generate_rsa_keypair()
+    x_pub, x_priv = generate_x25519_keypair()
+    sym_key = secrets.token_bytes(16)
+    enc_key = rsa_encrypt(sym_key, rsa_pub)
+    server_fields = key_exchange({"x25519": x_pub.hex()})[1]
+    server_pub = bytes.fromhex(server_fields["x25519"])
+
+    rows = [
+        ("client keygen", "rsa",      _ms(generate_rsa_keypair, max(1, n // 10))),
+        ("client keygen", "rsa-pool", 0.0),   # taken from the pool: generated before the click
+        ("client keygen", "x25519",   _ms(generate_x25519_keypair, n)),
+        ("server key",    "rsa",      _ms(lambda: key_exchange({"public_key": rsa_pub}), n)),
+        ("server key",    "x25519",   _ms(lambda: key_exchange({"x25519": x_pub.hex()}), n)),
+        ("client finish", "rsa",      _ms(lambda: rsa_decrypt(enc_key, rsa_priv), n)),
+        ("client finish", "x25519",   _ms(lambda: x25519_shared_key(x_priv, server_pub, x_pub + server_pub), n)),
+    ]
+    print(f"{'step':<14} {'kex':<9} {'ms':>8}")
+    for step, mode, ms in rows:
+        print(f"{step:<14} {mode:<9} {ms:>8.3f}")
+
+# ───────────────────── end to end ────────────────────
+def _send(sock: socket.socket, payload: dict):
+    data = json.dumps(payload).encode()
+    sock.sendall(len(data).to_bytes(4, "big") + data)
+
+def _recv(reader: FrameReader) -> dict:
+    return json.loads(str(reader.read_prefixed(), "utf-8"))
+
+def handshake(port: int, mode: str, keypair=None) -> float:
+    """
+    One exchange_sym + register as the client sees it, in seconds.
+    :param keypair: Pre-generated RSA keypair for "rsa-pool".
+    """
+    t0 = time.perf_counter()
+    with socket.create_connection(("127.0.0.1", port)) as sock:
+        reader = FrameReader(sock)
+        if mode == "x25519":
+            public, private = generate_x25519_keypair()
+            _send(sock, {"type": "exchange_sym", "x25519": public.hex(), "wire": list(protocol.SUPPORTED)})
+            resp = _recv(reader)
+            server_public = bytes.fromhex(resp["x25519"])
+            key = x25519_shared_key(private, server_public, public + server_public)
+        else:
+            public, private = keypair or generate_rsa_keypair()
+            _send(sock, {"type": "exchange_sym", "public_key": public, "wire": list(protocol.SUPPORTED)})
+            resp = _recv(reader)
+            key = rsa_decrypt(base64.b64decode(resp["sym_key"]), private)
+        nonce, wire = bytes.fromhex(resp["nonce"]), resp["wire"]
+        crypto = CryptoSession(key, nonce, protocol.TO_SERVER)
+        protocol.send(sock, {"type": "register", "name": "bench"}, key, nonce, wire, session=crypto)
+        assert protocol.recv(reader, key, nonce, wire, session=crypto)["type"] == "register_response"
+    return time.perf_counter() - t0
+
+def bench_e2e(engine: str, n: int) -> dict:
+    port = _free_port()
+    code = f"{ENGINES[engine]}; S().serve_forever(host='127.0.0.1', port={port})"
+    proc = subprocess.Popen([sys.executable, "-c", code], cwd=ROOT,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", port)).close()
+                break
+            except OSError:
+                time.sleep(0.05)
+        pool = [generate_rsa_keypair() for _ in range(n)]
+        results = {}
+        for mode in MODES:
+            samples = sorted(handshake(port, mode, pool.pop() if mode == "rsa-pool" else None)
+                             for _ in range(n))
+            results[mode] = samples
+        return results
+    finally:
+        proc.kill()
+        proc.wait()
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _pct(samples: list[float], q: float) -> float:
+    return samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--engine", choices=[*ENGINES, "both"], default="threaded")
+    ap.add_argument("--n", type=int, default=50, help="handshakes per mode")
+    args = ap.parse_args()
+
+    bench_steps(args.n)
+    for engine in (ENGINES if args.engine == "both" else [args.engine]):
+        print(f"\nend to end, {engine} server: connect → register_response, ms")
+        print(f"{'kex':<9} {'p50':>8} {'p90':>8} {'p99':>8}")
+        for mode, samples in bench_e2e(engine, args.n).items():
+            print(f"{mode:<9} {_pct(samples, .5):>8.2f} {_pct(samples, .9):>8.2f} {_pct(samples, .99):>8.2f}")
@@ -0,0 +1,27 @@
+"""
+bench_mixer.py – CPU cost of one MCU mixing tick per room.
+
+Every member of the room is speaking, which is the worst case: each tick
+mixes N frames and produces N "everyone but me" mixes.
+
+Run from the repository root:
+    python -m benchmarks.bench_mixer
+"""
+
+import secrets, timeit
+from mixer import RoomMixer, FRAME_BYTES, TICK
+
+def main(ticks: int = 500):
+    print(f"{'members':>7} {'µs/tick':>8} {'% of 20 ms':>10} {'rooms/core':>10}")
+    for n in (2, 4, 8, 16, 32, 50):
+        members = [secrets.token_hex(16) for _ in range(n)]
+        mixer = RoomMixer(room=None, max_pending=ticks + 1)
+        pcm = [secrets.token_bytes(FRAME_BYTES) for _ in members]
+        for _ in range(ticks):
+            for uid, frame in zip(members, pcm):
+                mixer.push(uid, frame)
+        seconds = timeit.timeit(lambda: mixer.mix(members), number=ticks) / ticks
+        print(f"{n:>7} {seconds * 1e6:>8.1f} {seconds / TICK:>10.2%} {TICK / seconds:>10.0f}")
+
+if __name__ == "__main__":
+    main()
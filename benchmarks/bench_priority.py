@@ -0,0 +1,169 @@
+"""
+bench_priority.py – audio latency behind video on a congested downlink,
+with the server's send queue in arrival order vs priority order (+ v4
+fragments, + TCP_NOTSENT_LOWAT).
+
+One sender pushes 45 KB frames at 15 fps and a 20 ms audio packet every
+20 ms through the threaded server. One receiver reads at --mbps (4 Mbps
+by default, well under the video's 5.4 Mbps) with a small receive buffer,
+so its downlink backs up the way a slow home connection would. The
+receiver reports audio latency from the sender's timestamp, plus how much
+video still got through.
+
+Run from the repository root:
+    python -m benchmarks.bench_priority --seconds 10
+"""
+
+import argparse, itertools, json, os, socket, subprocess, sys, threading, time
+import protocol
+from framing import FrameReader, send_all
+from encryption import generate_x25519_keypair, x25519_shared_key, CryptoSession
+from server import _send
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER = """
+import server
+server.SETTINGS['METRICS_PORT'] = 0
+server.SEND_PRIORITY, server.FRAGMENT_BYTES, server.SEND_LOWAT = {priority}, {fragment}, {lowat}
+server.Server().serve_forever(host='127.0.0.1', port={port})
+"""
+# label -> (SEND_PRIORITY, SEND_FRAGMENT_BYTES, SEND_LOWAT)
+SETUPS = {
+    "arrival order": (False, 0, 0),
+    "priority": (True, 0, 0),
+    "priority + lowat": (True, 0, 16384),
+    "priority + frag + lowat": (True, 8192, 16384),
+}
+FRAME_BYTES, FPS = 45_000, 15
+PCM_BYTES, AUDIO_EVERY = 640, 0.02
+
+
+class Throttled:
+    # A socket whose reads are paced to `bps`, like a slow downlink.
+    def __init__(self, sock: socket.socket, bps: float):
+        self.sock, self.bps = sock, bps
+        self.start, self.total = time.perf_counter(), 0
+
+    def recv_into(self, view) -> int:
+        n = self.sock.recv_into(view[:4096])
+        self.total += n
+        ahead = self.total * 8 / self.bps - (time.perf_counter() - self.start)
+        if ahead > 0:
+            time.sleep(ahead)
+        return n
+
+
+class Member:
+    def __init__(self, port: int, rcvbuf: int = 0):
+        sock = socket.socket()
+        if rcvbuf:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        sock.connect(("127.0.0.1", port))
+        self.sock, self.reader = sock, FrameReader(sock)
+        public, private = generate_x25519_keypair()
+        _send(sock, {"type": "exchange_sym", "x25519": public.hex(), "wire": list(protocol.SUPPORTED)})
+        resp = json.loads(str(self.reader.read_prefixed(), "utf-8"))
+        server_public = bytes.fromhex(resp["x25519"])
+        self.key = x25519_shared_key(private, server_public, public + server_public)
+        self.nonce, self.wire = bytes.fromhex(resp["nonce"]), resp["wire"]
+        self.crypto = CryptoSession(self.key, self.nonce, protocol.TO_SERVER)
+        self.seq, self.media_key, self.lock = itertools.count(), None, threading.Lock()
+        self.stream_id = 0
+        self.send({"type": "register", "name": "bench"})
+        reg = self.recv()
+        self.user_id, self.stream_id = reg["user_id"], reg.get("stream_id", 0)
+
+    def send(self, msg: dict):
+        key = self.media_key if msg["type"] in protocol.MEDIA_KINDS else None
+        with self.lock:
+            data = protocol.pack(msg, self.key, self.nonce, self.wire, self.stream_id, next(self.seq), key, self.crypto)
+            send_all(self.sock, [data])
+
+    def recv(self) -> dict:
+        return protocol.recv(self.reader, self.key, self.nonce, self.wire, self.media_key, self.crypto)
+
+    def join(self, code: str):
+        self.send({"type": "join", "room_code": code, "room_key": True})
+        while (msg := self.recv())["type"] != "room_joined":
+            pass
+        self.media_key = bytes.fromhex(msg["media_key"])
+
+
+
+def _drain(member: Member):
+    # The sender's own echo traffic (joins, status) is read and ignored.
+    try:
+        while True:
+            member.recv()
+    except (OSError, ConnectionError):
+        pass
+
+def _pace(member: Member, every: float, make, until: float):
+    deadline = time.perf_counter()
+    while deadline < until:
+        time.sleep(max(0.0, deadline - time.perf_counter()))
+        member.send(make())
+        deadline += every
+
+def run(setup: tuple, args) -> dict:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    priority, fragment, lowat = setup
+    proc = subprocess.Popen([sys.executable, "-c", SERVER.format(port=port, priority=priority, fragment=fragment,
+                                                                 lowat=lowat)],
+                            cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", port)).close()
+                break
+            except OSError:
+                time.sleep(0.05)
+        sender = Member(port)
+        sender.send({"type": "create_room", "user_id": sender.user_id})
+        code = sender.recv()["room_code"]
+        sender.join(code)
+        receiver = Member(port, rcvbuf=args.rcvbuf)
+        receiver.join(code)
+        receiver.reader.sock = Throttled(receiver.sock, args.mbps * 1e6)
+        threading.Thread(target=_drain, args=(sender,), daemon=True).start()
+
+        until = time.perf_counter() + args.seconds
+        frame, pcm = os.urandom(FRAME_BYTES), os.urandom(PCM_BYTES)
+        for every, make in ((1 / FPS, lambda: {"type": "frame", "from": sender.user_id, "ts": time.time(), "data": frame}),
+                            (AUDIO_EVERY, lambda: {"type": "audio", "from": sender.user_id, "ts": time.time(), "level": 50, "data": pcm})):
+            threading.Thread(target=_pace, args=(sender, every, make, until), daemon=True).start()
+
+        audio, frames = [], 0
+        receiver.sock.settimeout(1.0)
+        try:
+            while time.perf_counter() < until + 1:
+                msg = receiver.recv()
+                if msg["type"] == "audio":
+                    audio.append(time.time() - msg["ts"])
+                elif msg["type"] == "frame":
+                    frames += 1
+        except (socket.timeout, ConnectionError):
+            pass
+    finally:
+        proc.kill()
+        proc.wait()
+    audio.sort()
+    pct = lambda p: audio[min(len(audio) - 1, int(p * len(audio)))] * 1000 if audio else 0.0
+    return {"audio": len(audio), "p50": pct(0.5), "p95": pct(0.95), "max": pct(1.0), "fps": frames / args.seconds}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--seconds", type=float, default=10)
+    ap.add_argument("--mbps", type=float, default=4.0, help="receiver's downlink")
+    ap.add_argument("--rcvbuf", type=int, default=65536, help="receiver's SO_RCVBUF")
+    args = ap.parse_args()
+
+    print(f"video {FRAME_BYTES // 1000} KB x {FPS} fps + audio every {AUDIO_EVERY * 1000:.0f} ms "
+          f"into a {args.mbps:g} Mbps downlink")
+    print(f"{'server send queue':<26} {'audio':>6} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'video fps':>10}")
+    for label, setup in SETUPS.items():
+        r = run(setup, args)
+        print(f"{label:<26} {r['audio']:>6} {r['p50']:>8.1f} {r['p95']:>8.1f} {r['max']:>8.1f} {r['fps']:>10.1f}")
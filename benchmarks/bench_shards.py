@@ -0,0 +1,89 @@
+"""
+bench_shards.py – relay throughput of the sharded server vs worker count.
+
+For each worker count starts `shard.serve_sharded` on a local port, then
+runs the same number of load processes (so the load generator scales with
+the server). Each load process fills rooms of ROOM_SIZE with headless
+clients (joins land on arbitrary workers and get handed off to the room's
+owner) and pushes audio-sized packets. Reports aggregate relayed msgs/s.
+
+Run from the repository root on a multi-core Linux box:
+    python -m benchmarks.bench_shards --workers 1 2 4 --rooms 50
+"""
+
+import argparse, asyncio, base64, multiprocessing, os, secrets, socket, subprocess, sys, time
+
+from encryption import generate_rsa_keypair
+from benchmarks.bench_engines import BenchClient, ROOM_SIZE, PCM_BYTES, ROOT, _free_port
+
+
+async def _load(port: int, rooms: int, msgs: int) -> tuple[int, int, float]:
+    keypair = generate_rsa_keypair()
+    clients = []
+    for _ in range(rooms):
+        first = BenchClient(port, keypair)
+        code = await first.connect(None)
+        clients.append(first)
+        for _ in range(ROOM_SIZE - 1):
+            c = BenchClient(port, keypair)
+            await c.connect(code)
+            clients.append(c)
+    drains = [asyncio.create_task(c.drain_forever()) for c in clients]
+    await asyncio.sleep(0.5)
+    for c in clients:
+        c.received = 0
+    expected = rooms * ROOM_SIZE * (ROOM_SIZE - 1) * msgs
+
+    pcm = base64.b64encode(secrets.token_bytes(PCM_BYTES)).decode()
+    t0 = time.perf_counter()
+    for _ in range(msgs):
+        for c in clients:
+            c.send({"type": "audio", "from": c.user_id, "name": "bench", "ts": time.time(), "data": pcm})
+        await asyncio.gather(*(c.writer.drain() for c in clients))
+    while sum(c.received for c in clients) < expected and time.perf_counter() - t0 < 60:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - t0
+    for d in drains:
+        d.cancel()
+    return sum(c.received for c in clients), expected, elapsed
+
+def _load_proc(args) -> tuple[int, int, float]:
+    return asyncio.run(_load(*args))
+
+def bench(workers: int, rooms: int, msgs: int) -> dict:
+    port = _free_port()
+    code = f"from shard import serve_sharded; serve_sharded({workers}, host='127.0.0.1', port={port})"
+    proc = subprocess.Popen([sys.executable, "-c", code], cwd=ROOT,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", port)).close()
+                break
+            except OSError:
+                time.sleep(0.05)
+        per_proc = max(1, rooms // workers)
+        with multiprocessing.Pool(workers) as pool:
+            results = pool.map(_load_proc, [(port, per_proc, msgs)] * workers)
+        delivered = sum(r[0] for r in results)
+        expected = sum(r[1] for r in results)
+        return {"relayed_per_s": delivered / max(r[2] for r in results),
+                "delivered": f"{delivered}/{expected}"}
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count()])
+    ap.add_argument("--rooms", type=int, default=40)
+    ap.add_argument("--msgs", type=int, default=50, help="audio packets sent per client")
+    args = ap.parse_args()
+
+    base = None
+    for n in args.workers:
+        r = bench(n, args.rooms, args.msgs)
+        base = base or r["relayed_per_s"]
+        print(f"{n:>2} workers: {r['relayed_per_s']:.0f} msgs/s relayed "
+              f"({r['relayed_per_s'] / base:.2f}x, {r['delivered']})")
@@ -0,0 +1,49 @@
+"""
+bench_wire.py – wire version 1 (JSON/base64 envelope) vs 2 (binary) vs 3
+(binary, per-message nonces).
+
+For audio-, chat- and video-sized messages reports bytes on the wire and
+CPU time for one encode + decode, i.e. one hop.
+
+Run from the repository root:
+    python -m benchmarks.bench_wire
+"""
+
+import secrets, time, timeit
+import protocol
+from encryption import CryptoSession
+
+KEY, NONCE = secrets.token_bytes(16), secrets.token_bytes(8)
+# Both ends of one connection, as the client and the server hold them.
+SENDER = CryptoSession(KEY, NONCE, protocol.TO_SERVER)
+RECEIVER = CryptoSession(KEY, NONCE, protocol.TO_CLIENT)
+
+SAMPLES = {
+    "audio 640B":  {"type": "audio", "from": secrets.token_hex(16), "name": "bench",
+                    "ts": time.time(), "data": secrets.token_bytes(640)},
+    "chat":        {"type": "chat", "from": secrets.token_hex(16), "name": "bench",
+                    "text": "hello there, can everyone hear me?"},
+    "video 45KB":  {"type": "frame", "from": secrets.token_hex(16), "name": "bench",
+                    "ts": time.time(), "data": secrets.token_bytes(45_000)},
+}
+
+def _roundtrip(msg: dict, wire: int):
+    blob = protocol.pack(msg, KEY, NONCE, wire, stream_id=7, seq=1, session=SENDER)
+    if wire == protocol.WIRE_V1:
+        protocol.unpack_v1(blob[4:], KEY, NONCE, RECEIVER)
+    else:
+        header = protocol.HEADER.unpack_from(blob)
+        protocol.unpack_v2(header, blob[protocol.HEADER.size:], KEY, NONCE, session=RECEIVER)
+
+def main(number: int = 2000):
+    print(f"{'message':<12} {'wire':>4} {'bytes':>8} {'overhead':>9} {'µs/hop':>8}")
+    for name, msg in SAMPLES.items():
+        raw = len(msg.get("data", b"")) or len(msg["text"])
+        for wire in protocol.SUPPORTED:
+            size = len(protocol.pack(msg, KEY, NONCE, wire, stream_id=7, session=SENDER))
+            n = number if raw < 10_000 else number // 10
+            us = timeit.timeit(lambda: _roundtrip(msg, wire), number=n) / n * 1e6
+            print(f"{name:<12} {wire:>4} {size:>8} {size / raw - 1:>8.0%} {us:>8.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+capture.py – the client's outgoing video path, off the GUI thread.
+
+    camera ─▶ grabber ─▶ latest frame per layer ─▶ encoder pool ─▶ outbox ─▶ writer
+                 └─▶ local preview (Qt signal)
+
+The grabber thread owns the camera. It reads every frame the camera
+delivers, so the driver never hands us a stale buffered one, and passes on
+one per 1/fps. Stages hand over through one-slot, latest-wins buffers: a
+frame still waiting when a newer one arrives is replaced, not queued
+behind it. A slow encoder therefore costs frame rate, not latency, and the
+GUI thread only ever gets the preview.
+
+Encoded frames go to the OutboundQueue, whose writer thread owns the socket
+(client.py). An encoder that finishes after a newer frame of the same
+layer has gone out drops its result rather than send it out of order.
+
+Camera, scaling and JPEG are the caller's (cv2 in client.py); this module
+only moves frames between threads and times them. `stats()` reports each
+stage's mean and p95 in ms:
+    grab     camera read
+    prepare  resize, preview and the congestion check
+    wait     waiting for a free encoder
+    encode   scaling and JPEG
+    send     outbox and socket, until the writer has written it
+    total    end of the camera read → written
+"""
+
+import threading, collections, time
+
+STAGES = ("grab", "prepare", "wait", "encode", "send", "total")
+WINDOW = 256        # recent samples kept per stage
+
+
+def summarize(samples) -> dict | None:
+    """
+    Mean and p95, in ms, of a window of durations in seconds; None if it is empty.
+    """
+    ms = sorted(s * 1000 for s in list(samples))
+    return {"mean": sum(ms) / len(ms), "p95": ms[int(0.95 * (len(ms) - 1))]} if ms else None
+
+
+class LatestSlots:
+    """
+    A handoff with one slot per key: `put` replaces whatever is still
+    waiting under its key; `get` takes the lowest waiting key.
+    """
+    def __init__(self, exclusive: bool = False):
+        """
+        :param exclusive: Hand out at most one item per key at a time: a key taken
+                          with `get` is skipped until `done(key)`.
+        """
+        self.exclusive = exclusive
+        self._items: dict = {}
+        self._busy = set()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.replaced = 0
+
+    def put(self, key, item):
+        with self._cond:
+            if key in self._items:
+                self.replaced += 1
+            self._items[key] = item
+            self._cond.notify()
+
+    def get(self) -> tuple | None:
+        """
+        Block until an item is waiting.
+        :returns: (key, item), or None once closed.
+        """
+        with self._cond:
+            while not self._closed and not (ready := self._items.keys() - self._busy):
+                self._cond.wait()
+            if self._closed:
+                return None
+            key = min(ready)
+            if self.exclusive:
+                self._busy.add(key)
+            return key, self._items.pop(key)
+
+    def done(self, key):
+        """
+        Finished with the item last taken for `key` (exclusive slots).
+        """
+        with self._cond:
+            self._busy.discard(key)
+            if key in self._items:
+                self._cond.notify()
+
+    def discard(self, key):
+        with self._cond:
+            self._items.pop(key, None)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._items.clear()
+            self._cond.notify_all()
+
+
+class CapturePipeline:
+    def __init__(self, prepare, encode, send, layers: int = 1, workers: int = 2, fps: float = 15.0):
+        """
+        :param prepare: prepare(frame) -> the frame to encode, or None to skip this one (link backed
+                        up). Runs on the grabber thread; posts the preview.
+        :param encode: encode(frame, layer) -> bytes, or None on failure. Runs on an encoder thread.
+        :param send: send(layer, data, ts) hands an encoded frame to the writer.
+        :param layers: Simulcast layers encoded per frame.
+        :param workers: Encoder threads. JPEG encoding releases the GIL, so these run in parallel.
+        :param fps: Frames passed on per second; the congestion ladder changes it at run time.
+        """
+        self.prepare, self.encode, self.send = prepare, encode, send
+        self.layers = layers
+        self.fps = fps
+        self.enabled = True                 # camera button; the camera stays open while off
+        self.grabbed = self.encoded = self.skipped = self.stale = 0
+        self._slots = LatestSlots()         # layer -> (frame, ts, handed over at)
+        self._samples = {stage: collections.deque(maxlen=WINDOW) for stage in STAGES}
+        self._encoded_at: dict[tuple[float, int], float] = {}   # (ts, layer) -> encode done, until written
+        self._newest = [0.0] * layers       # ts of the newest frame sent, per layer
+        self._lock = threading.Lock()
+        self._source = None
+        self._next_source, self._swapped = None, threading.Event()
+        self._swapped.set()
+        self._wake = threading.Event()
+        self._running = True
+        self._threads = [threading.Thread(target=self._grab_loop, name="capture", daemon=True)]
+        self._threads += [threading.Thread(target=self._encode_loop, name=f"encode-{i}", daemon=True)
+                          for i in range(max(1, workers))]
+        for t in self._threads:
+            t.start()
+
+    # ── control, from the GUI thread ──────────────────
+    def set_source(self, source, timeout: float = 1.0):
+        """
+        Switch cameras. The grabber releases the current one before this returns,
+        so the same device can be reopened straight after `set_source(None)`.
+        :param source: Anything with read() -> (ok, frame) and release(), or None.
+        """
+        self._next_source = source
+        self._swapped.clear()
+        self._wake.set()
+        self._swapped.wait(timeout)
+
+    def set_enabled(self, enabled: bool):
+        self.enabled = enabled
+        self._wake.set()
+
+    def close(self):
+        self._running = False
+        self._slots.close()
+        self.set_source(None)
+
+    # ── threads ───────────────────────────────────────
+    def _take_source(self):
+        if self._swapped.is_set():
+            return
+        old, self._source = self._source, self._next_source
+        if old is not None and old is not self._source:
+            old.release()
+        self._swapped.set()
+
+    def _grab_loop(self):
+        due = 0.0
+        while self._running:
+            self._take_source()
+            source = self._source
+            if source is None or not self.enabled:
+                self._wake.wait(0.5)
+                self._wake.clear()
+                continue
+            t0 = time.perf_counter()
+            ok, frame = source.read()
+            if not ok:
+                time.sleep(0.05)    # unplugged or not started yet; don't spin
+                continue
+            t1 = time.perf_counter()
+            if t1 < due - 0.2 / self.fps:
+                continue            # read only to keep the driver's buffer fresh
+            due = max(due + 1 / self.fps, t1 - 0.5 / self.fps)
+            ts = time.time()
+            self.grabbed += 1
+            frame = self.prepare(frame)
+            t2 = time.perf_counter()
+            self._observe("grab", t1 - t0)
+            self._observe("prepare", t2 - t1)
+            if frame is None:
+                self.skipped += 1
+                continue
+            for layer in range(self.layers):
+                self._slots.put(layer, (frame, ts, t2))
+        self._take_source()
+
+    def _encode_loop(self):
+        while (job := self._slots.get()) is not None:
+            layer, (frame, ts, handed_at) = job
+            t0 = time.perf_counter()
+            data = self.encode(frame, layer)
+            t1 = time.perf_counter()
+            if data is None:
+                continue
+            with self._lock:
+                if ts <= self._newest[layer]:
+                    self.stale += 1     # a newer frame of this layer beat it out
+                    continue
+                self._newest[layer] = ts
+                self.encoded += 1
+                if len(self._encoded_at) > 4 * WINDOW:
+                    self._encoded_at.clear()    # frames the writer dropped without writing
+                self._encoded_at[ts, layer] = t1
+            self._observe("wait", t0 - handed_at)
+            self._observe("encode", t1 - t0)
+            self.send(layer, data, ts)
+
+    def sent(self, ts: float, layer: int = 0):
+        """
+        The writer has put frame `ts` of `layer` on the wire.
+        """
+        with self._lock:
+            encoded_at = self._encoded_at.pop((ts, layer), None)
+        if encoded_at is not None:
+            self._observe("send", time.perf_counter() - encoded_at)
+            self._observe("total", time.time() - ts)
+
+    # ── timing ────────────────────────────────────────
+    def _observe(self, stage: str, seconds: float):
+        self._samples[stage].append(seconds)
+
+    def stats(self) -> dict:
+        out = {"grabbed": self.grabbed, "skipped": self.skipped, "encoded": self.encoded,
+               "replaced": self._slots.replaced, "stale": self.stale}
+        for stage, samples in self._samples.items():
+            out[stage] = summarize(samples)
+        return out
+
+    def report(self) -> str:
+        """
+        One line for the log, e.g. "grab 2.1/4.0 prepare 1.2/2.3 … ms (mean/p95), 150 grabbed …".
+        """
+        s = self.stats()
+        stages = " ".join(f"{stage} {s[stage]['mean']:.1f}/{s[stage]['p95']:.1f}" for stage in STAGES if s[stage])
+        return (f"{stages} ms (mean/p95), {s['grabbed']} grabbed, {s['skipped']} skipped, "
+                f"{s['encoded']} encoded, {s['replaced']} replaced, {s['stale']} stale")
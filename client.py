@@ -1,15 +1,28 @@
 from __future__ import annotations
-import sys, json, struct, socket, threading, base64, secrets, queue, time, collections
+import sys, json, struct, socket, threading, base64, secrets, time, itertools, logging
 from html import escape
-from typing import final
+from typing import final, Iterator
 
 import cv2, numpy as np
 from PyQt5 import QtWidgets, QtCore, QtGui
 import pyaudio
 
 
-from encryption import generate_rsa_keypair, rsa_decrypt, aes_decrypt, aes_encrypt
-from audio import AudioIO
+from encryption import (rsa_decrypt, aes_decrypt, aes_encrypt, KeypairPool, CryptoSession,
+                        generate_x25519_keypair, x25519_shared_key)
+import protocol
+from framing import FrameReader, PREFIX, send_all, limit_unsent
+from speakers import audio_level
+from outbound import OutboundQueue, payload_size
+from congestion import BandwidthEstimator, VideoLadder
+from capture import CapturePipeline
+from decode import DecodePool
+from render import Tile
+from jitter import JitterBuffer
+from udp import UdpLink
+import resume
+from audio import AudioIO, PLAYOUT_DELAY
+from playout import PlayoutMixer
 from gui.welcome import Ui_welcome
 from gui.home import Ui_home
 from gui.room import Ui_MainWindow
@@ -27,47 +40,89 @@ SERVER_HOST, SERVER_PORT = CFG["SERVER_HOST"], CFG["SERVER_PORT"]
 TARGET_FPS   = CFG["TARGET_FPS"]
 WIDTH, HEIGHT = CFG["FRAME_WIDTH"], CFG["FRAME_HEIGHT"]
 JPEG_Q       = CFG["JPEG_QUALITY"]
+# Simulcast: layer i is (WIDTH >> i) x (HEIGHT >> i); 1 sends a single full-size stream.
+SIMULCAST_LAYERS = max(1, min(CFG.get("SIMULCAST_LAYERS", 1), protocol.MAX_LAYERS))
+# Capture runs on its own threads (capture.py): a grabber plus this many JPEG encoders.
+ENCODE_WORKERS = CFG.get("ENCODE_WORKERS", max(2, SIMULCAST_LAYERS))
+# Received frames are decoded on a pool (decode.py), one frame per sender at a time.
+DECODE_WORKERS = CFG.get("DECODE_WORKERS", 2)
+# Received video waits in a jitter buffer (jitter.py), up to JITTER_FRAMES per sender, and is
+# shown on this tick.
+JITTER_FRAMES = CFG.get("JITTER_FRAMES", 8)
+PLAYOUT_TICK_MS = 10
+# Gain factor per wheel notch when scrolling over a tile (playout.py mixes at that gain).
+VOLUME_STEP = 1.25
+# Seconds between capture, decode, jitter buffer and playout statistics in the log; 0 for none.
+# They are logged at debug level, so LOG_LEVEL must be "DEBUG" to see them.
+MEDIA_STATS_EVERY = CFG.get("MEDIA_STATS_EVERY", 0)
+LOG_LEVEL = CFG.get("LOG_LEVEL", "INFO")
+log = logging.getLogger(__name__)
+# Congestion control: video gets what the bandwidth estimate leaves after audio (raw 16 kHz PCM),
+# and a frame is skipped rather than queued behind more than MAX_SEND_DELAY of backlog.
+AUDIO_BPS = 300_000
+MAX_SEND_DELAY = 0.15
+# The writer sends whatever has queued up (e.g. a frame's simulcast layers plus audio) with one
+# sendmsg, up to this many messages / bytes; it never waits for more. 1 sends each on its own.
+SEND_COALESCE_MAX = CFG.get("SEND_COALESCE_MAX", 16)
+SEND_COALESCE_BYTES = 65536
+# The outbox sends control > audio > video > chat. On wire v4 frames bigger than SEND_FRAGMENT_BYTES
+# go in fragments with audio in between, and SEND_LOWAT keeps the kernel from queueing more than that.
+SEND_FRAGMENT_BYTES = CFG.get("SEND_FRAGMENT_BYTES", 8192)
+SEND_LOWAT = CFG.get("SEND_LOWAT", 16384)
+# How often a dropped connection retries resuming, within the server's grace window.
+RESUME_RETRY = 0.5
+# "x25519": ephemeral ECDH in exchange_sym; "rsa" for servers that predate it.
+KEY_EXCHANGE = CFG.get("KEY_EXCHANGE", "x25519")
+# RSA keypairs are generated in the background from the moment the welcome window opens.
+RSA_KEYS = KeypairPool()
+
+
+def _layer_for_tile(w: int, h: int) -> int:
+    # Smallest simulcast layer that still covers a w x h tile.
+    layer = 0
+    while (layer + 1 < protocol.MAX_LAYERS
+           and WIDTH >> (layer + 1) >= w and HEIGHT >> (layer + 1) >= h):
+        layer += 1
+    return layer
 
 
 # ───────────────────── net helpers ───────────────────
 def _send(sock: socket.socket, payload: dict):
     blob = json.dumps(payload).encode()
-    sock.sendall(struct.pack("!I", len(blob)) + blob)
+    send_all(sock, [PREFIX.pack(len(blob)), blob])
 
-def _send_encrypted(sock: socket.socket, payload: dict, sym_key: bytes, nonce: bytes):
-    # Encrypt `payload` using AES with `sym_key` and `nonce`, then send it.
-    blob = json.dumps(payload).encode()
-    enc = aes_encrypt(blob, sym_key, nonce)
-    enc_b64 = base64.b64encode(enc).decode("ascii")
-    msg = {"type": "aes_blob", "data": enc_b64}
-    _send(sock, msg)
-
-def _recv(sock: socket.socket) -> dict:
-    hdr = sock.recv(4)
-    if not hdr:
-        raise ConnectionError
-    ln, = struct.unpack("!I", hdr)
-    buf = b""
-    while len(buf) < ln:
-        part = sock.recv(ln - len(buf))
-        if not part:
-            raise ConnectionError
-        buf += part
-    return json.loads(buf.decode())
-
-def _recv_encrypted(sock: socket.socket, sym_key: bytes, nonce: bytes) -> dict:
+def _recv(reader: FrameReader) -> dict:
+    return json.loads(str(reader.read_prefixed(), "utf-8"))
+
+def _resume_session(ticket: str, old_key: bytes, user_id: str) -> tuple[FrameReader, CryptoSession, int]:
     """
-    Receive an AES-encrypted message, decrypt it using `sym_key` and `nonce`,
-    and return the decoded JSON object.
+    New connection that takes our seat back with a resumption ticket (resume.py).
+    :returns: (reader on the new socket, crypto session, wire version). Raises
+              ConnectionError if the server turned the ticket down, OSError if it
+              couldn't be reached.
     """
-    msg = _recv(sock)
-    if msg.get("type") != "aes_blob":
-        raise ValueError("Expected 'aes_blob' type")
-
-    enc_b64 = msg["data"]
-    enc_bytes = base64.b64decode(enc_b64)
-    plain = aes_decrypt(enc_bytes, sym_key, nonce)
-    return json.loads(plain.decode())
+    sock = socket.create_connection((SERVER_HOST, SERVER_PORT), timeout=5)
+    limit_unsent(sock, SEND_LOWAT)
+    reader = FrameReader(sock)
+    try:
+        client_random = secrets.token_bytes(16)
+        _send(sock, {"type": "resume", "ticket": ticket, "client_random": client_random.hex(),
+                     "wire": list(protocol.SUPPORTED)})
+        response = _recv(reader)
+        if response.get("type") != "resume_response":
+            raise ConnectionError(response.get("reason", "Resume refused"))
+        server_random = bytes.fromhex(response["server_random"])
+        secret = resume.session_secret(old_key, user_id)
+        key = resume.session_key(secret, client_random, server_random)
+        nonce, wire = bytes.fromhex(response["nonce"]), response["wire"]
+        crypto = CryptoSession(key, nonce, protocol.TO_SERVER)
+        protocol.send(sock, {"type": "resume_seat", "proof": resume.proof(secret, client_random, server_random)},
+                      key, nonce, wire, session=crypto)
+    except BaseException:
+        sock.close()
+        raise
+    sock.settimeout(None)
+    return reader, crypto, wire
 
 
  # ── Loading animation ────────────────────────────
@@ -176,6 +231,8 @@ class DeviceSelectDialog(QtWidgets.QDialog):
 class WelcomeWindow(QtWidgets.QMainWindow, Ui_welcome):
     def __init__(self):
         super().__init__(); self.setupUi(self)
+        if KEY_EXCHANGE == "rsa":
+            RSA_KEYS.start()
         self.connectButton.clicked.connect(self._connect)
         self.quitButton.clicked.connect(QtWidgets.QApplication.quit)
 
@@ -203,7 +260,9 @@ class HomeWindow(QtWidgets.QMainWindow, Ui_home):
         # Initialize an empty room symmetric key
         self.room_sym_key = None
         self.nonce = None
+        self.wire = protocol.WIRE_V1
         self.user_id = None
+        self.stream_id = 0
         self.room_code = None
 
         self.connectButton.clicked.connect(self._join)
@@ -221,32 +280,47 @@ class HomeWindow(QtWidgets.QMainWindow, Ui_home):
         # room_code can be None when creating
         self._enter(room_code=None, is_create=True)
 
-    def _enter(self, room_code: str | None, is_create: bool):
+    def _enter(self, room_code: str | None, is_create: bool, addr: tuple[str, int] = (SERVER_HOST, SERVER_PORT)):
         # Save given room code.
         self.room_code = room_code
 
         dlg = create_loading_dialog(self, "Connecting to room…")
 
         try:
-            sock = socket.create_connection((SERVER_HOST, SERVER_PORT))
-            public_key, private_key = generate_rsa_keypair()
+            sock = socket.create_connection(addr)
+            limit_unsent(sock, SEND_LOWAT)
+            # Every read on this connection, in here and then in the room, goes through one reader.
+            reader = FrameReader(sock)
+            hello = {"type": "exchange_sym", "wire": list(protocol.SUPPORTED)}
+            if KEY_EXCHANGE == "x25519":
+                public_key, private_key = generate_x25519_keypair()
+                hello["x25519"] = public_key.hex()
+            else:
+                public_key, private_key = RSA_KEYS.take()
+                hello["public_key"] = public_key
 
             # 1) SEND exchange_sym (plaintext)
-            _send(sock, {
-                "type": "exchange_sym",
-                "public_key": public_key
-            })
+            _send(sock, hello)
 
             # Now receive the server's response, which should be a "sym_key" message
-            response = _recv(sock)
+            response = _recv(reader)
             if response.get("type") == "exchange_sym_response":
-                # Decrypt the symmetric key sent by the server
-                enc_sym_key_b64 = response.get("sym_key")
-                if not enc_sym_key_b64:
-                    raise Exception("No symmetric key received from server")
-                enc_sym_key = base64.b64decode(enc_sym_key_b64)
-                self.room_sym_key = rsa_decrypt(enc_sym_key, private_key)
+                if KEY_EXCHANGE == "x25519":
+                    server_public = bytes.fromhex(response.get("x25519", ""))
+                    self.room_sym_key = x25519_shared_key(private_key, server_public, public_key + server_public)
+                else:
+                    # Decrypt the symmetric key sent by the server
+                    enc_sym_key_b64 = response.get("sym_key")
+                    if not enc_sym_key_b64:
+                        raise Exception("No symmetric key received from server")
+                    enc_sym_key = base64.b64decode(enc_sym_key_b64)
+                    self.room_sym_key = rsa_decrypt(enc_sym_key, private_key)
                 self.nonce = bytes.fromhex(response.get("nonce", "")) if response.get("nonce") else None
+                # Servers that predate the binary format don't answer with a version.
+                self.wire = response.get("wire", protocol.WIRE_V1)
+                # Message seqs carry on into the room, so none repeats under this key.
+                self.crypto = CryptoSession(self.room_sym_key, self.nonce, protocol.TO_SERVER)
+                self.seq = itertools.count()
             else:
                 raise Exception("Server did not respond with 'exchange_sym_response'")
 
@@ -255,12 +329,14 @@ class HomeWindow(QtWidgets.QMainWindow, Ui_home):
                 "type": "register",
                 "name": self.user_name,
             }
-            _send_encrypted(sock, register_payload, self.room_sym_key, self.nonce)
+            protocol.send(sock, register_payload, self.room_sym_key, self.nonce, self.wire,
+                          seq=next(self.seq), session=self.crypto)
 
             # Receive and save user ID.
-            msg = _recv_encrypted(sock, self.room_sym_key, self.nonce)
+            msg = protocol.recv(reader, self.room_sym_key, self.nonce, self.wire, session=self.crypto)
             if msg.get("type") == "register_response":
                 self.user_id = msg.get("user_id")
+                self.stream_id = msg.get("stream_id", 0)
             else:
                 raise Exception("Server did not respond with 'register_response'")
 
@@ -270,9 +346,10 @@ class HomeWindow(QtWidgets.QMainWindow, Ui_home):
                     "type": "create_room",
                     "user_id": self.user_id
                 }
-                _send_encrypted(sock, payload, self.room_sym_key, self.nonce)
+                protocol.send(sock, payload, self.room_sym_key, self.nonce, self.wire,
+                          seq=next(self.seq), session=self.crypto)
 
-                msg = _recv_encrypted(sock, self.room_sym_key, self.nonce)
+                msg = protocol.recv(reader, self.room_sym_key, self.nonce, self.wire, session=self.crypto)
                 if msg.get("type") == "room_created":
                     self.room_code = msg.get("room_code")
                 else:
@@ -286,21 +363,45 @@ class HomeWindow(QtWidgets.QMainWindow, Ui_home):
             payload = {
                 "type": "join",
                 "room_code": self.room_code.upper(),
+                # Ask for the room's shared media key so the server can forward our media untouched.
+                "room_key": self.wire >= protocol.WIRE_V2,
             }
-            _send_encrypted(sock, payload, self.room_sym_key, self.nonce)
-
-            msg = _recv_encrypted(sock, self.room_sym_key, self.nonce)
-            if msg.get("type") == "reject":
+            protocol.send(sock, payload, self.room_sym_key, self.nonce, self.wire,
+                          seq=next(self.seq), session=self.crypto)
+
+            # The roster of members already in the room arrives ahead of the confirmation.
+            peers = []
+            msg = protocol.recv(reader, self.room_sym_key, self.nonce, self.wire, session=self.crypto)
+            while msg.get("type") not in ("reject", "room_joined", "redirect"):
+                if msg.get("type") == "peer":
+                    peers.append(msg)
+                msg = protocol.recv(reader, self.room_sym_key, self.nonce, self.wire, session=self.crypto)
+            if msg.get("type") == "redirect":
+                # A broadcast room's viewers are served by one of its relays (relay.py).
+                sock.close()
+                dlg.close()
+                self._enter(msg["room_code"], False, (msg["host"], msg["port"]))
+            elif msg.get("type") == "reject":
                 QtWidgets.QMessageBox.critical(self, "Room Error", "Failed to join room: " + msg.get("reason", "Unknown reason"))
             elif msg.get("type") == "room_joined":
                 #After joining the room, launch the room UI window
                 self.chat_room = ChatRoom(
                     sock=sock,
+                    reader=reader,
                     user_id=self.user_id,
                     user_name=self.user_name,
                     room_code=self.room_code,
                     sym_key=self.room_sym_key,
                     nonce=self.nonce,
+                    wire=self.wire,
+                    stream_id=self.stream_id,
+                    media_key=bytes.fromhex(msg["media_key"]) if msg.get("media_key") else None,
+                    peers=peers,
+                    crypto=self.crypto,
+                    seq=self.seq,
+                    viewer=msg.get("viewer", False),
+                    ticket=msg.get("ticket"),
+                    resume_grace=msg.get("resume_grace", 0),
                 )
                 self.chat_room.show()
                 self.close()
@@ -316,6 +417,9 @@ class HomeWindow(QtWidgets.QMainWindow, Ui_home):
 # ───────────────────  CHAT ROOM  ──────────────────────
 class ChatRoom(QtWidgets.QMainWindow, Ui_MainWindow):
     frame_ready = QtCore.pyqtSignal(str, object)
+    layout_changed = QtCore.pyqtSignal(dict)
+    user_joined = QtCore.pyqtSignal(str, str)      # user_id, name
+    user_left = QtCore.pyqtSignal(str, str)
 
     def __init__(self,
                  sock: socket.socket,
@@ -323,27 +427,68 @@ class ChatRoom(QtWidgets.QMainWindow, Ui_MainWindow):
                  user_name: str,
                  room_code: str,
                  sym_key: bytes,
-                 nonce: bytes | None):
+                 nonce: bytes | None,
+                 wire: int = protocol.WIRE_V1,
+                 stream_id: int = 0,
+                 media_key: bytes | None = None,
+                 peers: list[dict] = (),
+                 crypto: CryptoSession | None = None,
+                 seq: Iterator[int] | None = None,
+                 ticket: str | None = None,
+                 resume_grace: float = 0,
+                 viewer: bool = False,
+                 reader: FrameReader | None = None):
         super().__init__();
         self.setupUi(self)
 
 
         # ─── 1) State ────────────────────────────────────────────────────────────
         self.sock = sock
+        self._reader = reader or FrameReader(sock)
         self.user_id = user_id
         self.user_name = user_name
         self.room_code = room_code
         self.sym_key = sym_key          # <-- The ROOM’s AES key
         self.nonce = nonce              # <-- The ROOM’s AES nonce
+        self.wire = wire
+        self.stream_id = stream_id
+        self.media_key = media_key      # <-- Shared by everyone in the room, for frame/audio only
+        self._crypto = crypto or CryptoSession(sym_key, nonce, protocol.TO_SERVER)
+        self._seq = seq or itertools.count()
+        # A dropped connection is resumed with the server's ticket instead of rejoining.
+        self._ticket, self._resume_grace = ticket, resume_grace
+        self.viewer = viewer            # watching a broadcast room: nothing we capture is sent
+        self._online = threading.Event()     # cleared while reconnecting
+        self._online.set()
+        self._wire_lock = threading.Lock()   # writer vs. the socket/key swap on resume
+        # Audio thread, GUI thread and encoders only enqueue; one writer owns the socket, so a
+        # congested link can't block the GUI. Its stats drive the bandwidth estimate.
+        self._outbox = OutboundQueue(CFG.get("SEND_QUEUE_SIZE", 8), "video_first")
+        self._bwe = BandwidthEstimator(sock)
+        self._ladder = VideoLadder(JPEG_Q, TARGET_FPS)   # capture settings that fit the estimate
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+        # Media moves to UDP if the server offers it and it gets through; TCP otherwise.
+        self._udp: UdpLink | None = None
+        if CFG.get("UDP_MEDIA", True) and self.wire >= protocol.WIRE_V2:
+            self._send_msg({"type": "udp_request"})
         self._user_names = {user_id: user_name}
+        # stream id -> user id, for binary media
+        self._stream_users: dict[int, str] = {protocol.MIX_STREAM_ID: protocol.MIX_SENDER}
+        for peer in peers:
+            self._handle_peer(peer)
         self.terminating = False
 
         # non communication veriables
 
         self._cam_idx, self._mic_idx = 0, 0
-        self._play_q: queue.Queue[tuple[bytes, float]] = queue.Queue(maxsize=20)
+        # Remote audio is buffered per sender and mixed into one frame per 20 ms (playout.py).
+        self._mixer = PlayoutMixer(PLAYOUT_DELAY)
         self.audio_io: AudioIO | None = None
-        self._pending_vid = collections.defaultdict(list)
+        # Decoded video waits here until its sender's playout clock (their audio) catches up.
+        self._jitter = JitterBuffer(PLAYOUT_DELAY, JITTER_FRAMES)
+        # JPEG decoding happens here, not on the receive loop, so audio never waits behind it.
+        self._decoder = DecodePool(self._decode_frame, self._deliver_frame, DECODE_WORKERS)
 
         print(f"DEBUG(ChatRoom): user_id={user_id}, user_name={user_name}, room_code={room_code}")
 
@@ -351,6 +496,9 @@ class ChatRoom(QtWidgets.QMainWindow, Ui_MainWindow):
         self.setWindowTitle(f"Room {room_code} – {user_name}")
         self.label.setText(f"ROOM ID: {room_code}")
         self.frame_ready.connect(self._show_frame)
+        self.layout_changed.connect(self._apply_layout)
+        self.user_joined.connect(self._handle_user_join)
+        self.user_left.connect(self._show_user_left)
         self.home_window = None
 
         self._force_close = False
@@ -370,7 +518,7 @@ class ChatRoom(QtWidgets.QMainWindow, Ui_MainWindow):
         self.cameraButton.clicked.connect(self._toggle_camera)
         self.micButton.clicked.connect(self._toggle_mic)
 
-        # graphics‑view slots (4 peers max)
+        # graphics‑view slots: local preview + last-N remote speakers
         self._view_slots = [
             self.graphicsView_1,
             self.graphicsView_2,
@@ -378,38 +526,59 @@ class ChatRoom(QtWidgets.QMainWindow, Ui_MainWindow):
             self.graphicsView_4
         ]
         self._view_map: dict[str, QtWidgets.QGraphicsView] = {}
+        # One persistent scene per view, drawn into frame after frame (render.py).
+        self._tiles = {view: Tile(view, getattr(self, f"nameLabel{i}"), IMG("camera_gray.png"))
+                       for i, view in enumerate(self._view_slots)}
+        # Large rooms: the server only sends video for the last-N speakers plus our pin.
+        self._pinned: str | None = None
+        for view in self._view_slots:
+            view.viewport().installEventFilter(self)
 
         self._recv_thread = threading.Thread(target=self._recv_loop, daemon=True)
         self._recv_thread.start()
 
-        self._play_q = queue.Queue(maxsize=20)
 
 
         # ─── 4) Open camera / start timers / start audio if needed ───────────────
+        # Grab, resize and encode off the GUI thread; only the preview comes back to it.
+        self._capture = CapturePipeline(self._prepare_frame, self._encode_layer, self._send_frame,
+                                        layers=SIMULCAST_LAYERS, workers=ENCODE_WORKERS, fps=TARGET_FPS)
         self._open_camera(0)  # or whatever cam_idx you want by default
-        self.audio_io = AudioIO(self._send_audio_chunk, self._play_q, input_dev=None)
+        self.audio_io = AudioIO(self._send_audio_chunk, self._mixer, input_dev=None)
 
-        self._frame_timer = QtCore.QTimer(self)
-        self._frame_timer.timeout.connect(self._capture_frame)
-        self._frame_timer.start(int(1000 / TARGET_FPS))
+        self._playout_timer = QtCore.QTimer(self)
+        self._playout_timer.timeout.connect(self._play_video)
+        self._playout_timer.start(PLAYOUT_TICK_MS)
+
+        self._stats_timer = QtCore.QTimer(self)
+        self._stats_timer.timeout.connect(self._log_media_stats)
+        if MEDIA_STATS_EVERY and log.isEnabledFor(logging.DEBUG):
+            self._stats_timer.start(int(MEDIA_STATS_EVERY * 1000))
+        # Ask the server for the layer that fits each remote tile.
+        self._layer_prefs: dict[str, int] = {}
+        self._layer_timer = QtCore.QTimer(self)
+        self._layer_timer.timeout.connect(self._update_layer_prefs)
+        self._layer_timer.start(2000)
 
 
     # ── camera helpers ────────────────────────────────
     def _open_camera(self, idx: int):
-        if hasattr(self, "cap") and self.cap.isOpened():
-            self.cap.release()
-        self.cap = cv2.VideoCapture(idx, cv2.CAP_MSMF)
-        if not self.cap.isOpened():
-            self.cap.open(idx, cv2.CAP_DSHOW)
-        if not self.cap.isOpened():
-            self.cap.open(idx)   # CAP_ANY
-        if self.cap.isOpened():
-            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH,  WIDTH)
-            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, HEIGHT)
+        # The capture thread lets go of the current camera first: the same device won't open twice.
+        self._capture.set_source(None)
+        cap = cv2.VideoCapture(idx, cv2.CAP_MSMF)
+        if not cap.isOpened():
+            cap.open(idx, cv2.CAP_DSHOW)
+        if not cap.isOpened():
+            cap.open(idx)   # CAP_ANY
+        if cap.isOpened():
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH,  WIDTH)
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, HEIGHT)
+            self._capture.set_source(cap)
         else:
             QtWidgets.QMessageBox.warning(self, "Camera",
                                           "Selected camera couldn’t be opened. Video disabled.")
             self._camera_on = False
+            self._capture.set_enabled(False)
             self.cameraButton.setChecked(True)
 
     # ── camera click ──────────────────────────────────────
@@ -417,22 +586,23 @@ class ChatRoom(QtWidgets.QMainWindow, Ui_MainWindow):
         self._camera_on = not self._camera_on
         icon = "camera_green.png" if self._camera_on else "camera_red.png"
         self.cameraButton.setIcon(QtGui.QIcon(f"{IMG(icon)}"))
+        self._capture.set_enabled(self._camera_on)
         if not self._camera_on:
             self._show_blank(self.user_name)
 
-        _send_encrypted(self.sock, {
+        self._send_msg({
             "type": "camera",
             "from": self.user_id,
             "name": self.user_name,
             "state": self._camera_on
-        }, self.sym_key, self.nonce)
+        })
 
     # ── mic click ─────────────────────────────────────────
     def _toggle_mic(self):
         self._mic_on = not self._mic_on
         icon = "mic_green.png" if self._mic_on else "mic_red.png"
         self.micButton.setIcon(QtGui.QIcon(f"{IMG(icon)}"))
-        _send_encrypted(self.sock, {"type": "mute", "from": self.user_id, "name": self.user_name, "state": not self._mic_on}, self.sym_key, self.nonce)
+        self._send_msg({"type": "mute", "from": self.user_id, "name": self.user_name, "state": not self._mic_on})
         self._update_mute_badge(self.user_name, not self._mic_on)
 
     # ── settings: change devices at run time ──────────
@@ -449,7 +619,7 @@ class ChatRoom(QtWidgets.QMainWindow, Ui_MainWindow):
             self.audio_io.close()
         # Recreate AudioIO with latest mic index
         if self.sym_key:
-            self.audio_io = AudioIO(self._send_audio_chunk, self._play_q, input_dev=self._mic_idx)
+            self.audio_io = AudioIO(self._send_audio_chunk, self._mixer, input_dev=self._mic_idx)
 
     # ───────────────── leave helper ─────────────────────
     def _confirm_leave(self):
@@ -459,30 +629,56 @@ class ChatRoom(QtWidgets.QMainWindow, Ui_MainWindow):
     # ── outgoing audio / video ────────────────────────
     def _start_audio(self):
         if self.audio_io is None:
-            self.audio_io = AudioIO(self._send_audio_chunk, self._play_q,
+            self.audio_io = AudioIO(self._send_audio_chunk, self._mixer,
                                     input_dev=self._mic_idx)
 
-    def _capture_frame(self):
-        if not self._camera_on or not hasattr(self, "cap") or not self.cap.isOpened():
-            return
-        ok, frame = self.cap.read()
-        if not ok:
-            return
+    # Capture pipeline stages (capture.py); these run on its threads, never the GUI's.
+    def _prepare_frame(self, frame):
         frame = cv2.resize(frame, (WIDTH, HEIGHT))
+        self.frame_ready.emit(self.user_name, cv2.flip(frame, 1))
+
+        target = self._bwe.target_bps
+        if self._ladder.adapt(target - AUDIO_BPS):
+            self._capture.fps = self._ladder.rung[2]
+        if self._outbox.queued_bytes * 8 > target * MAX_SEND_DELAY:
+            return None  # link is backed up; the next frame is fresher anyway
+        return frame
+
+    def _encode_layer(self, frame, layer: int) -> bytes | None:
+        shift, quality, _fps = self._ladder.rung
+        if layer + shift:
+            frame = cv2.resize(frame, (WIDTH >> (layer + shift), HEIGHT >> (layer + shift)),
+                               interpolation=cv2.INTER_AREA)
         # Encode JPEG
-        ok2, buf = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_Q])
-        if not ok2:
-            return
+        ok, buf = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+        if not ok:
+            return None
+        self._ladder.on_frame(len(buf))
+        return buf.tobytes()
 
-        # Turn the frame into a base64-encoded string
-        _send_encrypted(self.sock, {
+    def _send_frame(self, layer: int, data: bytes, ts: float):
+        self._send_msg({
             "type": "frame",
             "from": self.user_id,
             "name": self.user_name,
-            "ts": time.time(),
-            "data": base64.b64encode(buf.tobytes()).decode()
-        }, self.sym_key, self.nonce)
-        self.frame_ready.emit(self.user_name, cv2.flip(frame, 1))
+            "ts": ts,
+            "layer": layer,
+            "layers": SIMULCAST_LAYERS,
+            "data": data
+        })
+
+    def _update_layer_prefs(self):
+        changed = {}
+        for sender, view in self._view_map.items():
+            if sender == self.user_name:
+                continue  # local preview
+            scale = view.devicePixelRatioF()
+            layer = _layer_for_tile(int(view.width() * scale), int(view.height() * scale))
+            if self._layer_prefs.get(sender) != layer:
+                changed[sender] = layer
+        if changed:
+            self._layer_prefs.update(changed)
+            self._send_msg({"type": "layer_pref", "layers": changed})
 
     def _send_audio_chunk(self, pcm: bytes):
         if self.sym_key is None:
@@ -490,11 +686,12 @@ class ChatRoom(QtWidgets.QMainWindow, Ui_MainWindow):
         if not self._mic_on:
             pcm = b"-1"
 
-        _send_encrypted(self.sock, {
+        self._send_msg({
             "type": "audio",
             "from": self.user_id, "name": self.user_name,
             "ts": time.time(),
-            "data": base64.b64encode(pcm).decode()}, self.sym_key, self.nonce)
+            "level": audio_level(pcm) if self._mic_on else 0,
+            "data": pcm})
 
     # ── outgoing text chat ────────────────────────────
     def _send_text(self):
@@ -503,11 +700,72 @@ class ChatRoom(QtWidgets.QMainWindow, Ui_MainWindow):
             return
         self.messageBox.clear()
         self._append_chat("You", txt)
-        _send_encrypted(self.sock, {"type": "chat",
-                          "from": self.user_id, "name": self.user_name,
-                          "text": txt}, self.sym_key, self.nonce)
-
+        self._send_msg({"type": "chat",
+                        "from": self.user_id, "name": self.user_name,
+                        "text": txt})
 
+    def _send_msg(self, msg: dict):
+        # Never blocks: media goes out as a datagram while UDP is up, the rest via the TCP writer.
+        if self.viewer and msg.get("type") in protocol.MEDIA_KINDS:
+            return
+        link = self._udp
+        if link is not None and msg.get("type") in protocol.MEDIA_KINDS and link.send(msg, next(self._seq)):
+            if msg["type"] == "frame":
+                self._capture.sent(msg["ts"], msg.get("layer", 0))
+            return
+        self._outbox.put(msg)
+
+    def _write_loop(self):
+        while True:
+            split = SEND_FRAGMENT_BYTES if self.wire >= protocol.WIRE_V4 else 0
+            msgs = self._outbox.get_many(SEND_COALESCE_MAX, SEND_COALESCE_BYTES, split=split)
+            if not msgs:
+                break
+            self._online.wait()
+            with self._wire_lock:
+                frames = []
+                for msg in msgs:
+                    frames += self._frames_for(msg, split)
+                try:
+                    send_all(self.sock, frames)
+                except OSError:
+                    # Connection lost; wait until _reconnect brings it back or gives up and
+                    # closes the outbox. The rest of a fragmented frame would be meaningless on a
+                    # new connection, and media is stale by then, but control and chat go first
+                    # once it is back.
+                    self._online.clear()
+                    if self._outbox.closed:
+                        break
+                    try:
+                        self.sock.shutdown(socket.SHUT_RDWR)   # make sure the reader notices too
+                    except OSError:
+                        pass
+                    self._outbox.drop_resumed()
+                    self._outbox.requeue([msg for msg in msgs if msg["type"] not in protocol.MEDIA_KINDS])
+                    continue
+            self._bwe.on_sent(sum(map(len, frames)))
+            self._bwe.update(self._outbox.queued_bytes)
+            for msg in msgs:
+                if msg["type"] == "frame" and "ts" in msg:     # not the rest of a fragmented one
+                    self._capture.sent(msg["ts"], msg.get("layer", 0))
+        self._outbox.close()
+
+
+
+    def _frames_for(self, msg: dict, split: int) -> list:
+        # Encrypt and frame `msg` in whatever wire version was negotiated. A frame over `split`
+        # goes one fragment at a time, the rest back to the outbox behind any audio queued by then.
+        pieces = msg.get("fragments")
+        if pieces is None:
+            frame = protocol.pack(msg, self.sym_key, self.nonce, self.wire, self.stream_id, next(self._seq),
+                                  self.media_key, self._crypto)
+            if not split or payload_size(msg) <= split or msg["type"] not in protocol.MEDIA_KINDS:
+                return [frame]
+            pieces = protocol.fragments(frame, split)
+        if len(pieces) > 1:
+            self._outbox.resume({"type": msg["type"], "fragments": pieces[1:],
+                                 "size": sum(len(b) for piece in pieces[1:] for b in piece)})
+        return pieces[0]
 
     #difterbute to helpers
     def _recv_loop(self):
@@ -515,74 +773,164 @@ class ChatRoom(QtWidgets.QMainWindow, Ui_MainWindow):
             while True:
                 try:
                     # Receive a message from the server and decrypt
-                    msg = _recv_encrypted(self.sock, self.sym_key, self.nonce)
-                except ConnectionError:
-                    if not self.terminating:
-                        QtWidgets.QMessageBox.critical(self, "Connection Error", "Lost connection to the server.")
+                    msg = protocol.recv(self._reader, self.sym_key, self.nonce, self.wire, self.media_key,
+                                        session=self._crypto)
+                except OSError:
+                    if self.terminating:
+                        break
+                    if self._reconnect():
+                        continue
+                    self._stop_writer()
+                    QtWidgets.QMessageBox.critical(self, "Connection Error", "Lost connection to the server.")
                     break
-
-                # For join/leave/status/chat, always update mapping
-                if "from" in msg and "name" in msg:
-                    self._user_names[msg["from"]] = msg["name"]
-
-                # Extract the message type
-                msg_type = msg.get("type")
-
-                # Handle different message types:
-                match msg_type:
-                    case "frame":
-                        self._handle_frame(msg["from"], msg["data"], msg["ts"])
-                    case "audio":
-                        self._handle_audio(msg["from"], msg["data"], msg["ts"])
-                    case "chat":
-                        sender_id = msg.get("from")
-                        sender_name = self._user_names.get(sender_id, sender_id)
-                        self._append_chat(sender_name, msg["text"])
-                    case "mute":
-                        self._update_mute_badge(msg["from"], msg["state"])
-                    case "camera":
-                        self._handle_camera_state(msg["from"], msg["state"])
-                    case "join":
-                        sender_id = msg.get("user_id")
-                        sender_name = msg.get("name", sender_id)
-                        self._handle_user_join(sender_id, sender_name)
-                    case "leave":
-                        sender_id = msg.get("from")
-                        sender_name = msg.get("name", sender_id)
-                        self._handle_user_leave(sender_id, sender_name)
-                    case "status":
-                        # System message
-                        self._append_chat("System", msg.get("text", ""))
-                    case "reject", _:
-                        reason = msg.get("reason", "Unknown reason")
-                        QtWidgets.QMessageBox.critical(self, "Join failed", reason)
-                        self.close()
-                        return
+                if not self._dispatch(msg):
+                    return
 
         except ConnectionError:
             pass
 
-    def _get_name_label(self, view):
-        idx = list(self._view_map.values()).index(view)
-        return getattr(self, f"nameLabel{idx}")
+    def _dispatch(self, msg: dict) -> bool:
+        """
+        Handle one incoming message, from the TCP loop or the UDP link's thread.
+        :returns: False once the room is over for us.
+        """
+        # Binary media only names its stream; drop it until the roster says whose it is.
+        if "stream_id" in msg and "from" not in msg:
+            msg["from"] = self._stream_users.get(msg["stream_id"])
+            if msg["from"] is None:
+                return True
+
+        # For join/leave/status/chat, always update mapping
+        if "from" in msg and "name" in msg:
+            self._user_names[msg["from"]] = msg["name"]
+
+        # Extract the message type
+        msg_type = msg.get("type")
+
+        # Handle different message types:
+        match msg_type:
+            case "frame":
+                self._handle_frame(msg["from"], msg["data"], msg["ts"])
+            case "audio":
+                self._handle_audio(msg["from"], msg["data"], msg["ts"])
+            case "chat":
+                sender_id = msg.get("from")
+                sender_name = self._user_names.get(sender_id, sender_id)
+                self._append_chat(sender_name, msg["text"])
+            case "mute":
+                self._update_mute_badge(msg["from"], msg["state"])
+            case "camera":
+                self._handle_camera_state(msg["from"], msg["state"])
+            case "join":
+                sender_id = msg.get("user_id")
+                sender_name = msg.get("name", sender_id)
+                self.user_joined.emit(sender_id, sender_name)
+            case "peer":
+                self._handle_peer(msg)
+            case "layout":
+                self.layout_changed.emit(msg)
+            case "leave":
+                sender_id = msg.get("from")
+                sender_name = msg.get("name", sender_id)
+                self._handle_user_leave(sender_id, sender_name)
+            case "status":
+                # System message
+                self._append_chat("System", msg.get("text", ""))
+            case "resumed":
+                self._resync(msg)
+            case "udp_offer":
+                self._start_udp(msg)
+            case "udp_ready":
+                if self._udp:
+                    self._udp.mark_ready()
+            case "reject", _:
+                reason = msg.get("reason", "Unknown reason")
+                QtWidgets.QMessageBox.critical(self, "Join failed", reason)
+                self.close()
+                return False
+        return True
+
+    def _stop_writer(self):
+        # Nothing more can go out: let the writer drain the outbox into the dead socket and stop.
+        self._outbox.close()
+        self._online.set()
+
+    def _reconnect(self) -> bool:
+        """
+        Resume our seat on a new connection after this one dropped, retrying
+        until the server's grace window runs out. If that fails the writer is stopped.
+        :returns: False if there is no ticket, the seat is gone or the server stayed unreachable.
+        """
+        if self._resume():
+            return True
+        self._stop_writer()
+        return False
+
+    def _resume(self) -> bool:
+        if not self._ticket:
+            return False
+        self._online.clear()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)   # unblocks a writer stuck on the dead link
+        except OSError:
+            pass
+        if self._udp:
+            self._udp.close()
+            self._udp = None
+        deadline = time.monotonic() + self._resume_grace
+        while not self.terminating:
+            try:
+                reader, crypto, wire = _resume_session(self._ticket, self.sym_key, self.user_id)
+                break
+            except ConnectionError:
+                return False
+            except OSError:
+                if time.monotonic() + RESUME_RETRY > deadline:
+                    return False
+                time.sleep(RESUME_RETRY)
+        else:
+            return False
+        with self._wire_lock:
+            old, self.sock, self._reader = self.sock, reader.sock, reader
+            self.sym_key, self.nonce, self.wire = crypto.key, crypto.nonce, wire
+            self._crypto = crypto
+            self._bwe.sock = reader.sock
+        old.close()
+        self._online.set()
+        return True
+
+    def _resync(self, msg: dict):
+        # Back on a resumed connection: catch up on whoever left while we were away.
+        self._ticket = msg.get("ticket")
+        present = {peer["user_id"] for peer in msg.get("peers", ())}
+        for stream_id, user_id in list(self._stream_users.items()):
+            if user_id != protocol.MIX_SENDER and user_id not in present:
+                del self._stream_users[stream_id]
+                self._handle_user_leave(user_id, self._user_names.get(user_id, user_id))
+        for peer in msg.get("peers", ()):
+            self._handle_peer(peer)
+        if CFG.get("UDP_MEDIA", True) and self.wire >= protocol.WIRE_V2:
+            self._send_msg({"type": "udp_request"})
+
+    def _start_udp(self, offer: dict):
+        if not offer.get("port") or self._udp is not None:
+            return
+        self._udp = UdpLink(self.sock.getpeername()[0], offer["port"], bytes.fromhex(offer["key"]),
+                            self.stream_id, self.media_key, self._dispatch, self._udp_down)
+
+    def _udp_down(self):
+        # UDP blocked or gone quiet: carry on over TCP and tell the server to do the same.
+        self._udp = None
+        if not self.terminating:
+            self._send_msg({"type": "udp_close"})
 
     def _show_blank(self, sender):
         view = self._view_map.get(sender)
         if not view:
             return
-        scn = QtWidgets.QGraphicsScene()
-        # Set gray background
-        scn.setBackgroundBrush(QtGui.QColor("#4C2C76"))
-        # Optionally, show a camera-off pixmap in the center
-        icon_path = IMG("camera_gray.png")  # Add a suitable icon to your imgs/
-        if os.path.exists(icon_path):
-            pix = QtGui.QPixmap(icon_path)
-            scn.addPixmap(pix)
-        view.setScene(scn)
-        lbl = self._get_name_label(view)
-        lbl.setText(sender)
-        lbl.resize(view.width(), 24)
-        lbl.move(view.x(), view.y() + view.height() - 24)
+        tile = self._tiles[view]
+        tile.blank()
+        tile.set_name(self._user_names.get(sender, sender))
 
     # ── incoming helpers ──────────────────────────────
 
@@ -590,45 +938,92 @@ class ChatRoom(QtWidgets.QMainWindow, Ui_MainWindow):
         self._append_chat("System", f"{name} has joined the call.")
         if user_id in self._view_map:
             view = self._view_map.pop(user_id)
-            scn = QtWidgets.QGraphicsScene()
-            view.setScene(scn)
-            lbl = self._get_name_label(view)
-            lbl.setText("")
-            lbl.hide()
+            self._tiles[view].clear()
             self._view_slots.insert(0, view)
 
 
     def _handle_user_leave(self, user_id: str, name: str):
+        # Receive thread: drop their media state here, and leave the widgets to the GUI thread.
+        self._decoder.forget(user_id)
+        self._jitter.forget(user_id)
+        self._mixer.forget(user_id)
+        self.user_left.emit(user_id, name)
+
+    def _show_user_left(self, user_id: str, name: str):
         self._append_chat("System", f"{name} has left the call.")
+        self._release_tile(user_id)
+
+    def _release_tile(self, user_id: str):
         if user_id in self._view_map:
-            view = self._view_map[user_id]
-            lbl = self._get_name_label(view)
-            lbl.setText("")
-            lbl.hide()
-            scn = QtWidgets.QGraphicsScene()
-            view.setScene(scn)
-            self._view_map.pop(user_id)
+            view = self._view_map.pop(user_id)
+            self._tiles[view].clear()
 
             # Make usable by another user
             self._view_slots.insert(0, view)
 
-    def _handle_audio(self, sender: str, payload_b64: str, ts: float):
-        raw = base64.b64decode(payload_b64)
-        pcm = raw
-        try:
-            self._play_q.put_nowait((pcm, ts))
-        except queue.Full:
-            pass
-        vid_q = self._pending_vid[sender]
-        while vid_q and vid_q[0][0] <= ts:
-            _, frame = vid_q.pop(0)
-            self.frame_ready.emit(sender, frame)
-
-    def _handle_frame(self, sender: str, payload_b64: str, ts: float):
-        raw = base64.b64decode(payload_b64)
-        frame = cv2.imdecode(np.frombuffer(raw, np.uint8), cv2.IMREAD_COLOR)
-        if frame is not None:
-            self._pending_vid[sender].append((ts, frame))
+    def _apply_layout(self, msg: dict):
+        # Free the tiles of senders that dropped out of our last-N so new speakers get them.
+        visible = set(msg.get("visible", ()))
+        self._pinned = msg.get("pinned")
+        for sender in list(self._view_map):
+            if sender != self.user_name and sender not in visible:
+                self._decoder.forget(sender)
+                self._jitter.forget(sender)
+                self._release_tile(sender)
+
+    def eventFilter(self, obj, ev):
+        if ev.type() == QtCore.QEvent.Resize:
+            for view, tile in self._tiles.items():
+                if view.viewport() is obj:
+                    tile.relayout()
+        # Scroll over a tile to turn that sender up or down.
+        elif ev.type() == QtCore.QEvent.Wheel:
+            for sender, view in self._view_map.items():
+                if view.viewport() is obj and sender != self.user_name:
+                    steps = ev.angleDelta().y() / 120
+                    self._mixer.set_gain(sender, self._mixer.gain(sender) * VOLUME_STEP ** steps)
+                    return True
+        # Double-click a tile to pin that sender's video; double-click it again to unpin.
+        elif ev.type() == QtCore.QEvent.MouseButtonDblClick:
+            for sender, view in self._view_map.items():
+                if view.viewport() is obj and sender != self.user_name:
+                    pin = None if sender == self._pinned else sender
+                    self._send_msg({"type": "pin", "user_id": pin})
+                    return True
+        return super().eventFilter(obj, ev)
+
+    def _handle_peer(self, msg: dict):
+        self._user_names[msg["user_id"]] = msg["name"]
+        self._stream_users[msg["stream_id"]] = msg["user_id"]
+
+    def _handle_audio(self, sender: str, pcm: bytes, ts: float):
+        if not self._mixer.push(sender, pcm, ts):
+            return  # mute marker
+        # Server-mixed audio (MCU mode) carries no per-sender clock; that video plays on its own.
+        if sender != protocol.MIX_SENDER:
+            self._jitter.audio(sender, self._mixer.lag(sender))
+
+    def _handle_frame(self, sender: str, raw: bytes, ts: float):
+        self._decoder.submit(sender, ts, raw)
+
+    # Decode pool callbacks (decode.py), on its threads.
+    @staticmethod
+    def _decode_frame(raw: bytes):
+        return cv2.imdecode(np.frombuffer(raw, np.uint8), cv2.IMREAD_COLOR)
+
+    def _deliver_frame(self, sender: str, ts: float, frame):
+        self._jitter.push(sender, ts, frame)
+
+    def _play_video(self):
+        # Playout tick (GUI thread): show each sender's frame that is due by now.
+        for sender, frame in self._jitter.due():
+            self._show_frame(sender, frame)
+
+    def _log_media_stats(self):
+        log.debug("capture: %s", self._capture.report())
+        log.debug("decode: %s", self._decoder.report())
+        log.debug("jitter: %s", self._jitter.report())
+        log.debug("playout: %s", self._mixer.stats())
 
     def _update_mute_badge(self, sender: str, muted: bool):
         view = self._view_map.get(sender)
@@ -668,58 +1063,9 @@ class ChatRoom(QtWidgets.QMainWindow, Ui_MainWindow):
             self._view_map[sender] = view
         if view is None:
             return
-
-        try:
-            sender = self._user_names[sender]
-        except KeyError:
-            # If cant get name fall back to use ID
-            pass
-
-
-        lbl = self._get_name_label(view)
-        lbl.setText(sender)
-        lbl.adjustSize()
-        lbl.move(view.mapTo(self, QtCore.QPoint(6, view.height() - lbl.height() - 6)))
-        lbl.show()
-
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        h, w, ch = rgb.shape
-        qimg = QtGui.QImage(rgb.data, w, h, ch * w, QtGui.QImage.Format_RGB888)
-        pix = QtGui.QPixmap.fromImage(qimg)
-
-        scn = QtWidgets.QGraphicsScene()
-        item = scn.addPixmap(pix)
-        item.setTransformationMode(QtCore.Qt.SmoothTransformation)
-        view.setScene(scn)
-        view.setResizeAnchor(QtWidgets.QGraphicsView.AnchorViewCenter)
-        view.fitInView(item, QtCore.Qt.KeepAspectRatio)
-
-        camera_off = not getattr(self, "_camera_states", {}).get(sender, True)
-        muted = getattr(self, "_remote_muted", {}).get(sender, False)
-        # Draw overlay badge/icon on top of the frame if needed
-        if camera_off:
-            # Show camera-off icon in center
-            icon_path = IMG("camera_gray.png")  # Add a suitable icon to your imgs/
-            if os.path.exists(icon_path):
-                icon_pix = QtGui.QPixmap(icon_path)
-                icon_item = scn.addPixmap(icon_pix)
-                icon_item.setOffset(
-                    (view.width() - icon_pix.width()) // 2,
-                    (view.height() - icon_pix.height()) // 2
-                )
-        elif muted:
-            # Show mute badge in a corner (e.g. top-right)
-            icon_path = IMG("mic_red.png")
-            if os.path.exists(icon_path):
-                icon_pix = QtGui.QPixmap(icon_path)
-                icon_item = scn.addPixmap(icon_pix)
-                icon_item.setOffset(view.width() - icon_pix.width() - 10, 10)
-
-        # position / text of name overlay
-        lbl = self._get_name_label(view)
-        lbl.setText(sender)
-        lbl.resize(view.width(), 24)
-        lbl.move(view.x(), view.y() + view.height() - 24)
+        tile = self._tiles[view]
+        tile.show(frame)
+        tile.set_name(self._user_names.get(sender, sender))
 
     def closeEvent(self, ev: QtGui.QCloseEvent):
         #Close the room window and add a loading widget
@@ -741,20 +1087,28 @@ class ChatRoom(QtWidgets.QMainWindow, Ui_MainWindow):
         # When user leaves, notify server, then jump back to Home
         try:
             self.terminating = True
-            # 2) Then, stop the camera timer and release camera
-            self._frame_timer.stop()
-            if self.cap and self.cap.isOpened():
-                self.cap.release()
+            # 2) Then, stop the capture threads and release camera
+            self._capture.close()
+            self._decoder.close()
+            self._layer_timer.stop()
+            self._stats_timer.stop()
+            self._playout_timer.stop()
+            if self._udp:
+                self._udp.close()
 
             # 3) Now stop the audio capture thread.
             if self.audio_io:
                 self.audio_io.close()
 
-            _send_encrypted(self.sock, {
+            self._send_msg({
                 "type": "leave",
                 "user_id": self.user_id,
                 "room_code": self.room_code
-            }, self.sym_key, self.nonce)
+            })
+            # Let the writer flush the leave before the socket goes.
+            self._outbox.close()
+            self._online.set()
+            self._writer.join(timeout=1.0)
             self.sock.close()
 
             self.home_window = HomeWindow(self.user_name)
@@ -771,6 +1125,7 @@ class ChatRoom(QtWidgets.QMainWindow, Ui_MainWindow):
 
 # ───────────────── entry‑point ────────────────────────
 if __name__ == "__main__":
+    logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
     app = QtWidgets.QApplication(sys.argv)
     Win = WelcomeWindow(); Win.show()
     sys.exit(app.exec_())
\ No newline at end of file
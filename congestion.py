@@ -0,0 +1,162 @@
+"""
+congestion.py – per-connection bandwidth estimation and send-rate adaptation.
+
+Each end of a connection measures two things about its own sending side:
+
+  • backlog: bytes accepted for sending but not yet on the wire – the
+    application queue plus what is still sitting in the kernel socket
+    buffer. On Linux that is SIOCOUTQNSD (3.12+). Linux's TIOCOUTQ, the
+    fallback elsewhere, also counts bytes sent but not yet acknowledged,
+    which adds about one round trip of in-flight data to the backlog;
+  • delivery rate: how fast that backlog actually drains.
+
+Backlog divided by delivery rate is the queueing delay we are adding. While
+it stays small the target bitrate probes upward; once it grows the target
+drops below the measured delivery rate so the queue can empty (AIMD on
+delay, in the spirit of delay-based congestion controllers).
+
+The client turns the target into capture settings through `VideoLadder`;
+the server uses `congested` to pick lower simulcast layers for a receiver.
+"""
+
+import time, struct, sys
+
+try:
+    import fcntl, termios
+    _TIOCOUTQ = termios.TIOCOUTQ
+except (ImportError, AttributeError):       # Windows: no way to read the kernel queue
+    fcntl = None
+# Linux: bytes in the send queue not yet sent, unlike TIOCOUTQ (not in the termios module).
+_SIOCOUTQNSD = 0x894B if sys.platform.startswith("linux") else None
+
+INTERVAL   = 0.5     # seconds between estimate updates
+HIGH_DELAY = 0.20    # queueing delay (s) that counts as congestion
+LOW_DELAY  = 0.05    # below this the link has room to probe
+DECREASE   = 0.85    # target = DECREASE × delivery rate on congestion
+INCREASE   = 1.08    # per-interval probe factor
+SMOOTHING  = 0.3
+
+
+def kernel_backlog(sock) -> int:
+    """
+    Bytes written to `sock` that the kernel has not sent yet, or 0 if unknown.
+    Where only TIOCOUTQ works, unacknowledged bytes count as not sent.
+    """
+    if fcntl is None:
+        return 0
+    if _SIOCOUTQNSD is not None:
+        try:
+            return struct.unpack("i", fcntl.ioctl(sock.fileno(), _SIOCOUTQNSD, b"\0\0\0\0"))[0]
+        except OSError:
+            pass        # kernel older than 3.12, or not a TCP socket
+        except ValueError:
+            return 0
+    try:
+        return struct.unpack("i", fcntl.ioctl(sock.fileno(), _TIOCOUTQ, b"\0\0\0\0"))[0]
+    except (OSError, ValueError):
+        return 0
+
+
+class BandwidthEstimator:
+    def __init__(self, sock, start_bps: int = 1_000_000,
+                 min_bps: int = 150_000, max_bps: int = 10_000_000):
+        self.sock = sock
+        self.min_bps, self.max_bps = min_bps, max_bps
+        self.target_bps = start_bps
+        self.delivery_bps = 0.0
+        self.delay = 0.0                # current queueing delay estimate, seconds
+        self.written = 0                # bytes handed to the socket so far
+        self._delivered = 0
+        self._last = time.monotonic()
+
+    def on_sent(self, nbytes: int):
+        self.written += nbytes
+
+    @property
+    def congested(self) -> bool:
+        return self.delay > HIGH_DELAY
+
+    def update(self, queued_bytes: int = 0, buffered: int = 0, now: float | None = None) -> int:
+        """
+        Fold in the latest measurements; cheap to call often, only acts every INTERVAL.
+        :param queued_bytes: Bytes still waiting in the application's own send queue.
+        :param buffered: Bytes already passed to `on_sent` but held in a userspace
+                         write buffer (an asyncio transport's).
+        :returns: The target bitrate in bits per second.
+        """
+        now = time.monotonic() if now is None else now
+        dt = now - self._last
+        if dt < INTERVAL:
+            return self.target_bps
+        unsent = kernel_backlog(self.sock) + buffered
+        delivered = self.written - unsent
+        sample = (delivered - self._delivered) * 8 / dt
+        self._delivered, self._last = delivered, now
+        self.delivery_bps += SMOOTHING * (sample - self.delivery_bps)
+
+        backlog_bits = (unsent + queued_bytes) * 8
+        self.delay = backlog_bits / max(self.delivery_bps, self.min_bps)
+        if self.delay > HIGH_DELAY:
+            self.target_bps = DECREASE * min(self.target_bps, self.delivery_bps)
+        elif self.delay < LOW_DELAY:
+            self.target_bps *= INCREASE
+        self.target_bps = int(min(max(self.target_bps, self.min_bps), self.max_bps))
+        return self.target_bps
+
+    def stats(self) -> dict:
+        return {
+            "target_bps": self.target_bps,
+            "delivery_bps": int(self.delivery_bps),
+            "delay_ms": round(self.delay * 1000, 1),
+        }
+
+
+class VideoLadder:
+    """
+    Capture settings from best to worst; the sender steps along it to keep
+    its measured video bitrate under the budget the estimator allows.
+    Each rung is (resolution shift, JPEG quality, fps).
+    """
+    HOLD = 2.0           # measuring window; also the minimum time between steps
+    UP_HEADROOM = 1.6    # the next rung up costs roughly this much more
+
+    def __init__(self, quality: int, fps: int):
+        low_q = max(10, quality * 2 // 3)
+        self.rungs = [
+            (0, quality, fps),
+            (0, low_q, fps),
+            (1, quality, fps),
+            (1, low_q, max(5, fps * 2 // 3)),
+            (2, low_q, max(5, fps // 2)),
+            (2, 10, 5),
+        ]
+        self.index = 0
+        self._bytes = 0
+        self._since = time.monotonic()
+
+    @property
+    def rung(self) -> tuple[int, int, int]:
+        return self.rungs[self.index]
+
+    def on_frame(self, nbytes: int):
+        self._bytes += nbytes
+
+    def adapt(self, budget_bps: float, now: float | None = None) -> bool:
+        """
+        Compare the video bitrate since the last step with `budget_bps` and move one rung.
+        :returns: True if the rung changed.
+        """
+        now = time.monotonic() if now is None else now
+        if now - self._since < self.HOLD:
+            return False
+        rate = self._bytes * 8 / (now - self._since)
+        step = 0
+        if rate > budget_bps and self.index < len(self.rungs) - 1:
+            step = 1
+        elif rate * self.UP_HEADROOM < budget_bps and self.index > 0:
+            step = -1
+        self._bytes, self._since = 0, now
+        if not step:
+            return False
+        self.index += step
+        return True
@@ -0,0 +1,108 @@
+"""
+decode.py – incoming video decoded off the receive thread.
+
+The receive loop only hands a frame's JPEG to `DecodePool.submit` and goes
+back to the socket, so audio behind it is never held up by a decode. A
+pool of workers decodes, at most one frame per sender at a time, which
+keeps each sender's frames in order and stops a busy sender from taking
+every worker.
+
+Each sender has one waiting slot, latest wins: a frame that arrives while
+the previous one is still waiting replaces it undecoded. A frame no newer
+than one already received from that sender (late on UDP) is dropped on
+arrival. When decoding can't keep up, the pool skips frames instead of
+falling behind. A frame still decoding when its sender is forgotten is
+dropped, not delivered: each time a sender is seen afresh they get a new
+generation number, and a result is delivered only while its generation is
+current.
+
+Decoding itself is the caller's (cv2.imdecode in client.py). `stats()`
+counts what was decoded and why the rest was skipped, and times decodes.
+"""
+
+import threading, collections, itertools, time
+from capture import LatestSlots, summarize, WINDOW
+
+
+class DecodePool:
+    def __init__(self, decode, deliver, workers: int = 2):
+        """
+        :param decode: decode(data) -> image, or None if it isn't one. Runs on a pool thread.
+        :param deliver: deliver(sender, ts, image) for each frame decoded, on the same thread.
+        :param workers: Decoder threads. JPEG decoding releases the GIL, so these run in parallel.
+        """
+        self.decode, self.deliver = decode, deliver
+        self.received = self.decoded = self.late = self.failed = 0
+        self._slots = LatestSlots(exclusive=True)      # sender -> (ts, data, generation)
+        self._newest: dict[str, float] = {}            # sender -> ts of the newest frame received
+        self._generation: dict[str, int] = {}          # sender -> current generation, until forgotten
+        self._generations = itertools.count()
+        self._lock = threading.Lock()                  # the counters and the dicts above
+        self._times = collections.deque(maxlen=WINDOW)
+        self._threads = [threading.Thread(target=self._loop, name=f"decode-{i}", daemon=True)
+                         for i in range(max(1, workers))]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, sender: str, ts: float, data: bytes):
+        """
+        Queue `data`, a frame from `sender`, for decoding. Never blocks.
+        """
+        with self._lock:
+            self.received += 1
+            if ts <= self._newest.get(sender, 0.0):
+                self.late += 1
+                return
+            self._newest[sender] = ts
+            generation = self._generation.get(sender)
+            if generation is None:
+                generation = self._generation[sender] = next(self._generations)
+            self._slots.put(sender, (ts, data, generation))
+
+    def forget(self, sender: str):
+        """
+        `sender` left: drop their waiting frame, their clock, and any frame of theirs being decoded.
+        """
+        self._slots.discard(sender)
+        with self._lock:
+            self._newest.pop(sender, None)
+            self._generation.pop(sender, None)
+
+    def close(self):
+        self._slots.close()
+
+    def _loop(self):
+        while (job := self._slots.get()) is not None:
+            sender, (ts, data, generation) = job
+            try:
+                t0 = time.perf_counter()
+                image = self.decode(data)
+                self._times.append(time.perf_counter() - t0)
+                with self._lock:
+                    if image is None:
+                        self.failed += 1
+                        continue
+                    if self._generation.get(sender) != generation:
+                        continue        # forgotten while decoding
+                    self.decoded += 1
+                    # Under the lock, so a forget() that returns has seen the last delivery.
+                    self.deliver(sender, ts, image)
+            finally:
+                self._slots.done(sender)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = {"received": self.received, "decoded": self.decoded, "replaced": self._slots.replaced,
+                      "late": self.late, "failed": self.failed}
+        return {**counts, "decode": summarize(self._times)}
+
+    def report(self) -> str:
+        """
+        One line for the log, e.g. "90 received, 84 decoded, 5 replaced, 1 late, 0 failed, decode 3.2/6.0 ms …".
+        """
+        s = self.stats()
+        line = (f"{s['received']} received, {s['decoded']} decoded, {s['replaced']} replaced, "
+                f"{s['late']} late, {s['failed']} failed")
+        if s["decode"]:
+            line += f", decode {s['decode']['mean']:.1f}/{s['decode']['p95']:.1f} ms (mean/p95)"
+        return line
@@ -11,13 +11,22 @@ Functions:
 • generate_rsa_keypair(bits=512)     →  public, private key tuples
 • rsa_encrypt(message_bytes, pub)    →  bytes cipher
 • rsa_decrypt(cipher_bytes, priv)    →  original bytes
+• generate_x25519_keypair()          →  raw public bytes, private key
+• x25519_shared_key(priv, peer, ctx) →  16-byte AES key
+• KeypairPool                        →  RSA keypairs generated in the background
+• CryptoSession(key, nonce, dir)     →  per-connection AES-CTR, per-message nonces
 
 NOTE: For real-world security, use larger keys and authenticated encryption.
 """
 
-from Crypto.PublicKey import RSA
+from Crypto.PublicKey import RSA, ECC
 from Crypto.Cipher import PKCS1_OAEP, AES
+from Crypto.Hash import SHA256
+from Crypto.Protocol.DH import key_agreement, import_x25519_public_key
+from Crypto.Protocol.KDF import HKDF
 from typing import Tuple
+import queue, threading, struct
+import numpy as np
 
 def generate_rsa_keypair(bits: int = 1024) -> Tuple[Tuple[int, int], Tuple[int, int]]:
     """
@@ -61,10 +70,190 @@ def rsa_decrypt(cipher_bytes: bytes, priv: Tuple[int, int]) -> bytes:
     return cipher.decrypt(cipher_bytes)
 
 
+def generate_x25519_keypair() -> Tuple[bytes, ECC.EccKey]:
+    """
+    Generate an ephemeral X25519 key pair, good for one key exchange.
+    Much cheaper than RSA keygen and RSA encryption on the other end.
+    Returns:
+        (public key as 32 raw bytes, private key)
+    """
+    key = ECC.generate(curve="Curve25519")
+    return key.public_key().export_key(format="raw"), key
+
+def x25519_shared_key(priv: ECC.EccKey, peer_public: bytes, context: bytes = b"") -> bytes:
+    """
+    Agree on a 16-byte AES key with the holder of `peer_public`.
+    Args:
+        priv: Our private key from generate_x25519_keypair.
+        peer_public: The other side's 32-byte public key.
+        context: Bound into the key; both sides must pass the same bytes.
+    Returns:
+        The shared key. Raises ValueError for an invalid public key.
+    """
+    return key_agreement(static_priv=priv, static_pub=import_x25519_public_key(peer_public),
+                         kdf=lambda z: HKDF(z, 16, b"", SHA256, context=b"zoombo key" + context))
+
+
+class KeypairPool:
+    """
+    RSA keypairs generated ahead of time on a background thread, so taking
+    one only waits on keygen if the pool has run dry.
+    """
+    def __init__(self, size: int = 2, bits: int = 1024):
+        self.bits = bits
+        self._q: queue.Queue = queue.Queue(maxsize=size)
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._fill, daemon=True)
+            self._thread.start()
+
+    def _fill(self):
+        while True:
+            self._q.put(generate_rsa_keypair(self.bits))
+
+    def take(self) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+        self.start()
+        return self._q.get()
+
+
 def aes_encrypt(data: bytes, key: bytes, nonce: bytes) -> bytes:
     cipher = AES.new(key, AES.MODE_CTR, nonce=nonce)
     return cipher.encrypt(data)
 
 def aes_decrypt(data: bytes, key: bytes, nonce: bytes) -> bytes:
     cipher = AES.new(key, AES.MODE_CTR, nonce=nonce)
-    return cipher.decrypt(data)
\ No newline at end of file
+    return cipher.decrypt(data)
+
+
+class CryptoSession:
+    """
+    AES-CTR under one key, set up once for a connection instead of once per message.
+
+    The key schedule lives in a single ECB cipher. A message's keystream is
+    the encryption of its counter blocks (8-byte nonce + 8-byte block index),
+    so `crypt(data, nonce)` returns exactly what aes_encrypt(data, key, nonce)
+    does. `encrypt` / `decrypt` take the nonce from a message counter and the
+    direction instead, so no two messages of a session share keystream.
+    Scratch buffers are reused and grow to the largest batch seen.
+    """
+
+    def __init__(self, key: bytes, nonce: bytes = bytes(8), direction: int = 0):
+        """
+        Args:
+            key: 16-byte AES key.
+            nonce: The connection's fixed nonce, for peers that still use one.
+            direction: 0 or 1, the direction this end sends in; decrypt uses the other.
+        """
+        self.key, self.nonce, self.direction = key, nonce, direction
+        self._ecb = AES.new(key, AES.MODE_ECB)
+        self._lock = threading.Lock()
+        self._grow(64)
+
+    def _grow(self, blocks: int):
+        self._blocks = blocks
+        self._counters = bytearray(blocks * 16)
+        counters = np.frombuffer(self._counters, ">u8").reshape(blocks, 2)
+        self._prefix, self._index = counters[:, 0], counters[:, 1]
+        self._arange = np.arange(blocks, dtype=">u8")
+        self._index[:] = self._arange
+        self._counters_mv = memoryview(self._counters)
+
+    def _keystream(self, blocks: int) -> np.ndarray:
+        # pycryptodome takes immutable bytes far faster than a buffer (or an output=) here.
+        return np.frombuffer(self._ecb.encrypt(bytes(self._counters_mv[:blocks * 16])), np.uint8)
+
+    @staticmethod
+    def message_nonce(direction: int, seq: int) -> bytes:
+        return struct.pack("!B3xI", direction, seq & 0xFFFFFFFF)
+
+    def crypt(self, data, nonce: bytes, output=None):
+        """
+        CTR-encrypt (or decrypt, the same thing) `data` under an 8-byte nonce.
+        Args:
+            output: Writable buffer of len(data) to fill, instead of returning new bytes.
+        Returns:
+            The result: bytes, or `output`.
+        """
+        n = len(data)
+        blocks = -(-n // 16)
+        if not n:
+            return b"" if output is None else output
+        with self._lock:
+            if blocks > self._blocks:
+                self._grow(max(blocks, 2 * self._blocks))
+            # Block indices are always 0, 1, 2, … here; only the nonce half changes.
+            self._prefix[:blocks] = int.from_bytes(nonce, "big")
+            stream = self._keystream(blocks)[:n]
+        plain = np.frombuffer(data, np.uint8)
+        if output is None:
+            return (plain ^ stream).tobytes()
+        np.bitwise_xor(plain, stream, out=np.frombuffer(output, np.uint8))
+        return output
+
+    def encrypt(self, data, seq: int, output=None):
+        # Our outgoing message number `seq`.
+        return self.crypt(data, self.message_nonce(self.direction, seq), output)
+
+    def decrypt(self, data, seq: int, output=None):
+        # The peer's message number `seq`.
+        return self.crypt(data, self.message_nonce(self.direction ^ 1, seq), output)
+
+    def encrypt_many(self, messages: list, outputs: list | None = None) -> list:
+        """
+        Encrypt several (seq, data) messages with a single pass of the block cipher.
+        """
+        return self.crypt_many([(data, self.message_nonce(self.direction, seq)) for seq, data in messages], outputs)
+
+    def decrypt_many(self, messages: list, outputs: list | None = None) -> list:
+        return self.crypt_many([(data, self.message_nonce(self.direction ^ 1, seq)) for seq, data in messages], outputs)
+
+    def crypt_many(self, items: list, outputs: list | None = None) -> list:
+        """
+        `crypt` for several (data, nonce) pairs at once.
+        Args:
+            outputs: Per item, a buffer to fill or None for new bytes.
+        """
+        sizes = [len(data) for data, _nonce in items]
+        blocks = [-(-n // 16) for n in sizes]
+        total = sum(blocks)
+        outputs = outputs or [None] * len(items)
+        with self._lock:
+            if total > self._blocks:
+                self._grow(max(total, 2 * self._blocks))
+            at = 0
+            for (_data, nonce), b in zip(items, blocks):
+                self._prefix[at:at + b] = int.from_bytes(nonce, "big")
+                self._index[at:at + b] = self._arange[:b]
+                at += b
+            keystream = self._keystream(total)
+            self._index[:total] = self._arange[:total]      # back to what `crypt` expects
+        results, at = [], 0
+        for (data, _nonce), n, b, out in zip(items, sizes, blocks, outputs):
+            plain, stream = np.frombuffer(data, np.uint8), keystream[at:at + n]
+            if out is None:
+                results.append((plain ^ stream).tobytes())
+            else:
+                np.bitwise_xor(plain, stream, out=np.frombuffer(out, np.uint8))
+                results.append(out)
+            at += b * 16
+        return results
+
+
+def gcm_encrypt(data: bytes, key: bytes, nonce: bytes, aad: bytes = b"") -> bytes:
+    """
+    Authenticated encryption (AES-GCM). Returns ciphertext followed by the 16-byte tag.
+    """
+    cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+    cipher.update(aad)
+    ct, tag = cipher.encrypt_and_digest(data)
+    return ct + tag
+
+def gcm_decrypt(data: bytes, key: bytes, nonce: bytes, aad: bytes = b"") -> bytes:
+    """
+    Inverse of gcm_encrypt. Raises ValueError if the data or `aad` was tampered with.
+    """
+    cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+    cipher.update(aad)
+    return cipher.decrypt_and_verify(data[:-16], data[-16:])
@@ -0,0 +1,146 @@
+"""
+framing.py – length-prefixed frames on a blocking socket, shared by
+server.py and client.py.
+
+Everything on a Zoombo connection is a frame: a fixed-size header that
+ends in the payload length, then the payload. The handshake and wire
+version 1 use a bare !I length (PREFIX); versions 2 and 3 use
+protocol.HEADER.
+
+A FrameReader owns one growable bytearray per connection and fills it with
+`recv_into`, taking as much as the socket has ready. A read that brings in
+several audio or chat frames serves all of them without another syscall,
+and a 50 KB video frame lands in place instead of being concatenated from
+parts.
+
+Frames come back as memoryviews into that buffer. A view is valid until
+the next read on the same reader. Decrypting or json-decoding a view
+makes a new object anyway. Anything kept longer, such as a sealed frame
+queued to other members, must be copied out with bytes().
+
+On the way out, `send_all` writes a batch of frames with one sendmsg
+(scatter/gather) call instead of one sendall each, without joining them
+first. `limit_unsent` keeps the kernel's share of the backlog small so
+that the writer's priority order holds (outbound.py).
+"""
+
+import socket, struct, os
+
+PREFIX = struct.Struct("!I")
+MAX_FRAME = 16 << 20        # larger than any JPEG we send; a bigger length is a broken peer
+IOV_MAX = os.sysconf("SC_IOV_MAX") if hasattr(os, "sysconf") else 1024   # buffers per sendmsg
+
+
+def send_all(sock: socket.socket, buffers: list) -> int:
+    """
+    Write `buffers` back to back, in as few sendmsg calls as the socket allows:
+    one unless its send buffer fills up part way. Where sendmsg is missing
+    (Windows), they are joined and sent with sendall.
+    :returns: The number of send calls made.
+    """
+    if len(buffers) == 1 or not hasattr(sock, "sendmsg"):
+        sock.sendall(buffers[0] if len(buffers) == 1 else b"".join(buffers))
+        return 1
+    pending, first, calls = buffers, 0, 0
+    while True:
+        sent = sock.sendmsg(pending[first:first + IOV_MAX])
+        calls += 1
+        while first < len(pending) and sent >= len(pending[first]):
+            sent -= len(pending[first])
+            first += 1
+        if first == len(pending):
+            return calls
+        if sent:
+            # Partly written: carry on from a view past what went out (on a copy of the caller's list).
+            pending = pending if pending is not buffers else list(buffers)
+            pending[first] = memoryview(pending[first])[sent:]
+
+def limit_unsent(sock: socket.socket, nbytes: int):
+    """
+    Let the kernel hold only about `nbytes` of not-yet-sent data for `sock`
+    (TCP_NOTSENT_LOWAT). Writes then wait in the writer's own queue, where
+    audio can still overtake video, not in the socket buffer. In-flight data
+    is not limited, so throughput is unaffected. Does nothing where the
+    option is missing, or for 0.
+    """
+    option = getattr(socket, "TCP_NOTSENT_LOWAT", None)    # Linux, macOS
+    if nbytes and option is not None:
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, option, nbytes)
+        except OSError:
+            pass    # not TCP (e.g. a Unix socket in tests)
+
+
+class FrameReader:
+    def __init__(self, sock: socket.socket, size: int = 64 * 1024, pending: bytes = b""):
+        """
+        :param size: Initial buffer size; it grows to fit the largest frame seen.
+        :param pending: Bytes already read off `sock` by a previous reader (shard hand-off).
+        """
+        self.sock = sock
+        self._buf = bytearray(max(size, len(pending)))
+        self._view = memoryview(self._buf)
+        self._buf[:len(pending)] = pending
+        self._start, self._end = 0, len(pending)    # unread bytes are _buf[_start:_end]
+        self._low = max(size // 16, 1)              # compact rather than recv into less than this
+        self.reads = 0                              # recv_into calls so far
+        self.partials: dict = {}                    # messages still arriving in fragments (protocol.reassemble)
+
+    def _fill(self, n: int):
+        """
+        Make sure at least `n` unread bytes are buffered.
+        """
+        if self._start == self._end:
+            self._start = self._end = 0
+        while self._end - self._start < n:
+            if self._start + n > len(self._buf) or (self._start and len(self._buf) - self._end < self._low):
+                self._make_room(n)
+            got = self.sock.recv_into(self._view[self._end:])
+            if not got:
+                raise ConnectionError
+            self._end += got
+            self.reads += 1
+
+    def _make_room(self, n: int):
+        unread = self._end - self._start
+        if n > len(self._buf):
+            # A new buffer rather than a resize: views handed out earlier pin the old one.
+            buf = bytearray(max(n, 2 * len(self._buf)))
+            buf[:unread] = self._view[self._start:self._end]
+            self._buf, self._view = buf, memoryview(buf)
+        else:
+            self._view[:unread] = self._view[self._start:self._end]
+        self._start, self._end = 0, unread
+
+    def read(self, n: int) -> memoryview:
+        """
+        The next `n` bytes.
+        """
+        self._fill(n)
+        view = self._view[self._start:self._start + n]
+        self._start += n
+        return view
+
+    def read_frame(self, header: struct.Struct = PREFIX) -> tuple[tuple, memoryview]:
+        """
+        One frame whose `header` ends in its payload length.
+        :returns: (parsed header, the whole frame, header included)
+        """
+        self._fill(header.size)
+        fields = header.unpack_from(self._buf, self._start)
+        if fields[-1] > MAX_FRAME:
+            raise ValueError(f"Frame of {fields[-1]} bytes")
+        return fields, self.read(header.size + fields[-1])
+
+    def read_prefixed(self) -> memoryview:
+        """
+        The payload of one !I length-prefixed frame.
+        """
+        _fields, frame = self.read_frame(PREFIX)
+        return frame[PREFIX.size:]
+
+    def pending(self) -> bytes:
+        """
+        Bytes received but not read yet, for whoever takes the socket over.
+        """
+        return bytes(self._view[self._start:self._end])
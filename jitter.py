@@ -0,0 +1,157 @@
+"""
+jitter.py – per-sender video jitter buffer, played out against the audio.
+
+Decoded frames wait here until their sender's playout clock reaches their
+timestamp; a GUI timer asks for what is `due` and shows it. The clock for
+a sender is "now minus how far behind that sender we play":
+  • while their audio is arriving, the lag their audio is played out at
+    (playout.PlayoutMixer.lag), so lips move with the voice being heard;
+  • otherwise (mic off, server-mixed audio) the frames' own arrival lag
+    plus twice its deviation, which absorbs network jitter without
+    drifting.
+Both are smoothed (EWMA, like the RTP jitter estimate).
+
+Of the frames that are due at a tick only the newest is shown; the rest
+are late and dropped. Each sender holds at most `max_frames`, and all
+senders together at most `max_bytes` of pixels. Past either limit the
+oldest frame goes. A sender's frames and clock go when `forget` is called
+on leave.
+"""
+
+import threading, collections, time
+
+GAIN = 1 / 16           # EWMA weight of a new sample
+AUDIO_FRESH = 1.0       # seconds an audio-driven clock stays valid without audio
+
+
+class _Clock:
+    __slots__ = ("lag", "dev", "at")
+
+    def __init__(self, lag: float, at: float):
+        self.lag, self.dev, self.at = lag, 0.0, at
+
+    def observe(self, lag: float, at: float):
+        self.dev += GAIN * (abs(lag - self.lag) - self.dev)
+        self.lag += GAIN * (lag - self.lag)
+        self.at = at
+
+
+class JitterBuffer:
+    def __init__(self, playout_delay: float, max_frames: int = 8, max_bytes: int = 64 << 20):
+        """
+        :param playout_delay: The lag for a sender we have no timing for yet (audio.PLAYOUT_DELAY).
+        :param max_frames: Frames held per sender.
+        :param max_bytes: Frame memory held across all senders.
+        """
+        self.playout_delay = playout_delay
+        self.max_frames, self.max_bytes = max_frames, max_bytes
+        self.shown = self.late = self.overflow = 0
+        self.bytes = 0
+        self._frames: dict[str, collections.deque] = {}     # sender -> (ts, frame), oldest first
+        self._audio: dict[str, _Clock] = {}
+        self._video: dict[str, _Clock] = {}
+        self._last: dict[str, float] = {}                    # sender -> ts of the last frame shown
+        self._lock = threading.Lock()
+
+    def push(self, sender: str, ts: float, frame, now: float | None = None):
+        """
+        A decoded frame from `sender`, captured at `ts` (the sender's time.time()).
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            if ts <= self._last.get(sender, 0.0):
+                self.late += 1
+                return
+            self._observe(self._video, sender, now - ts, now)
+            frames = self._frames.get(sender)
+            if frames is None:
+                frames = self._frames[sender] = collections.deque()
+            if frames and ts < frames[-1][0]:
+                # Out of order (UDP): keep the deque sorted.
+                frames.append((ts, frame))
+                self._frames[sender] = frames = collections.deque(sorted(frames, key=lambda f: f[0]))
+            else:
+                frames.append((ts, frame))
+            self.bytes += frame.nbytes
+            if len(frames) > self.max_frames:
+                self._drop(frames)
+            while self.bytes > self.max_bytes:
+                self._drop(min((q for q in self._frames.values() if q), key=lambda q: q[0][0]))
+
+    def audio(self, sender: str, lag: float, now: float | None = None):
+        """
+        An audio packet from `sender` went to the mixer, which plays it `lag` seconds after its timestamp.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._observe(self._audio, sender, lag, now)
+
+    @staticmethod
+    def _observe(clocks: dict, sender: str, lag: float, now: float):
+        clock = clocks.get(sender)
+        if clock is None:
+            clocks[sender] = _Clock(lag, now)
+        else:
+            clock.observe(lag, now)
+
+    def _drop(self, frames: collections.deque):
+        _ts, frame = frames.popleft()
+        self.bytes -= frame.nbytes
+        self.overflow += 1
+
+    def lag(self, sender: str, now: float | None = None) -> float:
+        """
+        How far behind `sender` we play, in seconds.
+        """
+        now = time.time() if now is None else now
+        audio = self._audio.get(sender)
+        if audio is not None and now - audio.at < AUDIO_FRESH:
+            return audio.lag
+        video = self._video.get(sender)
+        return video.lag + 2 * video.dev if video else self.playout_delay
+
+    def due(self, now: float | None = None) -> list[tuple[str, object]]:
+        """
+        :returns: (sender, frame) for each sender with a frame due by now: the newest
+                  such frame. Older due frames are dropped as late.
+        """
+        now = time.time() if now is None else now
+        out = []
+        with self._lock:
+            for sender, frames in self._frames.items():
+                position = now - self.lag(sender, now)
+                shown = None
+                while frames and frames[0][0] <= position:
+                    if shown is not None:
+                        self.late += 1
+                    shown = frames.popleft()
+                    self.bytes -= shown[1].nbytes
+                if shown is not None:
+                    self._last[sender] = shown[0]
+                    self.shown += 1
+                    out.append((sender, shown[1]))
+        return out
+
+    def forget(self, sender: str):
+        """
+        `sender` left: free their frames and clocks.
+        """
+        with self._lock:
+            frames = self._frames.pop(sender, ())
+            self.bytes -= sum(frame.nbytes for _ts, frame in frames)
+            for state in (self._audio, self._video, self._last):
+                state.pop(sender, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"senders": len(self._frames), "frames": sum(map(len, self._frames.values())),
+                    "bytes": self.bytes, "shown": self.shown, "late": self.late, "overflow": self.overflow,
+                    "lag_ms": {sender: round(self.lag(sender) * 1000, 1) for sender in self._frames}}
+
+    def report(self) -> str:
+        """
+        One line for the log, e.g. "2 senders, 3 frames (2.7 MB), 410 shown, 12 late, 0 overflow, lag {…} ms".
+        """
+        s = self.stats()
+        return (f"{s['senders']} senders, {s['frames']} frames ({s['bytes'] / 1e6:.1f} MB), {s['shown']} shown, "
+                f"{s['late']} late, {s['overflow']} overflow, lag {s['lag_ms']} ms")
@@ -0,0 +1,302 @@
+"""
+loadgen.py – headless synthetic participants for load-testing the relay server.
+
+Every participant speaks the real protocol (exchange_sym → register →
+create_room / join), then sends JPEG-sized frames, 20 ms audio chunks and
+the occasional chat line, while reading everything the server relays back.
+No camera, microphone or display is needed.
+
+Reported:
+  • connection setup rate and setup-time percentiles (handshake through room_joined)
+  • server throughput: messages and bytes per second sent into and relayed out of it
+  • end-to-end relay latency percentiles per media type, from the sender's
+    timestamp to arrival (both ends share this host's clock)
+
+Start a server first (python server.py), then e.g.:
+    python loadgen.py --rooms 50 --room-size 8 --duration 30
+    python loadgen.py --rooms 500 --room-size 4 --procs 4 --fps 5 --frame-bytes 8000
+    python loadgen.py --rooms 2 --room-size 1 --viewers 300     # town halls, via relays if configured
+
+With many participants per process the generator itself can become the
+bottleneck (watch its CPU); spread them with --procs.
+"""
+
+import argparse, asyncio, base64, itertools, json, multiprocessing, random, secrets, struct, time
+import protocol
+from encryption import generate_rsa_keypair, rsa_decrypt, generate_x25519_keypair, x25519_shared_key, CryptoSession
+
+SAMPLE_CAP = 200_000     # latency samples kept per type per process (reservoir)
+
+
+class Stats:
+    def __init__(self):
+        self.sent = self.sent_bytes = 0
+        self.received = self.received_bytes = 0
+        self.setup: list[float] = []
+        self.failed = 0
+        self.latency: dict[str, list[float]] = {"frame": [], "audio": []}
+        self._seen = {"frame": 0, "audio": 0}
+
+    def add_latency(self, kind: str, seconds: float):
+        samples = self.latency[kind]
+        self._seen[kind] += 1
+        if len(samples) < SAMPLE_CAP:
+            samples.append(seconds)
+        else:
+            i = random.randrange(self._seen[kind])
+            if i < SAMPLE_CAP:
+                samples[i] = seconds
+
+    def merge(self, other: dict):
+        for k in ("sent", "sent_bytes", "received", "received_bytes", "failed"):
+            setattr(self, k, getattr(self, k) + other[k])
+        self.setup += other["setup"]
+        for kind, samples in other["latency"].items():
+            self.latency[kind] += samples
+
+    def export(self) -> dict:
+        return {"sent": self.sent, "sent_bytes": self.sent_bytes, "received": self.received,
+                "received_bytes": self.received_bytes, "failed": self.failed,
+                "setup": self.setup, "latency": self.latency}
+
+
+def _json_frame(payload: dict) -> bytes:
+    data = json.dumps(payload).encode()
+    return struct.pack("!I", len(data)) + data
+
+
+class Participant:
+    def __init__(self, opts, keypair, stats: Stats):
+        self.opts, (self.pub, self.priv), self.stats = opts, keypair, stats
+        self._seq = itertools.count()
+        self.media_key = None
+        self.presenter_token = None     # lets a join into a broadcast room present
+
+    async def connect(self, room_code: str | None, viewer: bool = False) -> str:
+        t0 = time.perf_counter()
+        addr = (self.opts.host, self.opts.port)
+        while True:
+            await self._handshake(*addr)
+            if room_code is None:
+                self.send({"type": "create_room", "user_id": self.user_id, "broadcast": self.opts.viewers > 0})
+                created = await self.recv_control()
+                room_code, self.presenter_token = created["room_code"], created.get("presenter_token")
+            self.send({"type": "join", "room_code": room_code, "presenter": None if viewer else self.presenter_token,
+                       "room_key": self.opts.room_key and self.wire >= protocol.WIRE_V2})
+            while True:
+                msg = await self.recv_control()
+                if msg["type"] == "reject":
+                    raise ConnectionError(msg.get("reason"))
+                if msg["type"] in ("room_joined", "redirect"):
+                    break
+            if msg["type"] == "room_joined":
+                break
+            # Broadcast viewers are sent on to a relay node (relay.py).
+            self.writer.close()
+            addr = (msg["host"], msg["port"])
+        if msg.get("media_key"):
+            self.media_key = bytes.fromhex(msg["media_key"])
+        self.stats.setup.append(time.perf_counter() - t0)
+        return room_code
+
+    async def _handshake(self, host: str, port: int):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        if self.opts.kex == "x25519":
+            public, private = generate_x25519_keypair()
+            hello = {"type": "exchange_sym", "x25519": public.hex()}
+        else:
+            hello = {"type": "exchange_sym", "public_key": self.pub}
+        if self.opts.wire > protocol.WIRE_V1:
+            hello["wire"] = [self.opts.wire]
+        self.writer.write(_json_frame(hello))
+        (ln,) = struct.unpack("!I", await self.reader.readexactly(4))
+        resp = json.loads(await self.reader.readexactly(ln))
+        if self.opts.kex == "x25519":
+            server_public = bytes.fromhex(resp["x25519"])
+            self.key = x25519_shared_key(private, server_public, public + server_public)
+        else:
+            self.key = rsa_decrypt(base64.b64decode(resp["sym_key"]), self.priv)
+        self.nonce = bytes.fromhex(resp["nonce"])
+        self.wire = resp.get("wire", protocol.WIRE_V1)
+        self.crypto = CryptoSession(self.key, self.nonce, protocol.TO_SERVER)
+        self.stream_id = 0
+
+        self.send({"type": "register", "name": "loadgen"})
+        reg = await self.recv_control()
+        self.user_id, self.stream_id = reg["user_id"], reg.get("stream_id", 0)
+
+    def send(self, msg: dict):
+        data = protocol.pack(msg, self.key, self.nonce, self.wire, self.stream_id, next(self._seq),
+                             self.media_key if msg.get("type") in protocol.MEDIA_KINDS else None, self.crypto)
+        self.writer.write(data)
+        return len(data)
+
+    async def _read(self) -> tuple[dict | None, str | None, float, int]:
+        """
+        One message off the wire: (decoded control message or None, media type, media ts, size).
+        v2 media is timed from its cleartext header and never decrypted.
+        """
+        if self.wire == protocol.WIRE_V1:
+            (ln,) = struct.unpack("!I", await self.reader.readexactly(4))
+            msg = protocol.unpack_v1(await self.reader.readexactly(ln), self.key, self.nonce, self.crypto)
+            kind = msg.get("type")
+            if kind in protocol.MEDIA_KINDS:
+                return None, kind, msg["ts"], ln + 4
+            return msg, None, 0.0, ln + 4
+        size = 0
+        while True:
+            raw = await self.reader.readexactly(protocol.HEADER.size)
+            header = protocol.HEADER.unpack(raw)
+            payload = await self.reader.readexactly(header[-1])
+            size += len(raw) + len(payload)
+            # v4 media fragments only add to the size; a frame is timed when its last one arrives.
+            if not header[2] & protocol.FLAG_MORE:
+                break
+        if header[1] in protocol.KIND_TYPES:
+            return None, protocol.KIND_TYPES[header[1]], header[5], size
+        return protocol.unpack_v2(header, payload, self.key, self.nonce, session=self.crypto), None, 0.0, size
+
+    async def recv_control(self) -> dict:
+        while True:
+            msg, _kind, _ts, _size = await self._read()
+            if msg is not None:
+                return msg
+
+    async def recv_loop(self):
+        try:
+            while True:
+                _msg, kind, ts, size = await self._read()
+                self.stats.received += 1
+                self.stats.received_bytes += size
+                if kind:
+                    self.stats.add_latency(kind, time.time() - ts)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+    async def _pace(self, interval: float, until: float, make_msg):
+        # Fixed-rate sender with a random phase, so participants don't all fire on the same tick.
+        deadline = time.monotonic() + random.uniform(0, interval)
+        while deadline < until:
+            await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+            self.stats.sent_bytes += self.send(make_msg())
+            self.stats.sent += 1
+            deadline += interval
+            await self.writer.drain()
+
+    async def traffic(self, until: float, video: bool, frame: bytes, pcm: bytes):
+        o, senders = self.opts, []
+        if video and o.fps:
+            senders.append(self._pace(1 / o.fps, until, lambda: {
+                "type": "frame", "from": self.user_id, "name": "loadgen", "ts": time.time(), "data": frame}))
+        if o.audio_ms:
+            senders.append(self._pace(o.audio_ms / 1000, until, lambda: {
+                "type": "audio", "from": self.user_id, "name": "loadgen", "ts": time.time(),
+                "level": 100, "data": pcm}))
+        if o.chat_every:
+            senders.append(self._pace(o.chat_every, until, lambda: {
+                "type": "chat", "from": self.user_id, "name": "loadgen", "text": "load test"}))
+        await asyncio.gather(*senders)
+
+
+# ───────────────────── one process ───────────────────
+async def _run_rooms(opts, rooms: int) -> dict:
+    keypair = generate_rsa_keypair()
+    stats = Stats()
+    frame, pcm = secrets.token_bytes(opts.frame_bytes), secrets.token_bytes(opts.audio_bytes)
+    sem = asyncio.Semaphore(opts.concurrency)
+
+    async def join(code, viewer=False, token=None):
+        async with sem:
+            p = Participant(opts, keypair, stats)
+            p.presenter_token = token
+            try:
+                return p, await p.connect(code, viewer)
+            except (OSError, ConnectionError, asyncio.IncompleteReadError):
+                stats.failed += 1
+                return None, code
+
+    async def room():
+        first, code = await join(None)
+        if first is None:
+            return [], []
+        others = (join(code, token=first.presenter_token) for _ in range(opts.room_size - 1))
+        members = [first] + [p for p, _ in await asyncio.gather(*others)]
+        viewers = [p for p, _ in await asyncio.gather(*(join(code, True) for _ in range(opts.viewers)))]
+        return [p for p in members if p is not None], [p for p in viewers if p is not None]
+
+    t0 = time.perf_counter()
+    rooms_joined = await asyncio.gather(*(room() for _ in range(rooms)))
+    members = [(p, i < opts.video_senders) for r, _ in rooms_joined for i, p in enumerate(r)]
+    viewers = [p for _, v in rooms_joined for p in v]
+    setup_wall = time.perf_counter() - t0
+
+    readers = [asyncio.create_task(p.recv_loop()) for p in [p for p, _ in members] + viewers]
+    until = time.monotonic() + opts.duration
+    t0 = time.perf_counter()
+    await asyncio.gather(*(p.traffic(until, video, frame, pcm) for p, video in members))
+    await asyncio.sleep(0.5)     # let in-flight relays land
+    elapsed = time.perf_counter() - t0
+    for p in [p for p, _ in members] + viewers:
+        p.writer.close()
+    for r in readers:
+        r.cancel()
+    return {**stats.export(), "setup_wall": setup_wall, "elapsed": elapsed}
+
+
+def _process(opts, rooms: int) -> dict:
+    return asyncio.run(_run_rooms(opts, rooms))
+
+
+# ───────────────────── reporting ─────────────────────
+def _pct(samples: list[float], q: float) -> float:
+    return samples[min(len(samples) - 1, int(q * len(samples)))] * 1000 if samples else float("nan")
+
+def report(results: list[dict]):
+    total = Stats()
+    for r in results:
+        total.merge(r)
+    setup_wall = max(r["setup_wall"] for r in results)
+    elapsed = max(r["elapsed"] for r in results)
+    conns = len(total.setup)
+    setup = sorted(total.setup)
+    print(f"setup:   {conns} participants in {setup_wall:.1f} s = {conns / setup_wall:.0f} conns/s"
+          f" ({total.failed} failed); per connection p50 {_pct(setup, .5):.1f} ms,"
+          f" p99 {_pct(setup, .99):.1f} ms")
+    print(f"traffic: in  {total.sent / elapsed:,.0f} msgs/s, {total.sent_bytes / elapsed / 1e6:.1f} MB/s")
+    print(f"         out {total.received / elapsed:,.0f} msgs/s, {total.received_bytes / elapsed / 1e6:.1f} MB/s")
+    for kind, samples in total.latency.items():
+        if samples:
+            samples.sort()
+            print(f"latency {kind:>5} ms: p50 {_pct(samples, .5):.1f}  p90 {_pct(samples, .9):.1f}"
+                  f"  p99 {_pct(samples, .99):.1f}  p99.9 {_pct(samples, .999):.1f}  max {samples[-1] * 1000:.1f}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=5000)
+    ap.add_argument("--rooms", type=int, default=10)
+    ap.add_argument("--room-size", type=int, default=4)
+    ap.add_argument("--video-senders", type=int, default=4, help="participants per room that send video")
+    ap.add_argument("--viewers", type=int, default=0,
+                    help="receive-only viewers per room; makes the rooms broadcast rooms (see relay.py)")
+    ap.add_argument("--fps", type=float, default=15)
+    ap.add_argument("--frame-bytes", type=int, default=20_000)
+    ap.add_argument("--audio-ms", type=float, default=20, help="audio cadence; 0 disables audio")
+    ap.add_argument("--audio-bytes", type=int, default=640)
+    ap.add_argument("--chat-every", type=float, default=0, help="seconds between chat lines; 0 disables")
+    ap.add_argument("--duration", type=float, default=20)
+    ap.add_argument("--wire", type=int, choices=protocol.SUPPORTED, default=protocol.WIRE_V2)
+    ap.add_argument("--room-key", action="store_true", help="seal media with the room key (wire 2+)")
+    ap.add_argument("--kex", choices=("x25519", "rsa"), default="x25519", help="key exchange in exchange_sym")
+    ap.add_argument("--concurrency", type=int, default=64, help="handshakes in flight per process")
+    ap.add_argument("--procs", type=int, default=1)
+    opts = ap.parse_args()
+
+    shares = [opts.rooms // opts.procs + (i < opts.rooms % opts.procs) for i in range(opts.procs)]
+    if opts.procs == 1:
+        results = [_process(opts, opts.rooms)]
+    else:
+        with multiprocessing.Pool(opts.procs) as pool:
+            results = pool.starmap(_process, [(opts, n) for n in shares if n])
+    report(results)
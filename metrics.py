@@ -0,0 +1,226 @@
+"""
+metrics.py – relay server metrics and a Prometheus-style HTTP endpoint.
+
+Hot paths (the relay loop, writers, protocol codec) only touch counters
+owned by the calling thread – no locks, no shared writes – and the shards
+are summed when /metrics is scraped. Gauges such as room sizes and queue
+depths are read from the live server objects at scrape time instead.
+
+A scrape leaves out series of rooms that are gone, but never deletes from
+a live shard: it only publishes the set of live rooms, and each thread
+drops its own dead rooms' series the next time it records something.
+
+Enable with "METRICS_PORT" in settings/server_settings.json (0 turns it off);
+the endpoint binds METRICS_HOST, 127.0.0.1 by default.
+"""
+
+import threading, bisect, collections
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket upper bounds, seconds.
+BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+           0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# name -> (type, help, label names). Series labelled by "room" are dropped once the room is gone.
+SPECS = {
+    "zoombo_connections_opened_total": ("counter", "Connections accepted.", ()),
+    "zoombo_connections_closed_total": ("counter", "Connections closed.", ()),
+    "zoombo_messages_total": ("counter", "Messages received for relay, by room and type.", ("room", "type")),
+    "zoombo_bytes_total": ("counter", "Media payload bytes received for relay, by room and type.", ("room", "type")),
+    "zoombo_handshake_seconds": ("histogram", "Key exchange and registration time.", ()),
+    "zoombo_codec_seconds": ("histogram", "Per-message JSON and AES time.", ("stage",)),
+    "zoombo_broadcast_seconds": ("histogram", "Time to fan one message out to a room's send queues.", ()),
+    "zoombo_queue_wait_seconds": ("histogram", "Time a message waits in a member's send queue.", ()),
+    "zoombo_messages_sent_total": ("counter", "Messages written to member sockets.", ()),
+    "zoombo_send_calls_total": ("counter", "Socket send calls the writers made for them (one per coalesced batch).", ()),
+    "zoombo_record_dropped_total": ("counter", "Media messages left out of a recording because its writer was behind.", ("room",)),
+}
+# "type" label values; anything else a client sends is counted as "other".
+MESSAGE_TYPES = {"frame", "audio", "chat", "mute", "camera", "peer", "status", "leave"}
+
+
+class Metrics:
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: list[tuple[threading.Thread, dict, dict]] = []
+        self._retired = (collections.Counter(), {})     # folded-in shards of finished threads
+        self._lock = threading.Lock()                   # guards shard registration, not updates
+        self._live_rooms = None                         # as of the last scrape; None keeps every room
+        self._epoch = 0                                 # bumped with each new _live_rooms
+
+    def _shard(self) -> tuple[collections.Counter, dict]:
+        local = self._local
+        try:
+            shard = local.shard
+        except AttributeError:
+            shard = local.shard = (collections.Counter(), {})
+            local.epoch = self._epoch
+            with self._lock:
+                self._shards.append((threading.current_thread(), *shard))
+            return shard
+        if local.epoch != self._epoch:
+            # A scrape saw rooms close since we last looked; only this thread writes its shard.
+            local.epoch, live_rooms = self._epoch, self._live_rooms
+            _prune(shard[0], live_rooms)
+            _prune(shard[1], live_rooms)
+        return shard
+
+    def inc(self, name: str, labels: tuple = (), n: int = 1):
+        self._shard()[0][name, labels] += n
+
+    def observe(self, name: str, seconds: float, labels: tuple = ()):
+        hists = self._shard()[1]
+        h = hists.get((name, labels))
+        if h is None:
+            h = hists[name, labels] = [0] * (len(BUCKETS) + 1) + [0.0]   # bucket counts…, sum
+        h[bisect.bisect_left(BUCKETS, seconds)] += 1
+        h[-1] += seconds
+
+    def timer(self, name: str, labels: tuple = ()):
+        """
+        Callback(seconds) that records into histogram `name`.
+        """
+        return lambda seconds: self.observe(name, seconds, labels)
+
+    def collect(self, live_rooms=None) -> tuple[collections.Counter, dict]:
+        """
+        Sum every thread's shard.
+        :param live_rooms: If given, room-labelled series of other rooms are discarded.
+        """
+        with self._lock:
+            alive = []
+            for thread, counters, hists in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, counters, hists))
+                else:
+                    _merge(self._retired, counters.copy(), hists.copy())
+            self._shards = alive
+            if live_rooms is not None:
+                live_rooms = frozenset(live_rooms)
+                _prune(self._retired[0], live_rooms)
+                _prune(self._retired[1], live_rooms)
+                if live_rooms != self._live_rooms:
+                    self._live_rooms, self._epoch = live_rooms, self._epoch + 1
+            counters, hists = collections.Counter(), {}
+            _merge((counters, hists), *self._retired)
+            shards = [(c, h) for _t, c, h in alive]
+        for c, h in shards:
+            # Copies: the owning threads keep writing, and prune their own shards.
+            c, h = c.copy(), h.copy()
+            if live_rooms is not None:
+                _prune(c, live_rooms)
+                _prune(h, live_rooms)
+            _merge((counters, hists), c, h)
+        return counters, hists
+
+
+def _merge(into: tuple[collections.Counter, dict], counters: dict, hists: dict):
+    into[0].update(counters)
+    for key, h in hists.items():
+        total = into[1].get(key)
+        if total is None:
+            into[1][key] = list(h)
+        else:
+            for i, v in enumerate(h):
+                total[i] += v
+
+def _prune(series: dict, live_rooms):
+    if live_rooms is None:
+        return
+    for key in list(series):
+        name, labels = key
+        if "room" in SPECS[name][2] and labels[0] not in live_rooms:
+            series.pop(key, None)
+
+
+METRICS = Metrics()
+
+
+# ───────────────────── exposition ────────────────────
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, values)) + "}"
+
+def render(server) -> str:
+    """
+    Prometheus text format for `server` (a server.Server) and the global METRICS.
+    """
+    with server._lock:
+        rooms = dict(server.rooms)
+    counters, hists = METRICS.collect(rooms)
+    out = []
+
+    for name, (kind, help_, label_names) in SPECS.items():
+        out += [f"# HELP {name} {help_}", f"# TYPE {name} {kind}"]
+        if kind == "counter":
+            for (n, labels), v in sorted(counters.items()):
+                if n == name:
+                    out.append(f"{name}{_labels(label_names, labels)} {v}")
+            continue
+        for (n, labels), h in sorted(hists.items()):
+            if n != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), h):
+                cumulative += count
+                le = _labels(label_names + ("le",), labels + (bound,))
+                out.append(f"{name}_bucket{le} {cumulative}")
+            out.append(f"{name}_sum{_labels(label_names, labels)} {h[-1]}")
+            out.append(f"{name}_count{_labels(label_names, labels)} {cumulative}")
+
+    opened = counters["zoombo_connections_opened_total", ()]
+    closed = counters["zoombo_connections_closed_total", ()]
+    out += ["# TYPE zoombo_connections gauge", f"zoombo_connections {opened - closed}",
+            "# TYPE zoombo_rooms gauge", f"zoombo_rooms {len(rooms)}",
+            "# TYPE zoombo_room_members gauge"]
+    out += [f'zoombo_room_members{{room="{code}"}} {len(room.clients)}' for code, room in rooms.items()]
+
+    # Per-client send queue and bandwidth estimate, labelled by stream id.
+    per_client = [(code, c) for code, room in rooms.items() for c in room.members()]
+    for gauge, read in (("zoombo_queue_depth", lambda c: len(c.outbox)),
+                        ("zoombo_queue_bytes", lambda c: c.outbox.queued_bytes),
+                        ("zoombo_bwe_target_bps", lambda c: c.bwe.target_bps)):
+        out.append(f"# TYPE {gauge} gauge")
+        out += [f'{gauge}{{room="{code}",client="{c.stream_id}"}} {read(c)}' for code, c in per_client]
+    out.append("# TYPE zoombo_queue_dropped_total counter")
+    for code, c in per_client:
+        dropped = collections.Counter()
+        for kind, n in dict(c.outbox.dropped).items():
+            dropped[kind if kind in MESSAGE_TYPES else "other"] += n
+        for kind, n in dropped.items():
+            out.append(f'zoombo_queue_dropped_total{{room="{code}",client="{c.stream_id}",type="{kind}"}} {n}')
+
+    out.append("# TYPE zoombo_mixer_seconds_per_tick gauge")
+    for code, room in rooms.items():
+        if room.mixer:
+            out.append(f'zoombo_mixer_seconds_per_tick{{room="{code}"}} {room.mixer.stats()["mix_us_per_tick"] / 1e6}')
+    out.append("# TYPE zoombo_record_queue_depth gauge")
+    out += [f'zoombo_record_queue_depth{{room="{code}"}} {room.recorder.stats()["queued"]}'
+            for code, room in rooms.items() if room.recorder]
+    return "\n".join(out) + "\n"
+
+
+def serve_metrics(server, host: str, port: int) -> ThreadingHTTPServer:
+    """
+    Serve GET /metrics for `server` from a daemon thread.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = render(server).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass   # one line per scrape is just noise
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
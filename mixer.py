@@ -0,0 +1,108 @@
+"""
+mixer.py – server-side audio mixing (MCU mode).
+
+With AUDIO_MIX_MODE on, a room's audio packets are not relayed one by one.
+Each speaker's 20 ms int16 PCM is queued here, and on every 20 ms tick the
+room mixer sums the current frame of every speaker and sends each member
+one packet: the sum minus their own voice. Downstream audio is then one
+packet per tick per member, however many people are talking.
+"""
+
+import threading, collections, time, asyncio
+import numpy as np
+import protocol
+
+RATE  = 16_000        # matches audio.py
+CHUNK = 320           # samples per 20 ms frame
+FRAME_BYTES = CHUNK * 2
+TICK = CHUNK / RATE
+
+
+class RoomMixer:
+    def __init__(self, room, max_pending: int = 5):
+        self.room = room
+        self.max_pending = max_pending      # frames buffered per speaker (jitter slack)
+        self._pending: dict[str, collections.deque] = {}
+        self._lock = threading.Lock()
+        self._running = True
+        self.ticks = 0
+        self.mix_seconds = 0.0              # CPU spent inside mix(), for stats
+
+    def push(self, user_id: str, pcm: bytes):
+        # Mute markers and odd-sized packets aren't audio; skip them.
+        if len(pcm) != FRAME_BYTES:
+            return
+        with self._lock:
+            q = self._pending.get(user_id)
+            if q is None:
+                q = self._pending[user_id] = collections.deque(maxlen=self.max_pending)
+            q.append(pcm)
+
+    def forget(self, user_id: str):
+        with self._lock:
+            self._pending.pop(user_id, None)
+
+    def mix(self, members: list[str]) -> dict[str, bytes]:
+        """
+        Take one frame from every speaker and mix it for each of `members`.
+        :returns: user id -> mixed PCM, for members that have anyone else to hear.
+        """
+        with self._lock:
+            frames = {uid: q.popleft() for uid, q in self._pending.items() if q}
+        if not frames:
+            return {}
+        t0 = time.perf_counter()
+
+        row = {uid: i for i, uid in enumerate(members)}
+        own = np.zeros((len(members), CHUNK), dtype=np.int32)
+        total = np.zeros(CHUNK, dtype=np.int32)
+        for uid, pcm in frames.items():
+            samples = np.frombuffer(pcm, dtype=np.int16)
+            total += samples
+            if uid in row:
+                own[row[uid]] = samples
+
+        mixes = total - own                 # everyone hears everyone but themselves
+        # Clipping protection: scale a row down to full scale instead of hard-clipping it.
+        peak = np.abs(mixes).max(axis=1, keepdims=True)
+        mixes = np.where(peak > 32767, mixes * (32767 / np.maximum(peak, 1)), mixes)
+        out = np.clip(mixes, -32768, 32767).astype(np.int16)
+
+        alone = len(frames) == 1
+        result = {uid: out[i].tobytes() for uid, i in row.items()
+                  if not (alone and uid in frames)}
+        self.mix_seconds += time.perf_counter() - t0
+        self.ticks += 1
+        return result
+
+    def tick(self):
+        members = {c.user_id: c for c in self.room.members()}
+        ts = time.time()
+        for uid, pcm in self.mix(list(members)).items():
+            members[uid].send({"type": "audio", "from": protocol.MIX_SENDER, "name": protocol.MIX_SENDER,
+                               "stream_id": protocol.MIX_STREAM_ID, "ts": ts, "data": pcm})
+
+    # ── drivers: one per server engine ──────────────────
+    def run_forever(self):
+        deadline = time.monotonic()
+        while self._running:
+            deadline += TICK
+            self.tick()
+            time.sleep(max(0.0, deadline - time.monotonic()))
+
+    async def run_async(self):
+        deadline = time.monotonic()
+        while self._running:
+            deadline += TICK
+            self.tick()
+            await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+
+    def stop(self):
+        self._running = False
+
+    def stats(self) -> dict:
+        return {
+            "speakers": len(self._pending),
+            "ticks": self.ticks,
+            "mix_us_per_tick": self.mix_seconds / self.ticks * 1e6 if self.ticks else 0.0,
+        }
@@ -0,0 +1,244 @@
+"""
+outbound.py – bounded per-connection send queue.
+
+`Room.broadcast` only enqueues into each member's OutboundQueue; a writer
+owned by that member drains it onto the socket. A slow peer therefore only
+fills its own queue instead of stalling the room.
+
+Messages leave in priority order, not arrival order:
+    control (join/leave, layout, status, …)  >  audio  >  video  >  chat
+Within a class they stay first in, first out. A video frame that the
+writer sends in fragments (wire v4) has its unsent rest put back with
+`resume`. That rest goes out next within its class, so audio and control
+queued meanwhile still overtake it between fragments. Messages the writer
+took but could not send go back with `requeue`, at the head of their class.
+
+When a queue is full the drop policy decides what goes:
+    "video_first"  evict the oldest queued video frame (stale video goes
+                   first). Audio and control are never dropped unless the
+                   peer stops reading altogether and the queue reaches
+                   `hard_limit`.
+    "oldest"       evict whatever has been queued longest.
+    "newest"       refuse the incoming message.
+A partly sent frame is never evicted.
+"""
+
+import threading, collections, time, itertools
+
+DROPPABLE = {"frame"}
+POLICIES = ("video_first", "oldest", "newest")
+
+# Priority classes, most urgent first.
+CONTROL, AUDIO, VIDEO, BULK = range(4)
+CLASSES = {"audio": AUDIO, "frame": VIDEO, "chat": BULK}     # anything else is CONTROL
+
+
+def payload_size(msg: dict) -> int:
+    # Payload bytes, for backlog accounting; control messages are small enough to count as 0.
+    return msg.get("size") or len(msg.get("sealed") or msg.get("data") or b"")
+
+def priority(msg: dict) -> int:
+    return CLASSES.get(msg.get("type"), CONTROL)
+
+
+class OutboundQueue:
+    def __init__(self, maxsize: int = 32, policy: str = "video_first", hard_limit: int | None = None,
+                 observe_wait=None, prioritize: bool = True):
+        """
+        :param prioritize: False sends everything in arrival order (one class).
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown drop policy {policy!r}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.hard_limit = hard_limit or maxsize * 4
+        self.prioritize = prioritize
+        self.dropped = collections.Counter()   # message type -> count
+        self.sent = 0
+        self.high_water = 0
+        self.queued_bytes = 0
+        self.observe_wait = observe_wait       # optional callback(seconds queued), per message sent
+        self._q = [collections.deque() for _ in range(BULK + 1)]   # per class: (message, enqueue time, order)
+        self._order = itertools.count()        # arrival order across classes, for "oldest"
+        self._resumed = None                   # rest of a partly sent message, (message, class)
+        self._len = 0
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def __len__(self):
+        return self._len
+
+    def _class(self, msg: dict) -> int:
+        return priority(msg) if self.prioritize else CONTROL
+
+    def put(self, msg: dict) -> bool:
+        """
+        Enqueue `msg`, applying the drop policy if the queue is full.
+        :returns: False if `msg` itself was dropped.
+        """
+        kind = msg.get("type")
+        with self._cond:
+            if self._closed:
+                return False
+            if self._len >= self.maxsize and not self._make_room(kind):
+                self.dropped[kind] += 1
+                return False
+            self._q[self._class(msg)].append((msg, time.perf_counter() if self.observe_wait else 0.0,
+                                              next(self._order)))
+            self._len += 1
+            self.queued_bytes += payload_size(msg)
+            self.high_water = max(self.high_water, self._len)
+            self._cond.notify()
+            return True
+
+    def resume(self, msg: dict):
+        """
+        Put back the unsent rest of a message the writer is sending in parts.
+        It is the next of its class to go, ahead of anything queued since, and
+        is never dropped. Only one message is partly sent at a time.
+        """
+        with self._cond:
+            self._resumed = (msg, self._class(msg))
+            self._len += 1
+            self.queued_bytes += payload_size(msg)
+            self._cond.notify()
+
+    def drop_resumed(self):
+        """
+        Forget a partly sent message, e.g. because the connection it was going out on broke.
+        """
+        with self._cond:
+            if self._resumed is not None:
+                self._len -= 1
+                self.queued_bytes -= payload_size(self._resumed[0])
+                self._resumed = None
+
+    def requeue(self, msgs: list[dict]):
+        """
+        Put back messages taken with `get_many` that never made it out, e.g. because
+        the connection broke mid-send. They go ahead of their class, in their
+        original order, so they are the first sent once the writer can send again.
+        """
+        with self._cond:
+            if self._closed:
+                return
+            for msg in reversed(msgs):
+                # Order -1: older than anything queued, as they were taken first.
+                self._q[self._class(msg)].appendleft((msg, time.perf_counter() if self.observe_wait else 0.0, -1))
+                self._len += 1
+                self.queued_bytes += payload_size(msg)
+            self._cond.notify()
+
+    def _make_room(self, kind) -> bool:
+        # Called with the lock held on a full queue. True if the new message may go in.
+        if self.policy == "newest":
+            return False
+        if self.policy == "oldest":
+            queue = min((q for q in self._q if q), key=lambda q: q[0][2], default=None)
+            if queue is None:
+                return False    # only a partly sent message is left
+            self._evict(queue, 0)
+            return True
+        for queue in self._q:
+            for i, (queued, _t, _n) in enumerate(queue):
+                if queued.get("type") in DROPPABLE:
+                    self._evict(queue, i)
+                    return True
+        # Nothing stale to evict: only let protected traffic overflow, and only so far.
+        return kind not in DROPPABLE and self._len < self.hard_limit
+
+    def _evict(self, queue: collections.deque, i: int):
+        queued, _t, _n = queue[i]
+        del queue[i]
+        self._len -= 1
+        self.queued_bytes -= payload_size(queued)
+        self.dropped[queued.get("type")] += 1
+
+    def get(self, timeout: float | None = None) -> dict | None:
+        """
+        Block until a message is available.
+        :returns: The most urgent message, or None once the queue is closed and drained.
+        """
+        with self._cond:
+            while not self._len and not self._closed:
+                if not self._cond.wait(timeout):
+                    return None
+            return self._pop()
+
+    def get_many(self, max_msgs: int = 64, max_bytes: int = 65536, window: float = 0.0,
+                 timeout: float | None = None, split: int = 0) -> list[dict]:
+        """
+        Block until a message is available, then take whatever is queued behind
+        it as well, for one vectored send. If the batch is still short of
+        `max_msgs` / `max_bytes`, wait up to `window` seconds after the first
+        message for more.
+        :param split: If set, a message with more payload than this ends the batch:
+                      the writer sends it in fragments and `resume`s the rest.
+        :returns: The batch, most urgent first; [] on timeout or once the queue is
+                  closed and drained.
+        """
+        with self._cond:
+            while not self._len and not self._closed:
+                if not self._cond.wait(timeout):
+                    return []
+            batch, size, deadline = [], 0, None
+            while len(batch) < max_msgs and size < max_bytes:
+                if not self._len:
+                    if window <= 0 or self._closed:
+                        break
+                    now = time.perf_counter()
+                    deadline = deadline or now + window
+                    if now >= deadline:
+                        break
+                    self._cond.wait(deadline - now)
+                    continue
+                msg = self._pop()
+                batch.append(msg)
+                size += payload_size(msg)
+                if split and payload_size(msg) > split:
+                    break
+            return batch
+
+    def get_nowait(self) -> dict | None:
+        with self._cond:
+            return self._pop()
+
+    def _pop(self):
+        if not self._len:
+            return None
+        self._len -= 1
+        resumed = self._resumed
+        for cls, queue in enumerate(self._q):
+            if resumed is not None and resumed[1] == cls:
+                self._resumed = None
+                self.queued_bytes -= payload_size(resumed[0])
+                return resumed[0]
+            if queue:
+                break
+        self.sent += 1
+        msg, queued_at, _n = queue.popleft()
+        self.queued_bytes -= payload_size(msg)
+        if self.observe_wait:
+            self.observe_wait(time.perf_counter() - queued_at)
+        return msg
+
+    def close(self):
+        """
+        Refuse further messages; the writer drains what is left and stops.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def stats(self) -> dict:
+        return {
+            "depth": self._len,
+            "queued_bytes": self.queued_bytes,
+            "high_water": self.high_water,
+            "sent": self.sent,
+            "dropped": dict(self.dropped),
+        }
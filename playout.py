@@ -0,0 +1,147 @@
+"""
+playout.py – client-side mixing of remote audio into one output stream.
+
+Every remote speaker's 20 ms int16 frames wait in a short buffer of their
+own. Once per tick the speaker thread asks for `mix()`: the frame that is
+due from each sender is scaled by that sender's gain and summed in int32,
+then saturated back to int16. The output stream gets exactly one frame per
+tick however many people talk at once, and silence when nobody does, so
+its clock never stalls. (Writing each sender's frames one after another
+took 60 ms of playback per 20 ms with three talking, and the queue
+overflowed.)
+
+Timestamps are the sender's time.time(), and their clock need not agree
+with ours. So each sender's frames are timed from their transit, our
+arrival time minus their timestamp. That includes any clock offset. The
+floor of the transit is tracked per sender: it drops at once to a smaller
+sample and rises slowly (TRANSIT_RISE) after clock drift or a route
+change. A frame stamped ts is due at ts + floor + PLAYOUT_DELAY, on our
+clock. That `lag` is what jitter.py syncs the sender's video to. Each
+sender buffers at most `max_pending` frames; past that the oldest goes.
+Anything that isn't a whole frame, such as the b"-1" mute marker, is
+ignored.
+
+`levels()` meters each sender after gain on the speakers.audio_level
+scale (0 … 127), smoothed, along with the mixed output.
+"""
+
+import threading, collections, time
+import numpy as np
+from speakers import audio_level
+
+RATE  = 16_000        # matches audio.py
+CHUNK = 320           # samples per 20 ms frame
+FRAME_BYTES = CHUNK * 2
+SILENCE = bytes(FRAME_BYTES)
+GAIN_BITS = 8         # gains are applied as Q8 fixed point
+MAX_GAIN = 4.0
+METER_SMOOTHING = 0.3
+TRANSIT_RISE = 1 / 64  # per frame: how fast a sender's transit floor follows later arrivals
+
+
+class PlayoutMixer:
+    def __init__(self, playout_delay: float, max_pending: int = 5):
+        """
+        :param playout_delay: Cushion between a frame's timestamp and playing it (audio.PLAYOUT_DELAY).
+        :param max_pending: Frames buffered per sender (jitter slack).
+        """
+        self.playout_delay = playout_delay
+        self.max_pending = max_pending
+        self.mixed = self.dropped = 0
+        self._pending: dict[str, collections.deque] = {}    # sender -> (due on our clock, pcm), oldest first
+        self._transit: dict[str, float] = {}                 # sender -> floor of arrival - ts, seconds
+        self._gains: dict[str, int] = {}                     # sender -> Q8 gain; 1.0 if absent
+        self._levels: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def push(self, sender: str, pcm: bytes, ts: float, now: float | None = None) -> bool:
+        """
+        Buffer one received frame, stamped `ts` by the sender.
+        :returns: False if it isn't a frame of audio.
+        """
+        if len(pcm) != FRAME_BYTES:
+            return False
+        now = time.time() if now is None else now
+        with self._lock:
+            transit, floor = now - ts, self._transit.get(sender)
+            if floor is None or transit < floor:
+                floor = transit
+            else:
+                floor += TRANSIT_RISE * (transit - floor)
+            self._transit[sender] = floor
+            q = self._pending.get(sender)
+            if q is None:
+                q = self._pending[sender] = collections.deque()
+            q.append((ts + floor + self.playout_delay, pcm))
+            if len(q) > self.max_pending:
+                q.popleft()
+                self.dropped += 1
+        return True
+
+    def set_gain(self, sender: str, gain: float):
+        """
+        Playback volume for `sender`: 0 mutes them, 1 leaves them as sent, up to MAX_GAIN.
+        """
+        self._gains[sender] = round(min(max(gain, 0.0), MAX_GAIN) * (1 << GAIN_BITS))
+
+    def gain(self, sender: str) -> float:
+        return self._gains.get(sender, 1 << GAIN_BITS) / (1 << GAIN_BITS)
+
+    def lag(self, sender: str) -> float:
+        """
+        How far behind `sender`'s timestamps their audio is played, in seconds on our clock.
+        """
+        return self._transit.get(sender, 0.0) + self.playout_delay
+
+    def forget(self, sender: str):
+        with self._lock:
+            self._pending.pop(sender, None)
+            self._transit.pop(sender, None)
+            self._levels.pop(sender, None)
+
+    def mix(self, now: float | None = None) -> bytes:
+        """
+        The next 20 ms of output: every sender's due frame, gained and summed.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            frames = {sender: q.popleft()[1] for sender, q in self._pending.items()
+                      if q and q[0][0] <= now}
+            for sender in self._levels.keys() - frames.keys() - {None}:
+                if sender in self._pending:
+                    self._meter(sender, 0)      # not talking: let the meter fall
+                else:
+                    del self._levels[sender]    # forgotten
+        if not frames:
+            self._meter(None, 0)
+            return SILENCE
+
+        total = np.zeros(CHUNK, dtype=np.int32)
+        unity = 1 << GAIN_BITS
+        for sender, pcm in frames.items():
+            samples = np.frombuffer(pcm, dtype=np.int16).astype(np.int32)
+            gain = self._gains.get(sender, unity)
+            if gain != unity:
+                samples = (samples * gain) >> GAIN_BITS
+            total += samples
+            self._meter(sender, audio_level(pcm if gain == unity
+                                            else np.clip(samples, -32768, 32767).astype(np.int16).tobytes()))
+        out = np.clip(total, -32768, 32767).astype(np.int16).tobytes()    # saturate, don't wrap
+        self._meter(None, audio_level(out))
+        self.mixed += 1
+        return out
+
+    def _meter(self, sender, level: int):
+        prev = self._levels.get(sender, 0.0)
+        self._levels[sender] = prev + METER_SMOOTHING * (level - prev)
+
+    def levels(self) -> dict:
+        """
+        Smoothed level per sender, 0 … 127; the key None is the mixed output.
+        """
+        return {sender: round(level) for sender, level in list(self._levels.items())}
+
+    def stats(self) -> dict:
+        with self._lock:
+            buffered = {sender: len(q) for sender, q in self._pending.items()}
+        return {"mixed": self.mixed, "dropped": self.dropped, "buffered": buffered, "levels": self.levels()}
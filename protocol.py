@@ -0,0 +1,346 @@
+"""
+protocol.py – encrypted message framing shared by server.py and client.py.
+
+Two wire versions exist, chosen per connection during `exchange_sym`:
+
+Version 1 (JSON envelope, what old clients speak):
+    !I length + {"type": "aes_blob", "data": base64(AES(json(msg)))}
+    Media bytes inside `msg` are base64'd once more.
+
+Version 2 (binary):
+    HEADER + AES(payload)
+    HEADER = version, kind, flags, stream id, seq, timestamp, payload length
+    Media payloads are the raw JPEG / PCM bytes; everything else is json(msg).
+
+Version 3: version 2 framing, but every session-key payload gets its own
+CTR nonce – the direction plus the header's seq – instead of the
+connection's fixed nonce, so no two messages reuse keystream. Both ends
+keep an `encryption.CryptoSession` for it. Room-key frames are the same in
+2 and 3 (header version 2), so they still forward to version 2 members.
+
+Version 4: version 3, plus media frames may arrive in fragments so that a
+large video frame doesn't hold up the audio and control queued behind it.
+A whole frame (header + encrypted payload, as above) is cut into pieces of
+the payload, each with a copy of the header carrying that piece's length;
+all but the last have FLAG_MORE set. The receiver joins the pieces again
+before decrypting (`reassemble`). Other messages can come in between
+fragments, but another fragmented message of the same kind and stream
+never does. Headers and keys are as in 3.
+
+The client offers the versions it speaks in `exchange_sym` ("wire": [1, 2, 3, 4]);
+the server answers with the one it picked in `exchange_sym_response`
+("wire": 4). A peer that says nothing speaks version 1.
+
+Room key (v2 only): a client that asks for it in `join` receives the room's
+shared media key in `room_joined`. It then encrypts its own frame/audio
+payloads with that key (FLAG_ROOM_KEY, nonce = stream id + seq) and the
+server forwards them byte-for-byte to other room-key members, looking only
+at the cleartext header. Control and chat stay on the per-connection key.
+
+In memory a message is always a dict. Media messages ("frame", "audio")
+carry their payload as raw bytes in "data" regardless of wire version.
+"""
+
+import json, struct, base64, socket, time, functools
+from encryption import aes_encrypt, CryptoSession
+from framing import FrameReader, MAX_FRAME
+
+WIRE_V1 = 1
+WIRE_V2 = 2
+WIRE_V3 = 3
+WIRE_V4 = 4
+SUPPORTED = (WIRE_V1, WIRE_V2, WIRE_V3, WIRE_V4)
+
+# Direction of a v3 message, part of its nonce: both ends count seq from 0.
+TO_SERVER, TO_CLIENT = 0, 1
+
+# version, kind, flags, stream id, seq, timestamp, payload length (24 bytes)
+HEADER = struct.Struct("!BBHIIdI")
+
+FLAG_ROOM_KEY = 0x0001   # payload is sealed with the room's media key
+FLAG_MORE     = 0x1000   # v4: a fragment, more of the same message follows
+# Simulcast: flags bits 8-9 hold the frame's layer, bits 10-11 the sender's layer count - 1.
+# Layer 0 is full resolution; layer i is scaled down by 2**i.
+LAYER_SHIFT, LAYERS_SHIFT, LAYER_MASK = 8, 10, 0x3
+MAX_LAYERS = LAYER_MASK + 1
+# Audio: flags bits 1-7 hold the sender's loudness, 0 (silence) … 127 (full scale), so the
+# server can pick active speakers without decrypting room-key audio.
+LEVEL_SHIFT, LEVEL_MASK = 1, 0x7F
+
+KIND_JSON  = 0
+KIND_FRAME = 1
+KIND_AUDIO = 2
+
+# Server-mixed audio (MCU mode) comes from this reserved stream; real streams start at 1.
+MIX_STREAM_ID = 0
+MIX_SENDER = "mix"
+
+MEDIA_KINDS = {"frame": KIND_FRAME, "audio": KIND_AUDIO}
+KIND_TYPES  = {v: k for k, v in MEDIA_KINDS.items()}
+
+# Optional callback(stage, seconds) timing the "json" and "aes" steps; the server's metrics set it.
+observe = None
+
+
+def _timed(stage: str, fn, *args):
+    if observe is None:
+        return fn(*args)
+    t0 = time.perf_counter()
+    out = fn(*args)
+    observe(stage, time.perf_counter() - t0)
+    return out
+
+def _dumps(msg: dict) -> bytes:
+    return json.dumps(msg).encode()
+
+def _crypt(data: bytes, sym_key: bytes, nonce: bytes, session: CryptoSession | None = None, output=None):
+    # Fixed-nonce AES-CTR (wire 1 and 2), through the connection's session if it has one.
+    if session is not None:
+        return session.crypt(data, nonce, output)
+    enc = aes_encrypt(data, sym_key, nonce)
+    if output is None:
+        return enc
+    output[:] = enc
+    return output
+
+@functools.lru_cache(maxsize=256)
+def media_session(media_key: bytes) -> CryptoSession:
+    # One cipher state per room key, shared by all of the room's media.
+    return CryptoSession(media_key)
+
+
+def negotiate(offered) -> int:
+    """
+    Pick the highest wire version both ends speak.
+    :param offered: The "wire" list from the client's exchange_sym, or None.
+    """
+    if not offered:
+        return WIRE_V1
+    common = set(SUPPORTED).intersection(offered)
+    return max(common) if common else WIRE_V1
+
+
+def layer_flags(msg: dict) -> int:
+    return (msg.get("layer", 0) << LAYER_SHIFT) | ((msg.get("layers", 1) - 1) << LAYERS_SHIFT)
+
+def layer_fields(flags: int) -> dict:
+    """
+    {"layer", "layers"} for a simulcast frame, {} for a single-layer sender.
+    """
+    layers = ((flags >> LAYERS_SHIFT) & LAYER_MASK) + 1
+    if layers == 1:
+        return {}
+    return {"layer": (flags >> LAYER_SHIFT) & LAYER_MASK, "layers": layers}
+
+def media_flags(kind: int, msg: dict) -> int:
+    if kind == KIND_AUDIO:
+        return (msg.get("level", 0) & LEVEL_MASK) << LEVEL_SHIFT
+    return layer_flags(msg)
+
+def media_fields(kind: int, flags: int) -> dict:
+    """
+    Header-borne extras of a media message: simulcast layer for frames, level for audio.
+    """
+    if kind == KIND_AUDIO:
+        return {"level": (flags >> LEVEL_SHIFT) & LEVEL_MASK}
+    return layer_fields(flags)
+
+def media_nonce(stream_id: int, seq: int) -> bytes:
+    """
+    CTR nonce for room-key payloads; unique per sender and message.
+    """
+    return struct.pack("!II", stream_id, seq & 0xFFFFFFFF)
+
+
+# ───────────────────── encode ────────────────────────
+def pack(msg: dict, sym_key: bytes, nonce: bytes, wire: int = WIRE_V1,
+         stream_id: int = 0, seq: int = 0, media_key: bytes | None = None,
+         session: CryptoSession | None = None) -> bytes | bytearray:
+    """
+    Encrypt and frame `msg` for the given wire version.
+    :param stream_id: Sender's stream id (v2+); media is routed by it.
+    :param seq: Per-connection sequence number (v2+); unique per message from v3 on.
+    :param media_key: Room media key; when given, media payloads are sealed with it (v2+).
+    :param session: The connection's CryptoSession; required from v3 on.
+    """
+    if wire == WIRE_V1:
+        if msg.get("type") in MEDIA_KINDS:
+            msg = {**msg, "data": base64.b64encode(msg["data"]).decode("ascii")}
+        enc = _timed("aes", _crypt, _timed("json", _dumps, msg), sym_key, nonce, session)
+        env = json.dumps({"type": "aes_blob", "data": base64.b64encode(enc).decode("ascii")}).encode()
+        return struct.pack("!I", len(env)) + env
+
+    kind = MEDIA_KINDS.get(msg.get("type"), KIND_JSON)
+    flags, version = 0, WIRE_V2
+    if kind == KIND_JSON:
+        payload, ts = _timed("json", _dumps, msg), 0.0
+    else:
+        payload, ts = msg["data"], msg["ts"]
+        flags |= media_flags(kind, msg)
+    # The payload is encrypted straight into the frame, behind its header.
+    frame = bytearray(HEADER.size + len(payload))
+    body = memoryview(frame)[HEADER.size:]
+    if kind != KIND_JSON and media_key is not None:
+        flags |= FLAG_ROOM_KEY
+        _timed("aes", media_session(media_key).crypt, payload, media_nonce(stream_id, seq), body)
+    elif wire >= WIRE_V3:
+        if session is None:
+            raise ValueError("Wire version 3 needs the connection's CryptoSession")
+        version = WIRE_V3
+        _timed("aes", session.encrypt, payload, seq, body)
+    else:
+        _timed("aes", _crypt, payload, sym_key, nonce, session, body)
+    HEADER.pack_into(frame, 0, version, kind, flags, stream_id, seq & 0xFFFFFFFF, ts, len(payload))
+    return frame
+
+
+def media_frame(msg: dict, stream_id: int, seq: int, media_key: bytes | None = None) -> bytes:
+    """
+    v2 media frame for a transport that already encrypts and authenticates
+    (the UDP path): sealed with the room key if given, otherwise plain.
+    """
+    kind = MEDIA_KINDS[msg["type"]]
+    flags, payload = media_flags(kind, msg), msg["data"]
+    if media_key is not None:
+        payload = media_session(media_key).crypt(payload, media_nonce(stream_id, seq))
+        flags |= FLAG_ROOM_KEY
+    return HEADER.pack(WIRE_V2, kind, flags, stream_id, seq & 0xFFFFFFFF, msg["ts"], len(payload)) + payload
+
+
+# ───────────────────── decode ────────────────────────
+def unpack_v1(envelope: bytes, sym_key: bytes, nonce: bytes, session: CryptoSession | None = None) -> dict:
+    """
+    Decode one v1 `aes_blob` envelope (without its length prefix).
+    """
+    env = json.loads(str(envelope, "utf-8"))
+    if env.get("type") != "aes_blob":
+        raise ValueError("Expected 'aes_blob' type")
+    msg = _timed("json", json.loads, _timed("aes", _crypt, base64.b64decode(env["data"]), sym_key, nonce, session))
+    if msg.get("type") in MEDIA_KINDS:
+        msg["data"] = base64.b64decode(msg["data"])
+    return msg
+
+def unpack_v2(header: tuple, payload: bytes, sym_key: bytes, nonce: bytes,
+              media_key: bytes | None = None, session: CryptoSession | None = None) -> dict:
+    """
+    Decode one v2 or v3 payload given its already-parsed HEADER tuple.
+    Media messages come back with "stream_id" set; the receiver maps it to
+    a user.
+    """
+    version, kind, flags, stream_id, seq, ts, _ln = header
+    if version not in (WIRE_V2, WIRE_V3):
+        raise ValueError(f"Unsupported wire version {version}")
+    if flags & FLAG_ROOM_KEY:
+        if media_key is None:
+            raise ValueError("Room-key payload without a room key")
+        plain = _timed("aes", media_session(media_key).crypt, payload, media_nonce(stream_id, seq))
+    elif version == WIRE_V3:
+        if session is None:
+            raise ValueError("Wire version 3 payload without a CryptoSession")
+        plain = _timed("aes", session.decrypt, payload, seq)
+    else:
+        plain = _timed("aes", _crypt, payload, sym_key, nonce, session)
+    if kind == KIND_JSON:
+        return _timed("json", json.loads, plain)
+    if kind not in KIND_TYPES:
+        raise ValueError(f"Unknown message kind {kind}")
+    return {"type": KIND_TYPES[kind], "stream_id": stream_id, "ts": ts, "data": plain, **media_fields(kind, flags)}
+
+def read_media_frame(frame: bytes, media_key: bytes | None = None) -> dict:
+    """
+    Decode a `media_frame`. Room-key frames are opened with `media_key`, or,
+    without one, returned as a routing-only {"sealed": frame} view.
+    """
+    header = HEADER.unpack_from(frame)
+    version, kind, flags, stream_id, _seq, ts, ln = header
+    if version != WIRE_V2 or kind not in KIND_TYPES or len(frame) != HEADER.size + ln:
+        raise ValueError("Malformed media frame")
+    if flags & FLAG_ROOM_KEY:
+        if media_key is None:
+            return {"type": KIND_TYPES[kind], "stream_id": stream_id, "ts": ts, "sealed": frame,
+                    **media_fields(kind, flags)}
+        return unpack_v2(header, frame[HEADER.size:], b"", b"", media_key)
+    return {"type": KIND_TYPES[kind], "stream_id": stream_id, "ts": ts, "data": frame[HEADER.size:],
+            **media_fields(kind, flags)}
+
+def open_sealed(msg: dict, media_key: bytes) -> dict:
+    """
+    Plain media dict for a message the server relayed without decrypting
+    (see `recv_v2`). Decrypted at most once however many recipients need it.
+    """
+    opened = msg.get("opened")
+    if opened is None:
+        header = HEADER.unpack_from(msg["sealed"])
+        opened = unpack_v2(header, msg["sealed"][HEADER.size:], b"", b"", media_key)
+        opened["from"], opened["name"] = msg["from"], msg["name"]
+        msg["opened"] = opened
+    return opened
+
+
+# ───────────────────── fragments (v4) ───────────────
+def fragments(frame, size: int) -> list[list]:
+    """
+    Cut a packed v2 media frame into fragments of at most `size` payload bytes.
+    :returns: Per fragment, the buffers to send: [header, piece of `frame`] (no copies).
+    """
+    version, kind, flags, stream_id, seq, ts, ln = HEADER.unpack_from(frame)
+    view, out = memoryview(frame), []
+    for start in range(HEADER.size, HEADER.size + ln, size):
+        piece = view[start:start + size]
+        more = FLAG_MORE if start + size < HEADER.size + ln else 0
+        out.append([HEADER.pack(version, kind, flags | more, stream_id, seq, ts, len(piece)), piece])
+    return out
+
+def reassemble(partials: dict, header: tuple, raw, payload):
+    """
+    Fold one received frame into `partials`, the connection's messages still
+    coming in fragments: (kind, stream id) -> payload so far.
+    :returns: (header, raw header, payload) of the complete message, or None
+              while more fragments are due.
+    """
+    version, kind, flags, stream_id, seq, ts, _ln = header
+    key = (kind, stream_id)
+    if flags & FLAG_MORE:
+        partial = partials.get(key)
+        if partial is None:
+            partials[key] = bytearray(payload)
+        elif len(partial) + len(payload) > MAX_FRAME:
+            raise ValueError("Fragmented message too large")
+        else:
+            partial += payload
+        return None
+    partial = partials.pop(key, None)
+    if partial is None:
+        return header, raw, payload
+    partial += payload
+    header = (version, kind, flags, stream_id, seq, ts, len(partial))
+    return header, HEADER.pack(*header), partial
+
+
+# ───────────────────── blocking socket I/O ───────────
+def send(sock: socket.socket, msg: dict, sym_key: bytes, nonce: bytes, wire: int = WIRE_V1,
+         stream_id: int = 0, seq: int = 0, media_key: bytes | None = None,
+         session: CryptoSession | None = None):
+    sock.sendall(pack(msg, sym_key, nonce, wire, stream_id, seq, media_key, session))
+
+def recv_v2(reader: FrameReader) -> tuple[tuple, memoryview, memoryview]:
+    """
+    Read one v2 message without decrypting it, joining v4 fragments. The
+    views are only good until the next read on `reader`.
+    :returns: (parsed header, raw header bytes, payload)
+    """
+    while True:
+        header, frame = reader.read_frame(HEADER)
+        whole = reassemble(reader.partials, header, frame[:HEADER.size], frame[HEADER.size:])
+        if whole is not None:
+            return whole
+
+def recv(reader: FrameReader, sym_key: bytes, nonce: bytes, wire: int = WIRE_V1,
+         media_key: bytes | None = None, session: CryptoSession | None = None) -> dict:
+    """
+    Receive and decrypt one message in the connection's wire version.
+    """
+    if wire == WIRE_V1:
+        return unpack_v1(reader.read_prefixed(), sym_key, nonce, session)
+    header, _raw, payload = recv_v2(reader)
+    return unpack_v2(header, payload, sym_key, nonce, media_key, session)
@@ -0,0 +1,244 @@
+"""
+recorder.py – server-side room recording.
+
+With RECORD_DIR set, every room gets a RoomRecorder. `Room.broadcast` hands
+it each media message with `offer`, which only appends to a bounded queue:
+if the disk falls behind, messages are dropped (and counted, and flagged in
+the recording) instead of holding up the live relay. One writer thread per
+room drains the queue into
+
+    RECORD_DIR/<room code>-<start time>/
+        seg-00000.zrec, seg-00001.zrec, …   append-only, one per RECORD_SEGMENT_MINUTES
+        index.jsonl                          senders, segment starts, seek points, gaps
+
+A segment is MAGIC followed by records: RECORD header + the plain JPEG /
+PCM payload. Room-key media is opened on the writer thread, never on the
+relay path. Only full-resolution simulcast layers are kept.
+
+Offline, `export` turns a recording into a video file:
+    python recorder.py recordings/ABC123-20260101-120000 meeting.mp4
+"""
+
+import os, json, time, queue, struct, bisect, argparse, shutil, subprocess, wave
+import numpy as np
+import protocol
+from metrics import METRICS
+from mixer import RATE, FRAME_BYTES
+
+MAGIC = b"ZOOMBOR1"
+# arrival time (server clock), capture ts (sender clock), kind, flags, sender number, payload length
+RECORD = struct.Struct("!ddBBHI")
+FLAG_GAP = 0x01          # messages were dropped just before this one
+INDEX_EVERY = 1.0        # seconds between seek points
+
+
+class RoomRecorder:
+    def __init__(self, code: str, media_key: bytes, directory: str,
+                 segment_seconds: float = 300, queue_size: int = 512):
+        self.code, self.media_key = code, media_key
+        self.path = os.path.join(directory, f"{code}-{time.strftime('%Y%m%d-%H%M%S')}")
+        self.segment_seconds = segment_seconds
+        self._queue = queue.Queue(queue_size)
+        self._running = True
+        self._dropped_since = 0      # dropped since the last message that made it in
+        self.dropped = 0
+        self.written = 0
+
+    # ── relay side ──────────────────────────────────────
+    def offer(self, msg: dict) -> bool:
+        """
+        Queue a media message for the writer. Never blocks.
+        :returns: False if it was dropped because the writer is behind.
+        """
+        if msg.get("layer", 0) != 0:
+            return True
+        try:
+            self._queue.put_nowait((time.time(), msg, self._dropped_since))
+        except queue.Full:
+            self._dropped_since += 1
+            self.dropped += 1
+            METRICS.inc("zoombo_record_dropped_total", (self.code,))
+            return False
+        self._dropped_since = 0
+        return True
+
+    def stop(self):
+        self._running = False
+
+    # ── writer side ─────────────────────────────────────
+    def run_forever(self):
+        os.makedirs(self.path, exist_ok=True)
+        senders: dict[str, int] = {}
+        segment, seg_file, seg_start, next_mark = -1, None, 0.0, 0.0
+        with open(os.path.join(self.path, "index.jsonl"), "a", buffering=1) as index:
+            while self._running or not self._queue.empty():
+                try:
+                    arrival, msg, gap = self._queue.get(timeout=0.2)
+                except queue.Empty:
+                    continue
+                if "sealed" in msg:
+                    try:
+                        msg = protocol.open_sealed(msg, self.media_key)
+                    except ValueError:
+                        continue
+                sender = senders.get(msg["from"])
+                if sender is None:
+                    sender = senders[msg["from"]] = len(senders)
+                    _line(index, sender=sender, user_id=msg["from"], name=msg.get("name", ""))
+                if seg_file is None or arrival - seg_start >= self.segment_seconds:
+                    if seg_file:
+                        seg_file.close()
+                    segment, seg_start = segment + 1, arrival
+                    seg_file = open(os.path.join(self.path, f"seg-{segment:05d}.zrec"), "ab")
+                    seg_file.write(MAGIC)
+                    _line(index, segment=segment, t=arrival)
+                    next_mark = arrival
+                if gap:
+                    _line(index, t=arrival, dropped=gap)
+                if arrival >= next_mark:
+                    # Seek point: a reader can start decoding at this offset.
+                    seg_file.flush()
+                    _line(index, t=arrival, segment=segment, offset=seg_file.tell())
+                    next_mark = arrival + INDEX_EVERY
+                data = msg["data"]
+                seg_file.write(RECORD.pack(arrival, msg.get("ts", arrival), protocol.MEDIA_KINDS[msg["type"]],
+                                           FLAG_GAP if gap else 0, sender, len(data)))
+                seg_file.write(data)
+                self.written += 1
+            if seg_file:
+                seg_file.close()
+
+    def stats(self) -> dict:
+        return {"path": self.path, "queued": self._queue.qsize(), "written": self.written, "dropped": self.dropped}
+
+
+def _line(index, **fields):
+    index.write(json.dumps(fields) + "\n")
+
+
+# ───────────────────── reading ───────────────────────
+def read_index(path: str) -> tuple[dict[int, dict], list[dict], list[dict]]:
+    """
+    :returns: (sender number -> {"user_id", "name"}, seek points in time order, gaps).
+    """
+    senders, marks, gaps = {}, [], []
+    with open(os.path.join(path, "index.jsonl")) as f:
+        for line in f:
+            entry = json.loads(line)
+            if "sender" in entry:
+                senders[entry["sender"]] = entry
+            elif "offset" in entry:
+                marks.append(entry)
+            elif "dropped" in entry:
+                gaps.append(entry)
+    return senders, marks, gaps
+
+def seek(marks: list[dict], t: float) -> tuple[int, int]:
+    """
+    (segment, offset) of the last seek point at or before time `t`.
+    """
+    i = max(0, bisect.bisect_right([m["t"] for m in marks], t) - 1)
+    return marks[i]["segment"], marks[i]["offset"]
+
+def records(path: str, start: tuple[int, int] = (0, len(MAGIC))):
+    """
+    Yield (arrival, ts, kind, flags, sender, payload) from `start` = (segment, offset) on.
+    A record cut short by a crash ends the segment it is in.
+    """
+    segment, offset = start
+    while os.path.exists(seg := os.path.join(path, f"seg-{segment:05d}.zrec")):
+        with open(seg, "rb") as f:
+            f.seek(offset)
+            while len(head := f.read(RECORD.size)) == RECORD.size:
+                *fields, ln = RECORD.unpack(head)
+                payload = f.read(ln)
+                if len(payload) < ln:
+                    break
+                yield (*fields, payload)
+        segment, offset = segment + 1, len(MAGIC)
+
+
+# ───────────────────── export ────────────────────────
+def export(path: str, out: str, fps: float = 15, tile: tuple[int, int] = (640, 360),
+           start: float | None = None, end: float | None = None) -> list[str]:
+    """
+    Render a recording as a grid of every sender's video plus the room's mixed audio.
+    cv2 writes the video track; the audio is mixed into a WAV beside it, and the two
+    are muxed into `out` when ffmpeg is on the PATH.
+    :param start: Recording time (seconds since epoch) to start from; found via the index.
+    :returns: The files written.
+    """
+    import cv2   # client-side dependency; the server never needs it
+
+    senders, marks, _gaps = read_index(path)
+    if not marks:
+        raise ValueError(f"{path} has no recorded media")
+    t0 = marks[0]["t"] if start is None else start
+    cols = max(1, int(np.ceil(np.sqrt(len(senders)))))
+    rows = max(1, -(-len(senders) // cols))
+    tw, th = tile
+    base, ext = os.path.splitext(out)
+    video_path = base + ".video" + ext if shutil.which("ffmpeg") else out
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (cols * tw, rows * th))
+    canvas = np.zeros((rows * th, cols * tw, 3), np.uint8)
+    pcm = np.zeros(0, np.int32)
+    cursors: dict[int, int] = {}     # sender -> end of its last audio chunk, in samples
+    next_frame = t0
+
+    def place(sender: int, jpeg: bytes):
+        img = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+        if img is not None:
+            r, c = divmod(sender, cols)
+            canvas[r * th:(r + 1) * th, c * tw:(c + 1) * tw] = cv2.resize(img, tile)
+
+    for arrival, _ts, kind, _flags, sender, payload in records(path, seek(marks, t0)):
+        if arrival < t0:
+            continue
+        if end is not None and arrival > end:
+            break
+        while next_frame <= arrival:
+            writer.write(canvas)
+            next_frame += 1 / fps
+        if kind == protocol.KIND_FRAME:
+            place(sender, payload)
+        elif kind == protocol.KIND_AUDIO and len(payload) == FRAME_BYTES:   # not a mute marker
+            # Each sender's chunks play back to back, anchored at arrival so silences survive.
+            samples = np.frombuffer(payload, np.int16)
+            at = max(cursors.get(sender, 0), int((arrival - t0) * RATE))
+            if at + len(samples) > len(pcm):
+                pcm = np.concatenate([pcm, np.zeros(at + len(samples) - len(pcm) + RATE, np.int32)])
+            pcm[at:at + len(samples)] += samples
+            cursors[sender] = at + len(samples)
+    writer.write(canvas)
+    writer.release()
+
+    wav_path = base + ".wav"
+    with wave.open(wav_path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(RATE)
+        w.writeframes(np.clip(pcm[:max(cursors.values(), default=0)], -32768, 32767).astype(np.int16).tobytes())
+    if video_path == out:
+        return [out, wav_path]
+    subprocess.run(["ffmpeg", "-loglevel", "error", "-y", "-i", video_path, "-i", wav_path,
+                    "-c:v", "copy", "-c:a", "aac", "-shortest", out], check=True)
+    os.remove(video_path)
+    os.remove(wav_path)
+    return [out]
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Export a room recording to a video file.")
+    ap.add_argument("recording", help="recording directory (RECORD_DIR/<room>-<time>)")
+    ap.add_argument("out", help="output video, e.g. meeting.mp4")
+    ap.add_argument("--fps", type=float, default=15)
+    ap.add_argument("--tile", default="640x360", help="size of each sender's tile")
+    ap.add_argument("--start", type=float, help="seconds into the recording to start at")
+    ap.add_argument("--duration", type=float, help="seconds to export")
+    args = ap.parse_args()
+
+    _senders, marks, gaps = read_index(args.recording)
+    begin = marks[0]["t"] + (args.start or 0) if marks else None
+    stop = begin + args.duration if begin is not None and args.duration else None
+    files = export(args.recording, args.out, args.fps, tuple(map(int, args.tile.split("x"))), begin, stop)
+    print("Wrote", ", ".join(files), f"({sum(g['dropped'] for g in gaps)} messages dropped while recording)")
@@ -0,0 +1,269 @@
+"""
+relay.py – relay node for broadcast rooms (town halls).
+
+A broadcast room (create_room with "broadcast": true) has a few presenters
+on the origin server, its creator and joins quoting the presenter_token it
+was given, and any number of receive-only viewers. The origin
+doesn't serve the viewers itself: it answers a viewer's join with
+
+    {"type": "redirect", "room_code", "host", "port"}
+
+pointing at the least loaded relay in its RELAYS list. The relay speaks
+the ordinary client protocol to viewers. For each room it has viewers in,
+it holds one subscription to the origin (a join carrying RELAY_SECRET) and
+fans everything that arrives out to its own viewers, with the same
+per-viewer send queues, last-N and simulcast layer choice as the origin.
+Room-key media is forwarded still sealed. The origin's outbound load per
+room is then presenters + relays, and each relay's is at most
+RELAY_CAPACITY viewers; relays report their load to the origin every
+REPORT_EVERY seconds.
+
+Run several on one host for testing:
+    python relay.py --port 5101 --origin 127.0.0.1:5000
+    python relay.py --port 5102 --origin 127.0.0.1:5000
+with "RELAYS": ["127.0.0.1:5101", "127.0.0.1:5102"] and a RELAY_SECRET in
+settings/server_settings.json.
+"""
+
+import argparse, itertools, socket, threading, time
+from typing import Dict
+from server import Server, Client, Room, SETTINGS, RELAY_SECRET, _send, _recv
+from encryption import generate_x25519_keypair, x25519_shared_key, CryptoSession
+import protocol
+from framing import FrameReader
+
+RELAY_CAPACITY = SETTINGS.get("RELAY_CAPACITY", 200)   # viewers per relay process
+REPORT_EVERY = 1.0
+
+
+class Uplink(threading.Thread):
+    """
+    A relay's subscription to one broadcast room on the origin.
+    """
+
+    def __init__(self, server: "RelayServer", code: str):
+        super().__init__(daemon=True)
+        self.server, self.code = server, code
+        self.room: MirrorRoom | None = None
+        self._seq = itertools.count()
+        self._send_lock = threading.Lock()
+
+    def connect(self) -> tuple[dict, list[dict]]:
+        """
+        Handshake with the origin and subscribe to the room.
+        :returns: (room_joined, the presenters' peer messages). Raises ConnectionError
+                  with the origin's reason if it refused.
+        """
+        self.sock = socket.create_connection(self.server.origin, timeout=5)
+        self.reader = FrameReader(self.sock)
+        try:
+            public, private = generate_x25519_keypair()
+            _send(self.sock, {"type": "exchange_sym", "x25519": public.hex(), "wire": list(protocol.SUPPORTED)})
+            resp = _recv(self.reader)
+            server_public = bytes.fromhex(resp["x25519"])
+            self.key = x25519_shared_key(private, server_public, public + server_public)
+            self.nonce, self.wire = bytes.fromhex(resp["nonce"]), resp.get("wire", protocol.WIRE_V1)
+            self.crypto = CryptoSession(self.key, self.nonce, protocol.TO_SERVER)
+            self.send({"type": "register", "name": "relay"})
+            self.recv()
+            self.send({"type": "join", "room_code": self.code, "relay": self.server.secret,
+                       "addr": list(self.server.advertise), "room_key": True})
+            peers = []
+            while (msg := self.recv())["type"] not in ("reject", "room_joined"):
+                if msg["type"] == "peer":
+                    peers.append(msg)
+            if msg["type"] == "reject":
+                raise ConnectionError(msg.get("reason", "Refused"))
+        except BaseException:
+            self.sock.close()
+            raise
+        self.sock.settimeout(None)
+        return msg, peers
+
+    def send(self, msg: dict):
+        with self._send_lock:
+            protocol.send(self.sock, msg, self.key, self.nonce, self.wire,
+                          seq=next(self._seq), session=self.crypto)
+
+    def recv(self) -> dict:
+        if self.wire == protocol.WIRE_V1:
+            return protocol.recv(self.reader, self.key, self.nonce, session=self.crypto)
+        header, raw, payload = protocol.recv_v2(self.reader)
+        _version, kind, flags, stream_id, _seq, ts, _ln = header
+        if flags & protocol.FLAG_ROOM_KEY and kind in protocol.KIND_TYPES:
+            # Passed on sealed; viewers that can't use the room key get it opened once, on demand.
+            return {"type": protocol.KIND_TYPES[kind], "stream_id": stream_id, "ts": ts,
+                    "sealed": b"".join((raw, payload)), **protocol.media_fields(kind, flags)}
+        return protocol.unpack_v2(header, payload, self.key, self.nonce, session=self.crypto)
+
+    def report(self, viewers: int):
+        try:
+            self.send({"type": "relay_load", "viewers": viewers, "capacity": RELAY_CAPACITY})
+        except OSError:
+            pass   # run() notices the dead link
+
+    def run(self):
+        try:
+            while True:
+                self.room.from_origin(self.recv())
+        except (OSError, ConnectionError, ValueError):
+            pass
+        finally:
+            self.server.close_room(self.room)
+            self.sock.close()
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class MirrorRoom(Room):
+    """
+    A broadcast room as a relay holds it: the presenters live on the origin and
+    are known from its "peer" / "leave" messages; every local member is a viewer.
+    """
+
+    def __init__(self, code: str, media_key: bytes, uplink: Uplink):
+        super().__init__(code)
+        self.media_key, self.uplink = media_key, uplink
+        self.broadcast_mode = True
+        self.capacity = RELAY_CAPACITY
+        self.presenters: Dict[str, dict] = {}    # user id -> peer message
+        self._by_stream: Dict[int, str] = {}     # stream id -> user id, to attribute media
+
+    def roster(self, exclude: Client = None) -> list[dict]:
+        return list(self.presenters.values())
+
+    def from_origin(self, msg: dict):
+        kind = msg.get("type")
+        if kind == "peer":
+            with self._lock:
+                self.presenters[msg["user_id"]] = msg
+                self._by_stream[msg["stream_id"]] = msg["user_id"]
+                self.speakers.add(msg["user_id"])
+            self.broadcast(msg)
+            self.relayout()
+        elif kind == "leave":
+            with self._lock:
+                peer = self.presenters.pop(msg["from"], None)
+                if peer:
+                    self._by_stream.pop(peer["stream_id"], None)
+                self.speakers.remove(msg["from"])
+            self.broadcast(msg)
+            self.relayout()
+        elif kind == "layout":
+            return   # the origin's layout for the relay itself; viewers get their own
+        else:
+            if kind in protocol.MEDIA_KINDS and "from" not in msg:
+                uid = self._by_stream.get(msg.get("stream_id"))
+                if uid is None:
+                    return   # presenter not announced yet
+                msg["from"], msg["name"] = uid, self.presenters[uid]["name"]
+            self.broadcast(msg)
+
+
+class RelayClient(Client):
+    """
+    A viewer connected to a relay. Joins only; it is always receive-only.
+    """
+
+    def create_or_join_room(self, msg: dict | None = None):
+        msg = msg or self.recv()
+        if msg["type"] != "join":
+            self.send({"type": "reject", "reason": "Relays only serve broadcast viewers"})
+            return None
+        if self.server.viewers() >= RELAY_CAPACITY:
+            self.send({"type": "reject", "reason": "Relay is full"})
+            return None
+        refused = self.server.subscribe(msg["room_code"].upper())
+        if refused:
+            self.send({"type": "reject", "reason": refused})
+            return None
+        return super().create_or_join_room({**msg, "presenter": False})
+
+
+class RelayServer(Server):
+    def __init__(self, origin: tuple[str, int], advertise: tuple[str, int], secret: str = RELAY_SECRET):
+        super().__init__()
+        self.origin, self.advertise, self.secret = origin, advertise, secret
+        self.relays = []           # viewers are served here, never sent on again
+        self.udp_port = 0          # viewers stay on TCP
+        self.metrics_port = 0
+        # Viewers never send media; their stream ids just must not collide with the presenters'.
+        self._stream_ids = itertools.count(1 << 31)
+        self._subscribing = threading.Lock()
+
+    def viewers(self) -> int:
+        with self._lock:
+            return sum(len(room.clients) for room in self.rooms.values())
+
+    def subscribe(self, code: str) -> str | None:
+        """
+        Make sure this relay holds room `code`, subscribing to it on the origin if needed.
+        :returns: The origin's reason if it refused, otherwise None.
+        """
+        with self._subscribing:
+            if code in self.rooms:
+                return None
+            uplink = Uplink(self, code)
+            try:
+                joined, peers = uplink.connect()
+            except (OSError, ConnectionError, ValueError, KeyError) as e:
+                return str(e) or "Origin unreachable"
+            room = uplink.room = MirrorRoom(code, bytes.fromhex(joined["media_key"]), uplink)
+            for peer in peers:
+                room.from_origin(peer)
+            with self._lock:
+                self.rooms[code] = room
+            uplink.start()
+            print(f"Relaying room {code} from {self.origin[0]}:{self.origin[1]}")
+            return None
+
+    def drop(self, code, cl):
+        room = self.rooms.get(code)
+        super().drop(code, cl)
+        if room is not None and code not in self.rooms:
+            room.uplink.close()    # last viewer gone
+
+    def close_room(self, room: MirrorRoom):
+        # The origin ended the room (or went away): end it for our viewers too.
+        with self._lock:
+            if self.rooms.get(room.code) is room:
+                del self.rooms[room.code]
+        for c in room.members():
+            c.kick()
+
+    def _report_loop(self):
+        while True:
+            time.sleep(REPORT_EVERY)
+            viewers = self.viewers()
+            with self._lock:
+                rooms = list(self.rooms.values())
+            for room in rooms:
+                room.uplink.report(viewers)
+
+    def serve_forever(self, host="0.0.0.0", port=5101):
+        threading.Thread(target=self._report_loop, daemon=True).start()
+        with self._listen(host, port) as srv:
+            print(f"Relay listening on {host}:{port} for {self.origin[0]}:{self.origin[1]}")
+            while True:
+                sock, addr = srv.accept(); RelayClient(sock, addr, self).start()
+
+
+def _addr(text: str) -> tuple[str, int]:
+    host, port = text.rsplit(":", 1)
+    return host, int(port)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--origin", type=_addr, default=("127.0.0.1", SETTINGS["SERVER_PORT"]), help="host:port")
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--port", type=int, default=5101)
+    ap.add_argument("--advertise", type=_addr, help="host:port as listed in the origin's RELAYS "
+                                                     "(default 127.0.0.1:PORT)")
+    ap.add_argument("--secret", default=RELAY_SECRET, help="the origin's RELAY_SECRET")
+    args = ap.parse_args()
+    RelayServer(args.origin, args.advertise or ("127.0.0.1", args.port), args.secret).serve_forever(args.host, args.port)
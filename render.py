@@ -0,0 +1,110 @@
+"""
+render.py – video tiles that are drawn into, not rebuilt.
+
+Each QGraphicsView in the room grid gets one Tile for the life of the
+window: one scene, one pixmap item for the video and one for the
+camera-off icon. Showing a frame only swaps the video item's pixmap:
+  • the frame is scaled to the tile's size in device pixels with cv2 first,
+    so Qt never uploads or smooth-scales more pixels than are shown;
+  • it is wrapped as a BGR888 QImage, with no colour conversion, where Qt
+    has that format (5.14+);
+  • there is no new scene, setScene or fitInView per frame.
+Overlay pixmaps are read from disk once. The name label is placed when the
+tile is resized or its name changes, not on every frame.
+"""
+
+import functools, os
+import cv2, numpy as np
+from PyQt5 import QtWidgets, QtCore, QtGui
+
+BACKGROUND = "#4C2C76"
+LABEL_HEIGHT = 24
+_BGR888 = getattr(QtGui.QImage, "Format_BGR888", None)     # Qt 5.14+
+
+
+@functools.lru_cache(maxsize=None)
+def overlay(path: str) -> QtGui.QPixmap | None:
+    # Overlay icons, loaded once; None if the file is missing.
+    return QtGui.QPixmap(path) if os.path.exists(path) else None
+
+
+class Tile:
+    def __init__(self, view: QtWidgets.QGraphicsView, label: QtWidgets.QLabel, camera_off_icon: str):
+        self.view, self.label = view, label
+        self.name: str | None = None
+        self.scene = QtWidgets.QGraphicsScene(view)
+        self.scene.setBackgroundBrush(QtGui.QColor(BACKGROUND))
+        self.video = self.scene.addPixmap(QtGui.QPixmap())
+        self.camera_off = self.scene.addPixmap(overlay(camera_off_icon) or QtGui.QPixmap())
+        self.camera_off.hide()
+        view.setScene(self.scene)
+        self.relayout()
+
+    def _size(self) -> tuple[int, int, float]:
+        # The viewport in logical pixels, and its device pixel ratio.
+        size = self.view.viewport().size()
+        return max(size.width(), 1), max(size.height(), 1), self.view.devicePixelRatioF()
+
+    def show(self, frame: np.ndarray):
+        """
+        Draw a BGR frame, scaled to fit the tile with its aspect ratio kept.
+        """
+        width, height, ratio = self._size()
+        h, w = frame.shape[:2]
+        scale = min(width * ratio / w, height * ratio / h)
+        size = (max(int(w * scale), 1), max(int(h * scale), 1))
+        if size != (w, h):
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+        if _BGR888 is None:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        frame = np.ascontiguousarray(frame)
+        image = QtGui.QImage(frame.data, size[0], size[1], frame.strides[0], _BGR888 or QtGui.QImage.Format_RGB888)
+        pixmap = QtGui.QPixmap.fromImage(image)     # copies the pixels, so `frame` may go
+        pixmap.setDevicePixelRatio(ratio)
+        self.video.setPixmap(pixmap)
+        self.video.setOffset((width - size[0] / ratio) / 2, (height - size[1] / ratio) / 2)
+        self.video.show()
+        self.camera_off.hide()
+
+    def blank(self):
+        """
+        Camera off: the icon on the background instead of video.
+        """
+        self.video.hide()
+        self.camera_off.show()
+
+    def clear(self):
+        """
+        Nobody on this tile any more.
+        """
+        self.video.setPixmap(QtGui.QPixmap())
+        self.video.hide()
+        self.camera_off.hide()
+        self.set_name(None)
+
+    def set_name(self, name: str | None):
+        if name == self.name:
+            return
+        self.name = name
+        self.label.setText(name or "")
+        self.label.setVisible(name is not None)
+        self._place_label()
+
+    def relayout(self):
+        """
+        Fit the scene, overlays and label to the view's current size (on resize).
+        """
+        width, height, _ratio = self._size()
+        self.scene.setSceneRect(0, 0, width, height)
+        icon = self.camera_off.pixmap()
+        self.camera_off.setOffset((width - icon.width()) / 2, (height - icon.height()) / 2)
+        pixmap = self.video.pixmap()
+        if not pixmap.isNull():
+            ratio = pixmap.devicePixelRatio()
+            self.video.setOffset((width - pixmap.width() / ratio) / 2, (height - pixmap.height() / ratio) / 2)
+        self._place_label()
+
+    def _place_label(self):
+        view = self.view
+        self.label.resize(view.width(), LABEL_HEIGHT)
+        self.label.move(view.x(), view.y() + view.height() - LABEL_HEIGHT)
@@ -0,0 +1,58 @@
+"""
+resume.py – session resumption tickets.
+
+On join the server hands the client an opaque ticket: its user id and room,
+encrypted and authenticated with a key only the server holds. When the
+connection drops, the server keeps the seat for RESUME_GRACE seconds
+without telling the room. A client that comes back in time sends
+
+    {"type": "resume", "ticket": …, "client_random": hex, "wire": [1, 2]}
+
+instead of exchange_sym – no RSA, no register, no join. The server answers
+{"type": "resume_response", "server_random", "nonce", "wire"} and both ends
+derive the new session key from a secret tied to the old session key:
+
+    secret  = HMAC(old sym_key, "resume" + user_id)       (sealed in the ticket)
+    sym_key = HMAC(secret, "key" + client_random + server_random)[:16]
+
+The client's first message under the new key is {"type": "resume_seat",
+"proof": HMAC(secret, "proof" + randoms)}, so a ticket sniffed off the wire
+is useless without the old key. The resumed connection takes over the same
+user id, stream id and seat, and the room sees neither a leave nor a join.
+"""
+
+import hmac, hashlib, json, secrets, time
+from encryption import gcm_encrypt, gcm_decrypt
+
+LIFETIME = 12 * 3600     # a ticket never outlives this, whatever the grace window
+
+
+def session_secret(sym_key: bytes, user_id: str) -> bytes:
+    return hmac.new(sym_key, b"resume" + user_id.encode(), hashlib.sha256).digest()
+
+def session_key(secret: bytes, client_random: bytes, server_random: bytes) -> bytes:
+    return hmac.new(secret, b"key" + client_random + server_random, hashlib.sha256).digest()[:16]
+
+def proof(secret: bytes, client_random: bytes, server_random: bytes) -> str:
+    return hmac.new(secret, b"proof" + client_random + server_random, hashlib.sha256).hexdigest()
+
+
+def issue(ticket_key: bytes, user_id: str, room_code: str, sym_key: bytes) -> str:
+    """
+    Ticket for the session keyed by `sym_key`, as hex.
+    """
+    body = json.dumps({"user_id": user_id, "room_code": room_code,
+                       "secret": session_secret(sym_key, user_id).hex(),
+                       "exp": time.time() + LIFETIME}).encode()
+    nonce = secrets.token_bytes(12)
+    return (nonce + gcm_encrypt(body, ticket_key, nonce)).hex()
+
+def open_ticket(ticket_key: bytes, ticket: str) -> dict:
+    """
+    :returns: The ticket's fields. Raises ValueError if it is forged or expired.
+    """
+    raw = bytes.fromhex(ticket)
+    body = json.loads(gcm_decrypt(raw[12:], ticket_key, raw[:12]))
+    if body["exp"] < time.time():
+        raise ValueError("Ticket expired")
+    return body
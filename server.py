@@ -1,6 +1,17 @@
-import socket, threading, json, struct, secrets
+import socket, threading, json, struct, secrets, time
 from typing import Dict, List, Tuple
-from encryption import rsa_encrypt, aes_encrypt, aes_decrypt, generate_rsa_keypair
+from encryption import rsa_encrypt, aes_encrypt, aes_decrypt, generate_rsa_keypair, generate_x25519_keypair, x25519_shared_key, CryptoSession
+import protocol
+from framing import FrameReader, PREFIX, send_all, limit_unsent
+import itertools
+from outbound import OutboundQueue, payload_size
+from congestion import BandwidthEstimator
+from metrics import METRICS, MESSAGE_TYPES, serve_metrics
+from udp import UdpRelay
+from mixer import RoomMixer
+from recorder import RoomRecorder
+from speakers import SpeakerTracker, audio_level
+import resume
 import string, random
 import secrets
 import base64
@@ -9,6 +20,24 @@ import base64
 with open("settings/server_settings.json") as f:
     SETTINGS = json.load(f)
 HOST, PORT = SETTINGS["SERVER_HOST"], SETTINGS["SERVER_PORT"]
+# Seconds a dropped connection's seat is held for it to resume (resume.py); 0 disables tickets.
+RESUME_GRACE = SETTINGS.get("RESUME_GRACE", 0)
+# Seals resumption tickets. Created before shard workers fork, so any of them can open one.
+TICKET_KEY = secrets.token_bytes(16)
+# Shared with relay nodes (relay.py); a join carrying it subscribes to a broadcast room's streams.
+RELAY_SECRET = SETTINGS.get("RELAY_SECRET", "")
+# Writer batching: up to COALESCE_MAX queued messages / COALESCE_BYTES go out in one sendmsg,
+# waiting at most COALESCE_WINDOW for more to arrive. COALESCE_MAX 1 turns it off.
+COALESCE_MAX = SETTINGS.get("SEND_COALESCE_MAX", 64)
+COALESCE_BYTES = SETTINGS.get("SEND_COALESCE_BYTES", 65536)
+COALESCE_WINDOW = SETTINGS.get("SEND_COALESCE_MS", 0) / 1000
+# Send order (outbound.py): control > audio > video > chat unless SEND_PRIORITY is off. Frames over
+# FRAGMENT_BYTES go to wire v4 members in fragments, and SEND_LOWAT caps what waits in the kernel.
+SEND_PRIORITY = SETTINGS.get("SEND_PRIORITY", True)
+FRAGMENT_BYTES = SETTINGS.get("SEND_FRAGMENT_BYTES", 8192)
+SEND_LOWAT = SETTINGS.get("SEND_LOWAT", 16384)
+# What a malformed or hostile peer can make a read raise; both engines drop the connection on it.
+BAD_INPUT = (ConnectionError, ValueError, KeyError)
 
 #HELPERS-------------------------
 
@@ -18,48 +47,232 @@ def generate_room_code(length=6) -> str:
 
 def _send(sock: socket.socket, payload: dict):
     data = json.dumps(payload).encode()
-    sock.sendall(struct.pack("!I", len(data)) + data)
+    send_all(sock, [PREFIX.pack(len(data)), data])
 
-def _send_encrypted(sock: socket.socket, payload: dict, sym_key: bytes, nonce: bytes):
+def _recv(reader: FrameReader) -> dict:
+    return json.loads(str(reader.read_prefixed(), "utf-8"))
+
+def encode_for(cl, msg: dict) -> bytes:
+    """
+    Serialize `msg` for recipient `cl` in its wire version and key.
+    Room-key media goes out exactly as the sender sealed it; only members that
+    can't use the room key cost a (single, shared) decrypt.
+    """
+    if "sealed" in msg:
+        if cl.room_keyed:
+            return msg["sealed"]
+        msg = protocol.open_sealed(msg, cl.media_key)
+    return protocol.pack(msg, cl.sym_key, cl.nonce, cl.wire, msg.get("stream_id", 0), next(cl._seq),
+                         session=cl.crypto)
+
+def split_size(cl) -> int:
+    # Payload size above which media goes to `cl` in fragments; 0 if it never does.
+    return FRAGMENT_BYTES if cl.wire >= protocol.WIRE_V4 else 0
+
+def frames_for(cl, msg: dict) -> list:
+    """
+    Buffers to write for `msg` now. A frame bigger than split_size(cl) goes one
+    fragment at a time: the rest goes back to cl's outbox, so control and audio
+    queued meanwhile can go out before the next fragment.
+    """
+    pieces = msg.get("fragments")
+    if pieces is None:
+        frame = encode_for(cl, msg)
+        split = split_size(cl)
+        if not split or payload_size(msg) <= split or msg.get("type") not in protocol.MEDIA_KINDS:
+            return [frame]
+        pieces = protocol.fragments(frame, split)
+    if len(pieces) > 1:
+        cl.outbox.resume({"type": msg["type"], "fragments": pieces[1:],
+                          "size": sum(len(b) for piece in pieces[1:] for b in piece)})
+    return pieces[0]
+
+def wants_room_key(cl, join_msg: dict) -> bool:
+    return (bool(join_msg.get("room_key")) and cl.wire >= protocol.WIRE_V2
+            and SETTINGS.get("ROOM_KEY_MODE", True))
+
+def stamp_media(cl, msg: dict) -> dict:
+    # Media is stamped with the sender's identity so recipients never trust a client-supplied "from".
+    if msg.get("type") in protocol.MEDIA_KINDS:
+        msg["from"], msg["name"], msg["stream_id"] = cl.user_id, cl.name, cl.stream_id
+    return msg
+
+def sealed_media(cl, header: tuple, raw: bytes, payload: bytes) -> dict | None:
+    """
+    Routing-only view of a room-key media frame from `cl`, or None if the frame
+    is not room-key media. The payload is never decrypted here, only copied
+    out of the receive buffer once to be queued.
+    """
+    _version, kind, flags, stream_id, _seq, ts, _ln = header
+    if not flags & protocol.FLAG_ROOM_KEY:
+        return None
+    if not cl.room_keyed or stream_id != cl.stream_id or kind not in protocol.KIND_TYPES:
+        raise ValueError("Unexpected room-key frame")
+    return {"type": protocol.KIND_TYPES[kind], "from": cl.user_id, "name": cl.name,
+            "stream_id": stream_id, "ts": ts, "sealed": b"".join((raw, payload)), **protocol.media_fields(kind, flags)}
+
+def wants_layer(cl, msg: dict) -> bool:
+    """
+    Whether recipient `cl` should get this simulcast frame. Each receiver gets
+    one layer per sender: the one it asked for (sized to its tile), stepped
+    down while its outbound queue is backing up or its link is congested.
+    """
+    layers = msg.get("layers", 1)
+    if layers == 1:
+        return True
+    layer = cl.layer_prefs.get(msg["from"], 0)
+    if len(cl.outbox) > cl.outbox.maxsize // 2 or cl.bwe.congested:
+        layer += 1
+    return msg["layer"] == min(layer, layers - 1)
+
+def handle_control(cl, room, msg: dict) -> bool:
+    """
+    Apply a per-receiver preference message from `cl`.
+    :returns: True if `msg` was one (and must not be relayed).
+    """
+    kind = msg.get("type")
+    if kind == "layer_pref":
+        cl.layer_prefs.update(msg.get("layers", {}))
+    elif kind == "pin":
+        # Keep one sender's video regardless of who is talking; "user_id": None unpins.
+        cl.pinned = msg.get("user_id")
+        room.relayout()
+    elif kind == "udp_request":
+        # Media may move to UDP (udp.py); without a relay the client stays on TCP.
+        relay = cl.server.udp
+        cl.send(relay.offer(cl) if relay else {"type": "udp_offer", "port": 0})
+    elif kind == "udp_close":
+        if cl.server.udp:
+            cl.server.udp.forget(cl)
+    elif kind == "relay_load":
+        if cl.relay:
+            cl.server.relay_load[cl.relay] = (msg.get("viewers", 0), msg.get("capacity", 0))
+    else:
+        # Viewers and relays only receive; anything else they send goes nowhere.
+        return cl.viewer
+    return True
+
+def key_exchange(first: dict) -> tuple[bytes, dict]:
+    """
+    Session key for an exchange_sym request, plus the reply fields the client derives it from.
+    Clients that offer an ephemeral X25519 key get ECDH; the rest get the key RSA-encrypted.
     """
-    Encrypt `payload` using AES with `sym_key` and `nonce`, then send it.
+    if "x25519" in first:
+        client_public = bytes.fromhex(first["x25519"])
+        public, private = generate_x25519_keypair()
+        return x25519_shared_key(private, client_public, client_public + public), {"x25519": public.hex()}
+    sym_key = secrets.token_bytes(16)
+    enc_key = rsa_encrypt(sym_key, first["public_key"])
+    return sym_key, {"sym_key": base64.b64encode(enc_key).decode("ascii")}
+
+def resume_keys(first: dict) -> tuple[dict, bytes, bytes] | None:
     """
-    blob = json.dumps(payload).encode()
-    enc = aes_encrypt(blob, sym_key, nonce)
-    enc_b64 = base64.b64encode(enc).decode("ascii")
-    msg = {"type": "aes_blob", "data": enc_b64}
-    _send(sock, msg)
-
-def _recv(sock: socket.socket) -> dict:
-    hdr = b""
-    while len(hdr) < 4:
-        part = sock.recv(4 - len(hdr))
-        if not part:
-            raise ConnectionError
-        hdr += part
-    (ln,) = struct.unpack("!I", hdr)
-    buf = b""
-    while len(buf) < ln:
-        part = sock.recv(ln - len(buf))
-        if not part:
-            raise ConnectionError
-        buf += part
-    return json.loads(buf.decode())
-
-
-def _recv_encrypted(sock: socket.socket, sym_key: bytes, nonce: bytes) -> dict:
+    Open the ticket of a "resume" request and derive the new session key.
+    :returns: (ticket fields plus the expected "proof", session key, server random),
+              or None if the ticket is forged, expired or malformed.
     """
-    Receive an AES-encrypted message, decrypt it using `sym_key` and `nonce`,
-    and return the decoded JSON object.
+    try:
+        ticket = resume.open_ticket(TICKET_KEY, first["ticket"])
+        client_random = bytes.fromhex(first["client_random"])
+    except (KeyError, ValueError, TypeError):
+        return None
+    server_random = secrets.token_bytes(16)
+    secret = bytes.fromhex(ticket["secret"])
+    ticket["proof"] = resume.proof(secret, client_random, server_random)
+    return ticket, resume.session_key(secret, client_random, server_random), server_random
+
+def issue_ticket(cl, payload: dict):
+    # Add a resumption ticket for `cl`'s current session to room_joined / resumed.
+    if RESUME_GRACE and not cl.viewer:
+        payload["ticket"] = resume.issue(TICKET_KEY, cl.user_id, cl.room_code, cl.sym_key)
+        payload["resume_grace"] = RESUME_GRACE
+        cl.resumable = True
+
+def take_seat(cl, msg: dict) -> str | None:
     """
-    msg = _recv(sock)
-    if msg.get("type") != "aes_blob":
-        raise ValueError("Expected 'aes_blob' type")
+    Seat resumed connection `cl` in place of the one its ticket was issued to,
+    whether that one is parked or still hanging on a dead link.
+    :returns: The room code, or None if the seat has already been given up.
+    """
+    room = cl.server.rooms.get(msg["room_code"])
+    old = room.clients.get(msg["user_id"]) if room else None
+    if old is None:
+        cl.send({"type": "reject", "reason": "Session expired"})
+        cl.close()
+        return None
+    cl.user_id, cl.name, cl.stream_id = old.user_id, old.name, old.stream_id
+    cl.media_key, cl.room_keyed = old.media_key, old.room_keyed
+    cl.layer_prefs, cl.pinned = old.layer_prefs, old.pinned
+    cl.room_code = room.code
+    room.replace(old, cl)
+    old.kick()
+
+    payload = {
+        "type": "resumed",
+        "room_code": room.code,
+        "user_id": cl.user_id,
+        "stream_id": cl.stream_id,
+        "peers": room.roster(exclude=cl),
+    }
+    if cl.room_keyed:
+        payload["media_key"] = room.media_key.hex()
+    issue_ticket(cl, payload)
+    cl.send(payload)
+    cl.send(room.layout_for(cl))
+    return room.code
+
+def room_created(room, msg: dict) -> dict:
+    """
+    Set up a just-created room as `msg` asks.
+    :returns: The reply for its creator. A broadcast room's carries the presenter token: a
+              join that quotes it presents, every other join watches.
+    """
+    room.broadcast_mode = bool(msg.get("broadcast"))
+    payload = {"type": "room_created", "room_code": room.code}
+    if room.broadcast_mode:
+        room.presenter_token = payload["presenter_token"] = secrets.token_hex(16)
+    return payload
+
+def is_viewer(cl, room, msg: dict) -> bool | None:
+    """
+    Whether a join into `room` only receives. In a broadcast room only its creator (already
+    seated) and joins carrying the room's presenter token send.
+    :returns: None if the join asked to present without the token; it has been rejected.
+    """
+    if not room.broadcast_mode or cl.user_id in room.clients:
+        return False
+    token = msg.get("presenter")
+    if not token:
+        return True
+    if isinstance(token, str) and secrets.compare_digest(token, room.presenter_token or ""):
+        return False
+    cl.send({"type": "reject", "reason": "Not a presenter"})
+    return None
 
-    enc_b64 = msg["data"]
-    enc_bytes = base64.b64decode(enc_b64)
-    plain = aes_decrypt(enc_bytes, sym_key, nonce)
-    return json.loads(plain.decode())
+def join_listener(cl, room, msg: dict) -> str | None:
+    """
+    A join that doesn't take a seat: a relay node subscribing to a broadcast
+    room (relay.py), or a viewer sent on to the least loaded relay.
+    :returns: The room code if `cl` is now subscribed, otherwise None.
+    """
+    if msg.get("relay") is None:
+        addr = cl.server.pick_relay()
+        if addr is None:
+            cl.send({"type": "reject", "reason": "Broadcast is full"})
+        else:
+            cl.send({"type": "redirect", "room_code": room.code, "host": addr[0], "port": addr[1]})
+        return None
+    if not RELAY_SECRET or not secrets.compare_digest(str(msg["relay"]), RELAY_SECRET):
+        cl.send({"type": "reject", "reason": "Not a relay"})
+        return None
+    cl.relay, cl.viewer = tuple(msg.get("addr", ("", 0))), True
+    cl.room_code = room.code
+    # Relays forward sealed media to viewers verbatim, so they always get the room key.
+    cl.media_key, cl.room_keyed = room.media_key, cl.wire >= protocol.WIRE_V2
+    room.add_relay(cl)
+    cl.send({"type": "room_joined", "room_code": room.code, "user_id": cl.user_id,
+             "media_key": room.media_key.hex()})
+    return room.code
 
 #CLASSES-----------------------------
 
@@ -71,104 +284,259 @@ class Client(threading.Thread):
     def __init__(self, sock, addr, server):
         super().__init__(daemon=True)
         self.sock, self.addr, self.server = sock, addr, server
+        self.reader = FrameReader(sock)
         self.room_code = None
         self.name = ""
         self.user_id = secrets.token_hex(16)  # Unique user ID
+        self.stream_id = server.next_stream_id()  # Short id used to route binary media
         self.sym_key = None
+        self.crypto: CryptoSession | None = None   # cipher state for sym_key, built once it is known
         self.nonce = secrets.token_bytes(8)
+        self.wire = protocol.WIRE_V1
+        self._seq = itertools.count()
+        self.media_key = None      # Room's shared media key, set on join
+        self.room_keyed = False    # Client seals its own media with it
+        self.layer_prefs: Dict[str, int] = {}   # sender user id -> wanted simulcast layer
+        self.pinned: str | None = None          # sender whose video is kept outside last-N
+        self.udp = None                          # udp.UdpPeer once media moves to UDP
+        # Everything sent after the handshake goes through the outbox and its writer thread.
+        self.outbox = OutboundQueue(SETTINGS.get("SEND_QUEUE_SIZE", 32),
+                                    SETTINGS.get("SEND_QUEUE_POLICY", "video_first"),
+                                    observe_wait=server.queue_wait_observer, prioritize=SEND_PRIORITY)
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        limit_unsent(sock, SEND_LOWAT)
+        self.bwe = BandwidthEstimator(sock)     # downstream estimate for this client, fed by the writer
+        self.resume_join: dict | None = None   # join request carried over from another worker
+        self.resumable = False     # holds a ticket: a dropped connection parks its seat
+        self.superseded = False    # seat taken over by a resumed connection
+        self.viewer = False        # receive-only member of a broadcast room
+        self.relay: tuple | None = None   # (host, port) viewers reach it on, if this is a relay node
 
     def run(self):
+        METRICS.inc("zoombo_connections_opened_total")
         try:
-            # 0. Initial handshake: must exchange symmetric key first. If not, reject.
-            first = _recv(self.sock)
-            if first["type"] == "exchange_sym":
-                self.sym_key = secrets.token_bytes(16)
-                enc_key = rsa_encrypt(self.sym_key, first["public_key"])
-                sym_key_b64 = base64.b64encode(enc_key).decode("ascii")
-                _send(self.sock, {
-                    "type": "exchange_sym_response",
-                    "sym_key": sym_key_b64,
-                    "nonce": self.nonce.hex()
-                })
-
-            else:
-                _send(self.sock, {"type": "reject", "reason": "Must exchange symmetric key first "})
-                self.sock.close()
-                return
-
-            # 1. Wait for registration request to get ID from server.
-            msg = _recv_encrypted(self.sock, self.sym_key, self.nonce)
-            if msg["type"] == "register":
-                self.user_id = secrets.token_hex(16)
-                self.name = msg["name"]
-                register_response = {
-                    "type": "register_response",
-                    "user_id": self.user_id
-                }
-                _send_encrypted(self.sock, register_response, self.sym_key, self.nonce)
+            if self.resume_join is None:
+                # A resuming client comes out of the handshake with a "resume_seat" to act on.
+                if not self._handshake():
+                    return
             else:
-                # If not a registration request, reject and close.
-                _send_encrypted(self.sock, {"type": "reject", "reason": "Must register first"}, self.sym_key, self.nonce)
-                self.sock.close()
-                return
+                # Handed over mid-join by another worker (shard.py): keys and registration carry over.
+                self._writer.start()
 
             # 2. Wait for join/create_room request.
-            room_code = self.create_or_join_room()
+            room_code = self.create_or_join_room(self.resume_join)
+            if room_code is None:
+                return
             room = self.server.get_room(room_code, create=False)
 
             # 3. Main message loop
             while True:
-                msg = _recv_encrypted(self.sock, self.sym_key, self.nonce)
+                msg = self.recv()
                 if msg.get("type") == "leave":
+                    self.resumable = False
                     break  # Explicit leave request
+                if handle_control(self, room, msg):
+                    continue
                 room.broadcast(msg, exclude_client_id=self.user_id)
-        except ConnectionError:
+        except BAD_INPUT:
             pass
         finally:
-            self.server.drop(self.room_code, self)
+            if self.udp:
+                self.server.udp.forget(self)
+            if self.resumable:
+                self.server.park(self)
+            elif not self.superseded:
+                self.server.drop(self.room_code, self)
+            # Give the writer a moment to flush (e.g. a reject), then cut the socket.
+            self.close()
+            if self._writer.is_alive():
+                self._writer.join(timeout=1.0)
+            self.sock.close()
+            METRICS.inc("zoombo_connections_closed_total")
+
+    def _handshake(self) -> bool:
+        """
+        Key exchange and registration.
+        :returns: False if the client was rejected.
+        """
+        # 0. Initial handshake: must exchange symmetric key first. If not, reject.
+        first = _recv(self.reader)
+        started = time.perf_counter()
+        if first["type"] == "exchange_sym":
+            self.sym_key, key_fields = key_exchange(first)
+            self.crypto = CryptoSession(self.sym_key, self.nonce, protocol.TO_CLIENT)
+            self.wire = protocol.negotiate(first.get("wire"))
+            _send(self.sock, {
+                "type": "exchange_sym_response",
+                **key_fields,
+                "nonce": self.nonce.hex(),
+                "wire": self.wire
+            })
+            self._writer.start()
+
+        elif first["type"] == "resume":
+            # Reconnect with a ticket: no RSA, no registration; the seat is taken over below.
+            keys = resume_keys(first)
+            if keys is None:
+                _send(self.sock, {"type": "reject", "reason": "Session expired"})
+                return False
+            ticket, self.sym_key, server_random = keys
+            self.crypto = CryptoSession(self.sym_key, self.nonce, protocol.TO_CLIENT)
+            self.wire = protocol.negotiate(first.get("wire"))
+            _send(self.sock, {
+                "type": "resume_response",
+                "server_random": server_random.hex(),
+                "nonce": self.nonce.hex(),
+                "wire": self.wire
+            })
+            self._writer.start()
+            msg = self.recv()
+            if msg.get("type") != "resume_seat" or not secrets.compare_digest(str(msg.get("proof")), ticket["proof"]):
+                self.send({"type": "reject", "reason": "Session expired"})
+                return False
+            self.resume_join = {"type": "resume_seat", "room_code": ticket["room_code"], "user_id": ticket["user_id"]}
+            METRICS.observe("zoombo_handshake_seconds", time.perf_counter() - started)
+            return True
+
+        else:
+            _send(self.sock, {"type": "reject", "reason": "Must exchange symmetric key first "})
             self.sock.close()
+            return False
+
+        # 1. Wait for registration request to get ID from server.
+        msg = self.recv()
+        if msg["type"] == "register":
+            self.user_id = secrets.token_hex(16)
+            self.name = msg["name"]
+            register_response = {
+                "type": "register_response",
+                "user_id": self.user_id,
+                "stream_id": self.stream_id
+            }
+            self.send(register_response)
+            METRICS.observe("zoombo_handshake_seconds", time.perf_counter() - started)
+        else:
+            # If not a registration request, reject and close.
+            self.send({"type": "reject", "reason": "Must register first"})
+            return False
+        return True
+
+    def recv(self) -> dict:
+        """
+        Receive one message in this connection's wire version.
+        Room-key media is passed through still sealed.
+        """
+        if self.wire == protocol.WIRE_V1:
+            return stamp_media(self, protocol.recv(self.reader, self.sym_key, self.nonce, session=self.crypto))
+        header, raw, payload = protocol.recv_v2(self.reader)
+        sealed = sealed_media(self, header, raw, payload)
+        if sealed is not None:
+            return sealed
+        return stamp_media(self, protocol.unpack_v2(header, payload, self.sym_key, self.nonce,
+                                                     session=self.crypto))
+
+    def write(self, msgs: list[dict]):
+        """
+        Send a batch from the outbox with one vectored call.
+        """
+        frames = []
+        for msg in msgs:
+            frames += frames_for(self, msg)
+        METRICS.inc("zoombo_send_calls_total", n=send_all(self.sock, frames))
+        METRICS.inc("zoombo_messages_sent_total", n=len(msgs))
+        self.bwe.on_sent(sum(map(len, frames)))
+        self.bwe.update(self.outbox.queued_bytes)
 
     def send(self, msg):
+        """
+        Queue `msg` for this client's writer; never blocks on the socket.
+        Media goes straight out over UDP instead while that path is up.
+        """
+        if self.udp and self.server.udp.send(self, msg):
+            return
+        self.outbox.put(msg)
+
+    def _write_loop(self):
+        while True:
+            # Whatever queued up while the last batch went out leaves together.
+            msgs = self.outbox.get_many(COALESCE_MAX, COALESCE_BYTES, COALESCE_WINDOW, split=split_size(self))
+            if not msgs:
+                break
+            try:
+                self.write(msgs)
+            except OSError:
+                break
+        self.outbox.close()
+
+    def close(self):
+        self.outbox.close()
+
+    def kick(self):
+        """
+        Cut this connection because a resumed one has taken over its seat; run() winds down without a leave.
+        """
+        self.superseded, self.resumable = True, False
         try:
-            _send_encrypted(self.sock, msg, self.sym_key, self.nonce)
+            self.sock.shutdown(socket.SHUT_RDWR)
         except OSError:
-            pass
+            pass   # already gone
 
-    def create_or_join_room(self):
+    def peer_info(self) -> dict:
+        """
+        Roster entry that lets other members map this client's stream id to a user.
+        """
+        return {"type": "peer", "user_id": self.user_id, "name": self.name, "stream_id": self.stream_id}
+
+    def create_or_join_room(self, msg: dict | None = None):
         """
         Wait for a message from the client to either create a new room or join an existing one.
+        :param msg: Already-received request to act on instead of waiting for one.
         :returns: The room code if a room is created or joined, otherwise None.
         """
-        msg = _recv_encrypted(self.sock, self.sym_key, self.nonce)
+        msg = msg or self.recv()
         if msg["type"] == "create_room":
             # Generate unique room code
-            code = generate_room_code()
-            while code in self.server.rooms:
-                code = generate_room_code()
+            code = self.server.new_room_code()
 
             self.room_code = code
             room = self.server.get_room(self.room_code, create=True)
+            payload = room_created(room, msg)
             room.add(self)
             print("Room created:", self.room_code)
-            _send_encrypted(self.sock, {"type": "room_created", "room_code": code}, self.sym_key, self.nonce)
+            self.send(payload)
             # Wait for the client to join the room after creation.
             return self.create_or_join_room()
 
         elif msg["type"] == "join":
-            # Check if the room exists, if not reject and close the connection.
+            # Rooms live on one worker when sharded; pass the connection to it.
             room_code = msg["room_code"].upper()
+            if not self.server.owns(room_code):
+                self.server.hand_off(self, msg)
+                return None
+
+            # Check if the room exists, if not reject and close the connection.
             if room_code not in self.server.rooms:
                 payload = {
                     "type": "reject",
                     "reason": "Room does not exist"
                 }
-                _send_encrypted(self.sock, payload, self.sym_key, self.nonce)
-                self.sock.close()
+                self.send(payload)
+                self.close()
                 return None
 
             # Room code exists, so join it.
+            room = self.server.get_room(room_code, create=False)
+            # Broadcast rooms: everyone but the creator and token holders watches, served
+            # by relay nodes when there are any.
+            self.viewer = is_viewer(self, room, msg)
+            if self.viewer is None:
+                self.close()
+                return None
+            if msg.get("relay") is not None or (self.viewer and self.server.relays):
+                return join_listener(self, room, msg)
             self.room_code = room_code
-            room = self.server.get_room(self.room_code, create=False)
+            self.media_key = room.media_key
+            self.room_keyed = wants_room_key(self, msg)
             if not room.add(self):
                 return None
 
@@ -178,13 +546,24 @@ class Client(threading.Thread):
                 "room_code": self.room_code,
                 "user_id": self.user_id
             }
-            _send_encrypted(self.sock, payload, self.sym_key, self.nonce)
+            if self.room_keyed:
+                payload["media_key"] = room.media_key.hex()
+            if self.viewer:
+                payload["viewer"] = True
+            issue_ticket(self, payload)
+            self.send(payload)
             return self.room_code
 
+        elif msg["type"] == "resume_seat" and msg is self.resume_join:
+            # Only ever our own record of a checked ticket, never a client message.
+            if not self.server.owns(msg["room_code"]):
+                self.server.hand_off(self, msg)
+                return None
+            return take_seat(self, msg)
+
         else:
-            _send_encrypted(self.sock, {"type": "reject", "reason": "Must join or create room after registration"},
-                            self.sym_key, self.nonce)
-            self.sock.close()
+            self.send({"type": "reject", "reason": "Must join or create room after registration"})
+            self.close()
             return None
 
 
@@ -193,6 +572,23 @@ class Room:
         self.code = code
         self.clients: Dict[str, Client] = {}
         self._lock = threading.Lock()
+        # Shared key members seal their media with, so the server can relay it untouched.
+        self.media_key = secrets.token_bytes(16)
+        self.mixer: RoomMixer | None = None   # set by Server in AUDIO_MIX_MODE
+        self.recorder: RoomRecorder | None = None   # set by Server when RECORD_DIR is set
+        self.capacity = SETTINGS.get("ROOM_CAPACITY", 4)
+        # Video fan-out is bounded: each member only receives the last-N speakers (+ its pin).
+        self.last_n = SETTINGS.get("LAST_N", 3)
+        self.speakers = SpeakerTracker()
+        self._visible: Dict[str, List[str]] = {}   # member -> senders whose video it gets
+        # Broadcast rooms (town halls): viewers join receive-only and nobody is told about them.
+        self.broadcast_mode = False
+        self.presenter_token: str | None = None    # given to the creator; joins quoting it present
+        self.relays: Dict[str, Client] = {}        # relay nodes subscribed to this room
+
+    def members(self) -> List[Client]:
+        with self._lock:
+            return list(self.clients.values())
 
     def add(self, client: Client) -> bool:
         """
@@ -202,13 +598,26 @@ class Room:
 
         with self._lock:
             # If the room is full, reject the client.
-            if len(self.clients) >= 4:
+            if len(self.clients) >= self.capacity:
                 client.send({"type": "reject", "reason": "Room is full"})
-                client.sock.close()
+                client.close()
                 return False
 
             # 1) Add the client to the room's client list.
             self.clients[client.user_id] = client
+            if not client.viewer:
+                self.speakers.add(client.user_id)
+            # The newcomer starts from the current speakers; it is only told about later changes
+            # (a layout message here would arrive ahead of room_created / room_joined).
+            self._visible[client.user_id] = self.speakers.visible_for(client.user_id, self.last_n)
+            peers = self.roster(exclude=client)
+
+        # Tell the newcomer who is already here, and everyone else about the newcomer.
+        for peer in peers:
+            client.send(peer)
+        if client.viewer:
+            return True
+        self.broadcast(client.peer_info(), client.user_id)
 
         # 2) Broadcast a 'status' message to all clients in the room.
         inner = {
@@ -218,49 +627,275 @@ class Room:
             "user_id": client.user_id
         }
         self.broadcast(inner, client.user_id)
+        self.relayout()
 
         return True
 
+    def roster(self, exclude: "Client" = None) -> List[dict]:
+        # peer_info of everyone a newcomer should know about; viewers stay anonymous.
+        return [c.peer_info() for c in self.clients.values() if c is not exclude and not c.viewer]
+
+    def add_relay(self, relay: "Client"):
+        """
+        Subscribe a relay node: it gets every message the room broadcasts, all
+        layers, for its own viewers, and is never announced to anyone.
+        """
+        with self._lock:
+            self.relays[relay.user_id] = relay
+            peers = self.roster()
+        for peer in peers:
+            relay.send(peer)
+
+    def replace(self, old: "Client", new: "Client"):
+        # Same user id, so speaker history, layout and mixer state carry over as they are.
+        with self._lock:
+            if self.clients.get(old.user_id) is old:
+                self.clients[old.user_id] = new
+
     def drop(self, cl: "Client"):
         with self._lock:
-            if cl.user_id in self.clients:
-                self.clients.pop(cl.user_id, None)
+            if self.relays.get(cl.user_id) is cl:
+                del self.relays[cl.user_id]
+                return
+            if self.clients.get(cl.user_id) is not cl:
+                return   # never seated, or its seat went to a resumed connection
+            self.clients.pop(cl.user_id)
+            self.speakers.remove(cl.user_id)
+            self._visible.pop(cl.user_id, None)
+        if cl.viewer:
+            return
+        if self.mixer:
+            self.mixer.forget(cl.user_id)
         # Plaintext "leave" is fine (or you could AES-encrypt it if you prefer)
         self.broadcast({"type": "leave", "from": cl.user_id, "name": cl.name})
+        self.relayout()
+
+    def note_audio(self, msg: dict):
+        """
+        Feed an audio packet's loudness to the speaker tracker; re-layout if the order changed.
+        """
+        level = msg.get("level")
+        if level is None:
+            # Senders without a header level (v1) are measured here; their audio is plaintext.
+            level = audio_level(msg["data"]) if "data" in msg else 0
+        with self._lock:
+            changed = self.speakers.update(msg["from"], level)
+        if changed:
+            self.relayout()
+
+    def relayout(self):
+        """
+        Recompute which senders each member sees and tell those whose set changed.
+        """
+        updates = []
+        with self._lock:
+            dominant = self.speakers.recent[0] if self.speakers.recent else None
+            for uid, c in self.clients.items():
+                visible = self.speakers.visible_for(uid, self.last_n, c.pinned)
+                if self._visible.get(uid) != visible:
+                    self._visible[uid] = visible
+                    updates.append((c, visible))
+        for c, visible in updates:
+            c.send({"type": "layout", "visible": visible, "dominant": dominant, "pinned": c.pinned})
+
+    def layout_for(self, c: "Client") -> dict:
+        # The current layout, for a member that missed the updates (a resumed connection).
+        with self._lock:
+            dominant = self.speakers.recent[0] if self.speakers.recent else None
+            return {"type": "layout", "visible": self._visible.get(c.user_id, []),
+                    "dominant": dominant, "pinned": c.pinned}
+
+    def sees(self, c: "Client", msg: dict) -> bool:
+        # Only video is subject to last-N; everything else reaches everyone.
+        return msg.get("type") != "frame" or msg["from"] in self._visible.get(c.user_id, ())
 
     def broadcast(self, msg: dict, exclude_client_id: str = None):
         """
         Broadcast a message to all clients in this room, except the one with `exclude_client_id`.
+        Each send only enqueues, so a slow member can't hold up the others.
+        In AUDIO_MIX_MODE audio goes to the room mixer instead, and unmixed to relay nodes.
+        Media is also handed to the room's recorder, if it has one.
         """
-        with self._lock:
-            for c in list(self.clients.values()):
-                if c.user_id != exclude_client_id:
-                    c.send(msg)
+        started = time.perf_counter()
+        kind = msg.get("type")
+        labels = (self.code, kind if kind in MESSAGE_TYPES else "other")
+        METRICS.inc("zoombo_messages_total", labels)
+        METRICS.inc("zoombo_bytes_total", labels, payload_size(msg))
+        if self.recorder and kind in protocol.MEDIA_KINDS:
+            self.recorder.offer(msg)   # never blocks; drops if the disk falls behind
+        self._fan_out(msg, exclude_client_id)
+        METRICS.observe("zoombo_broadcast_seconds", time.perf_counter() - started)
+
+    def _fan_out(self, msg: dict, exclude_client_id: str | None):
+        if msg.get("type") == "audio":
+            self.note_audio(msg)
+        if self.mixer and msg.get("type") == "audio":
+            # Relay nodes mirror the room without a mixer: their viewers get each presenter's stream.
+            for r in list(self.relays.values()):
+                r.send(msg)
+            if "sealed" in msg:
+                msg = protocol.open_sealed(msg, self.media_key)
+            self.mixer.push(msg["from"], msg["data"])
+            return
+        for c in self.members():
+            if c.user_id != exclude_client_id and self.sees(c, msg) and wants_layer(c, msg):
+                c.send(msg)
+        for r in list(self.relays.values()):
+            r.send(msg)
 
 class Server:
     def __init__(self):
         self.rooms: Dict[str, Room] = {}
         self._lock = threading.Lock()
+        self._stream_ids = itertools.count(1)
+        self.metrics_port = SETTINGS.get("METRICS_PORT", 0)
+        self.udp_port = SETTINGS.get("UDP_PORT", 0)
+        self.udp: UdpRelay | None = None
+        self.queue_wait_observer = None   # set once metrics are being served
+        # Relay nodes ("host:port") that serve broadcast-room viewers, and their last reported
+        # (viewers, capacity).
+        self.relays: List[Tuple[str, int]] = [(h, int(p)) for h, p in
+                                              (a.rsplit(":", 1) for a in SETTINGS.get("RELAYS", []))]
+        self.relay_load: Dict[Tuple[str, int], Tuple[int, int]] = {}
+
+    def next_stream_id(self) -> int:
+        with self._lock:
+            return next(self._stream_ids)
+
+    def owns(self, code: str) -> bool:
+        """
+        Whether rooms with this code live in this process. Always true unless sharded.
+        """
+        return True
+
+    def new_room_code(self) -> str:
+        code = generate_room_code()
+        while code in self.rooms or not self.owns(code):
+            code = generate_room_code()
+        return code
 
     def get_room(self, code, create=False) -> Room:
         with self._lock:
             if code not in self.rooms and create:
-                self.rooms[code] = Room(code)
+                room = self.rooms[code] = Room(code)
+                if SETTINGS.get("AUDIO_MIX_MODE", False):
+                    room.mixer = RoomMixer(room)
+                    self._start_mixer(room.mixer)
+                if SETTINGS.get("RECORD_DIR"):
+                    room.recorder = RoomRecorder(code, room.media_key, SETTINGS["RECORD_DIR"],
+                                                 SETTINGS.get("RECORD_SEGMENT_MINUTES", 5) * 60,
+                                                 SETTINGS.get("RECORD_QUEUE_SIZE", 512))
+                    # Disk writes get their own thread on either engine.
+                    threading.Thread(target=room.recorder.run_forever, daemon=True).start()
             return self.rooms[code]
 
+    def pick_relay(self) -> Tuple[str, int] | None:
+        """
+        The relay with the fewest viewers that still has room, or None if all are full.
+        """
+        with self._lock:
+            open_ = [a for a in self.relays
+                     if not self.relay_load.get(a, (0, 0))[1] or self.relay_load[a][0] < self.relay_load[a][1]]
+            if not open_:
+                return None
+            addr = min(open_, key=lambda a: self.relay_load.get(a, (0, 0))[0])
+            # Count the viewer now; the relay's next report corrects the guess.
+            viewers, capacity = self.relay_load.get(addr, (0, 0))
+            self.relay_load[addr] = (viewers + 1, capacity)
+            return addr
+
+    def _start_mixer(self, mixer: RoomMixer):
+        threading.Thread(target=mixer.run_forever, daemon=True).start()
+
+    def queue_stats(self) -> dict:
+        """
+        Outbound queue depth, drop counts and bandwidth estimate for every connected client, by room.
+        """
+        with self._lock:
+            rooms = list(self.rooms.values())
+        return {room.code: {uid: {"name": c.name, **c.outbox.stats(), **c.bwe.stats()} for uid, c in list(room.clients.items())}
+                for room in rooms}
+
     def drop(self, code, cl):
         with self._lock:
             if code in self.rooms:
                 self.rooms[code].drop(cl)
                 if not self.rooms[code].clients:
+                    if self.rooms[code].mixer:
+                        self.rooms[code].mixer.stop()
+                    if self.rooms[code].recorder:
+                        self.rooms[code].recorder.stop()
+                    for relay in list(self.rooms[code].relays.values()):
+                        relay.kick()   # its relay closes the room for its viewers
                     del self.rooms[code]
                     print(f"Room {code} is empty and has been removed.")
 
-    def serve_forever(self):
-        with socket.create_server((HOST, PORT)) as srv:
-            print(f"Server listening on {socket.gethostbyname(socket.gethostname())}:{PORT}")
+    def park(self, cl):
+        """
+        Hold the seat of `cl`, whose connection dropped, for RESUME_GRACE seconds.
+        The room is told it left only if no resumed connection takes the seat by then.
+        """
+        self._call_later(RESUME_GRACE, self._expire, cl)
+
+    def _expire(self, cl):
+        room = self.rooms.get(cl.room_code)
+        if room is not None and room.clients.get(cl.user_id) is cl:
+            self.drop(cl.room_code, cl)
+
+    def _call_later(self, delay, fn, *args):
+        timer = threading.Timer(delay, fn, args)
+        timer.daemon = True
+        timer.start()
+
+    def start_metrics(self):
+        """
+        Serve /metrics if METRICS_PORT is set, and switch on the per-message timers it reports.
+        """
+        if not self.metrics_port:
+            return
+        serve_metrics(self, SETTINGS.get("METRICS_HOST", "127.0.0.1"), self.metrics_port)
+        self.queue_wait_observer = METRICS.timer("zoombo_queue_wait_seconds")
+        protocol.observe = lambda stage, seconds: METRICS.observe("zoombo_codec_seconds", seconds, (stage,))
+        print(f"Metrics on http://{SETTINGS.get('METRICS_HOST', '127.0.0.1')}:{self.metrics_port}/metrics")
+
+    def _start_udp(self, host):
+        if self.udp_port:
+            self.udp = UdpRelay(self, self.udp_port)
+            threading.Thread(target=self.udp.serve_forever, args=(host,), daemon=True).start()
+
+    def _listen(self, host, port) -> socket.socket:
+        return socket.create_server((host, port), backlog=SETTINGS.get("LISTEN_BACKLOG", 128))
+
+    def serve_forever(self, host=HOST, port=PORT):
+        self.start_metrics()
+        self._start_udp(host)
+        with self._listen(host, port) as srv:
+            print(f"Server listening on {socket.gethostbyname(socket.gethostname())}:{port}")
             while True:
                 sock, addr = srv.accept(); Client(sock, addr, self).start()
 
+def engine(settings: dict) -> str:
+    """
+    Which server the settings ask for: "sharded", "asyncio" or "threaded".
+    :raises SystemExit: For WORKERS > 1 with the asyncio engine; shard.py forks threaded
+                        workers, so running them would quietly ignore the engine asked for.
+    """
+    name = settings.get("SERVER_ENGINE", "threaded")
+    if settings.get("WORKERS", 1) > 1:
+        if name != "threaded":
+            raise SystemExit(f"WORKERS > 1 needs SERVER_ENGINE \"threaded\", not {name!r}")
+        return "sharded"
+    return name
+
 if __name__ == "__main__":
-    Server().serve_forever()
\ No newline at end of file
+    match engine(SETTINGS):
+        case "sharded":
+            # One process per core, rooms pinned to workers by code.
+            from shard import serve_sharded
+            serve_sharded(SETTINGS["WORKERS"])
+        case "asyncio":
+            # One event loop for every connection instead of a thread per client.
+            from aio_server import AsyncServer
+            AsyncServer().serve_forever()
+        case _:
+            Server().serve_forever()
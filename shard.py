@@ -0,0 +1,127 @@
+"""
+shard.py – multi-process server: one worker per core, rooms pinned to workers.
+
+A supervisor forks N workers that all listen on the same port with
+SO_REUSEPORT, so the kernel spreads new connections across them. Every
+room belongs to exactly one worker, picked by hashing its code:
+
+  • create_room: the worker only hands out codes that hash to itself, so
+    codes stay globally unique without any shared state.
+  • join: a worker that receives a join for a room it doesn't own passes the
+    connection (the socket fd plus keys and registration) to the owner over
+    a Unix datagram socket; the owner carries on from the join.
+
+Stream ids are allocated from disjoint sequences (worker i: i+1, i+1+N, …).
+
+Enable with "WORKERS": N in settings/server_settings.json (Linux only). The
+workers are threaded servers; server.py refuses WORKERS > 1 together with
+SERVER_ENGINE "asyncio".
+"""
+
+import os, sys, json, socket, signal, threading, itertools, zlib
+from server import Server, Client, HOST, PORT, SETTINGS
+from encryption import CryptoSession
+import protocol
+from framing import FrameReader
+
+
+def owner_of(code: str, workers: int) -> int:
+    # crc32 rather than hash(): must agree across processes.
+    return zlib.crc32(code.encode()) % workers
+
+
+class ShardServer(Server):
+    def __init__(self, index: int, workers: int, inboxes: list[tuple[socket.socket, socket.socket]]):
+        super().__init__()
+        self.index, self.workers = index, workers
+        self._inboxes = inboxes          # per worker: (send end, receive end)
+        self._stream_ids = itertools.count(index + 1, workers)
+        if self.metrics_port:
+            self.metrics_port += index      # one endpoint per worker
+        if self.udp_port:
+            self.udp_port += index          # UDP media goes straight to the room's worker
+        self.handoffs_out = self.handoffs_in = 0
+
+    def owns(self, code: str) -> bool:
+        return owner_of(code, self.workers) == self.index
+
+    def hand_off(self, cl: Client, join_msg: dict):
+        """
+        Pass `cl`, mid-join, to the worker that owns the room it asked for.
+        """
+        # Nothing may still be in flight from this side once the owner starts writing.
+        cl.close()
+        if cl._writer.is_alive():
+            cl._writer.join(timeout=1.0)
+        state = {
+            "user_id": cl.user_id, "name": cl.name, "stream_id": cl.stream_id,
+            "sym_key": cl.sym_key.hex(), "nonce": cl.nonce.hex(),
+            "wire": cl.wire, "seq": next(cl._seq), "join": join_msg,
+            # Anything the client sent after its join that we already pulled off the socket.
+            "pending": cl.reader.pending().hex(),
+        }
+        owner = owner_of(join_msg["room_code"].upper(), self.workers)
+        socket.send_fds(self._inboxes[owner][0], [json.dumps(state).encode()], [cl.sock.fileno()])
+        self.handoffs_out += 1
+        # Our copy of the fd is closed by Client.run; the owner's copy keeps the connection open.
+
+    def _accept_handoffs(self):
+        inbox = self._inboxes[self.index][1]
+        while True:
+            data, fds, _flags, _addr = socket.recv_fds(inbox, 1 << 16, 1)
+            if not fds:
+                continue
+            sock = socket.socket(fileno=fds[0])
+            state = json.loads(data)
+            cl = Client(sock, sock.getpeername(), self)
+            cl.reader = FrameReader(sock, pending=bytes.fromhex(state["pending"]))
+            cl.user_id, cl.name, cl.stream_id = state["user_id"], state["name"], state["stream_id"]
+            cl.sym_key, cl.nonce = bytes.fromhex(state["sym_key"]), bytes.fromhex(state["nonce"])
+            cl.crypto = CryptoSession(cl.sym_key, cl.nonce, protocol.TO_CLIENT)
+            cl.wire, cl._seq = state["wire"], itertools.count(state["seq"])
+            cl.resume_join = state["join"]
+            self.handoffs_in += 1
+            cl.start()
+
+    def _listen(self, host, port) -> socket.socket:
+        return socket.create_server((host, port), reuse_port=True,
+                                    backlog=SETTINGS.get("LISTEN_BACKLOG", 128))
+
+    def serve_forever(self, host=HOST, port=PORT):
+        threading.Thread(target=self._accept_handoffs, daemon=True).start()
+        print(f"Worker {self.index}/{self.workers} (pid {os.getpid()}) listening on :{port}")
+        super().serve_forever(host, port)
+
+
+def serve_sharded(workers: int, host=HOST, port=PORT):
+    """
+    Fork `workers` ShardServers and restart any that die.
+    """
+    inboxes = [socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM) for _ in range(workers)]
+
+    def spawn(index: int) -> int:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            try:
+                ShardServer(index, workers, inboxes).serve_forever(host, port)
+            finally:
+                os._exit(1)
+        return pid
+
+    pids = {spawn(i): i for i in range(workers)}
+    # Turn SIGTERM into a clean shutdown of the workers below.
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        while True:
+            pid, status = os.wait()
+            index = pids.pop(pid)
+            print(f"Worker {index} exited ({status}); restarting. Its rooms are lost.")
+            pids[spawn(index)] = index
+    finally:
+        for pid in pids:
+            os.kill(pid, signal.SIGTERM)
+
+
+if __name__ == "__main__":
+    serve_sharded(int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count())
@@ -0,0 +1,78 @@
+"""
+speakers.py – active-speaker detection for large rooms.
+
+Senders tag every audio packet with its loudness ("level": 0 silent …
+127 full scale, carried in the cleartext v2 header so room-key audio needs
+no decryption). The server smooths those levels per member and keeps a
+most-recent-speaker order; each receiver then only gets video for the
+last-N speakers (plus whoever it pinned).
+"""
+
+import time
+import numpy as np
+
+SPEECH_LEVEL = 77      # smoothed level above which someone counts as talking (~ -50 dBov)
+SMOOTHING = 0.2        # EMA weight of each 20 ms packet
+HOLD = 0.8             # seconds a new speaker must wait before displacing the front speaker
+
+
+def audio_level(pcm: bytes) -> int:
+    """
+    Loudness of an int16 PCM frame, 0 (silence) … 127 (full scale), 1 dB steps.
+    """
+    samples = np.frombuffer(pcm, dtype=np.int16, count=len(pcm) // 2)
+    if not samples.size:
+        return 0
+    rms = np.sqrt(np.mean(samples.astype(np.float32) ** 2))
+    if rms < 1.0:
+        return 0
+    return int(np.clip(127 + 20 * np.log10(rms / 32768), 0, 127))
+
+
+class SpeakerTracker:
+    def __init__(self):
+        self.recent: list[str] = []          # most recent speaker first
+        self._smoothed: dict[str, float] = {}
+        self._switched = 0.0
+
+    def add(self, user_id: str):
+        # Newcomers go to the back so a silent room still shows somebody.
+        if user_id not in self.recent:
+            self.recent.append(user_id)
+
+    def remove(self, user_id: str) -> bool:
+        self._smoothed.pop(user_id, None)
+        if user_id in self.recent:
+            self.recent.remove(user_id)
+            return True
+        return False
+
+    def update(self, user_id: str, level: int, now: float | None = None) -> bool:
+        """
+        Feed one packet's level.
+        :returns: True if the speaker order changed.
+        """
+        now = time.monotonic() if now is None else now
+        prev = self._smoothed.get(user_id, 0.0)
+        smoothed = self._smoothed[user_id] = prev + SMOOTHING * (level - prev)
+        if smoothed < SPEECH_LEVEL or (self.recent and self.recent[0] == user_id):
+            return False
+        if now - self._switched < HOLD:
+            return False
+        if user_id in self.recent:
+            self.recent.remove(user_id)
+        self.recent.insert(0, user_id)
+        self._switched = now
+        return True
+
+    def visible_for(self, user_id: str, last_n: int, pinned: str | None = None) -> list[str]:
+        """
+        Senders whose video `user_id` should receive: its pin, then the most recent speakers.
+        """
+        out = [pinned] if pinned and pinned != user_id and pinned in self.recent else []
+        for uid in self.recent:
+            if len(out) >= last_n:
+                break
+            if uid != user_id and uid not in out:
+                out.append(uid)
+        return out
@@ -0,0 +1,6 @@
+import os, sys
+
+# The modules under test live flat in the repository root; settings/ paths are relative to it.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
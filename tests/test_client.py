@@ -0,0 +1,41 @@
+import socket, threading, types
+import pytest
+from outbound import OutboundQueue
+
+client = pytest.importorskip("client")     # needs PyQt5, OpenCV and PyAudio
+
+
+def room(sock: socket.socket):
+    """
+    Just the state ChatRoom's writer and reconnect path use, around a real outbox.
+    """
+    r = types.SimpleNamespace(
+        sock=sock, wire=client.protocol.WIRE_V4, _ticket=None, _resume_grace=0, terminating=False,
+        _outbox=OutboundQueue(8), _online=threading.Event(), _wire_lock=threading.Lock(), _udp=None,
+        _bwe=types.SimpleNamespace(on_sent=lambda n: None, update=lambda q: None),
+        _capture=types.SimpleNamespace(sent=lambda ts, layer: None),
+        _frames_for=lambda msg, split: [b"frame"])
+    r._online.set()
+    r._stop_writer = lambda: client.ChatRoom._stop_writer(r)
+    r._resume = lambda: client.ChatRoom._resume(r)
+    return r
+
+
+def test_dead_socket_without_a_ticket_ends_the_writer():
+    a, b = socket.socketpair()
+    b.close()
+    a.close()
+    r = room(a)
+    writer = threading.Thread(target=client.ChatRoom._write_loop, args=(r,), daemon=True)
+    writer.start()
+    r._outbox.put({"type": "chat", "text": "hi"})
+    # The failed send parks the writer instead of retrying the same batch forever.
+    for _ in range(100):
+        if not r._online.is_set():
+            break
+        threading.Event().wait(0.01)
+    assert not r._online.is_set() and writer.is_alive()
+    assert client.ChatRoom._reconnect(r) is False
+    writer.join(timeout=2)
+    assert not writer.is_alive()
+    assert r._outbox.closed
@@ -0,0 +1,90 @@
+import socket, sys
+import pytest
+from congestion import (kernel_backlog, BandwidthEstimator, VideoLadder,
+                        INTERVAL, INCREASE, DECREASE, HIGH_DELAY)
+
+
+@pytest.fixture
+def sock():
+    a, b = socket.socketpair()
+    yield a
+    a.close()
+    b.close()
+
+def run(bwe: BandwidthEstimator, sent_per_interval: int, queued: int = 0, intervals: int = 1) -> int:
+    now = bwe._last
+    for _ in range(intervals):
+        now += INTERVAL
+        bwe.on_sent(sent_per_interval)
+        target = bwe.update(queued, now=now)
+    return target
+
+
+def test_idle_socket_has_no_backlog(sock):
+    assert kernel_backlog(sock) == 0
+
+def test_closed_socket_has_no_backlog(sock):
+    sock.close()
+    assert kernel_backlog(sock) == 0
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="SIOCOUTQNSD is Linux only")
+def test_backlog_counts_what_a_stalled_peer_left_unsent():
+    server = socket.create_server(("127.0.0.1", 0))
+    peer_side = socket.create_connection(server.getsockname())
+    peer, _ = server.accept()
+    try:
+        peer_side.setblocking(False)
+        sent = 0
+        try:
+            while True:
+                sent += peer_side.send(bytes(65536))
+        except BlockingIOError:
+            pass
+        # The peer never reads, so most of it is still in our send queue, not acknowledged in flight.
+        assert 0 < kernel_backlog(peer_side) <= sent
+    finally:
+        for s in (peer, peer_side, server):
+            s.close()
+
+def test_update_acts_only_every_interval(sock):
+    bwe = BandwidthEstimator(sock, start_bps=1_000_000)
+    bwe.on_sent(10_000)
+    assert bwe.update(now=bwe._last + INTERVAL / 2) == 1_000_000
+    assert bwe.delivery_bps == 0.0
+
+def test_probes_upward_while_the_queue_is_empty(sock):
+    bwe = BandwidthEstimator(sock, start_bps=1_000_000)
+    assert run(bwe, 50_000) == int(1_000_000 * INCREASE)
+    assert not bwe.congested
+
+def test_backs_off_below_the_delivery_rate_when_delayed(sock):
+    bwe = BandwidthEstimator(sock, start_bps=5_000_000)
+    run(bwe, 50_000, intervals=20)                 # ~800 kbit/s delivered
+    target = run(bwe, 50_000, queued=200_000)      # 1.6 Mbit queued: ~2 s of delay
+    assert bwe.delay > HIGH_DELAY and bwe.congested
+    assert target == int(DECREASE * bwe.delivery_bps)
+
+def test_target_stays_within_bounds(sock):
+    bwe = BandwidthEstimator(sock, start_bps=1_000_000, min_bps=200_000, max_bps=1_500_000)
+    assert run(bwe, 1_000_000, intervals=20) == 1_500_000
+    assert run(bwe, 0, queued=10_000_000, intervals=20) == 200_000
+
+def test_ladder_steps_down_over_budget_and_back_up_with_headroom():
+    ladder = VideoLadder(quality=60, fps=15)
+    start = ladder._since
+    ladder.on_frame(100_000)                       # 400 kbit/s over the hold window
+    assert not ladder.adapt(100_000, now=start + VideoLadder.HOLD / 2)
+    assert ladder.adapt(100_000, now=start + VideoLadder.HOLD)
+    assert ladder.rung == (0, 40, 15)
+    ladder.on_frame(10_000)                        # 40 kbit/s
+    assert ladder.adapt(1_000_000, now=start + 2 * VideoLadder.HOLD)
+    assert ladder.index == 0
+
+def test_ladder_stops_at_its_ends():
+    ladder = VideoLadder(quality=60, fps=15)
+    now = ladder._since
+    assert not ladder.adapt(1_000_000, now=now + VideoLadder.HOLD)   # already at the top
+    for i in range(len(ladder.rungs) + 2):
+        ladder.on_frame(1_000_000)
+        ladder.adapt(1_000, now=now + (i + 2) * VideoLadder.HOLD)
+    assert ladder.rung == ladder.rungs[-1]
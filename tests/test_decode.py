@@ -0,0 +1,68 @@
+import threading, time
+from decode import DecodePool
+
+TIMEOUT = 2.0
+
+
+class Recorder:
+    """
+    deliver() callback that remembers what it got and signals each delivery.
+    """
+    def __init__(self):
+        self.frames = []
+        self.event = threading.Event()
+
+    def __call__(self, sender, ts, image):
+        self.frames.append((sender, ts, image))
+        self.event.set()
+
+
+def test_decodes_and_delivers():
+    got = Recorder()
+    pool = DecodePool(lambda data: data.upper(), got, workers=1)
+    pool.submit("a", 1.0, b"jpeg")
+    assert got.event.wait(TIMEOUT)
+    pool.close()
+    assert got.frames == [("a", 1.0, b"JPEG")]
+    assert pool.stats()["decoded"] == 1
+
+def test_late_frame_dropped_on_arrival():
+    pool = DecodePool(lambda data: None, Recorder(), workers=1)
+    pool.submit("a", 2.0, b"x")
+    pool.submit("a", 1.0, b"x")
+    pool.close()
+    assert pool.stats()["received"] == 2
+    assert pool.stats()["late"] == 1
+
+def test_failed_decode_is_counted_not_delivered():
+    got, decoded = Recorder(), threading.Event()
+    def decode(data):
+        decoded.set()
+        return None
+    pool = DecodePool(decode, got, workers=1)
+    pool.submit("a", 1.0, b"x")
+    assert decoded.wait(TIMEOUT)
+    pool.close()
+    for _ in range(100):
+        if pool.stats()["failed"]:
+            break
+        time.sleep(0.01)
+    assert pool.stats()["failed"] == 1
+    assert got.frames == []
+
+def test_forgotten_while_decoding_is_not_delivered():
+    got, started, release = Recorder(), threading.Event(), threading.Event()
+    def decode(data):
+        started.set()
+        release.wait(TIMEOUT)
+        return data
+    pool = DecodePool(decode, got, workers=1)
+    pool.submit("a", 1.0, b"old")
+    assert started.wait(TIMEOUT)
+    pool.forget("a")
+    release.set()
+    # A rejoin gets a new generation, so its frames are delivered again.
+    pool.submit("a", 0.5, b"new")
+    assert got.event.wait(TIMEOUT)
+    pool.close()
+    assert got.frames == [("a", 0.5, b"new")]
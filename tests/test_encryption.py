@@ -0,0 +1,78 @@
+import pytest
+from encryption import (generate_x25519_keypair, x25519_shared_key, KeypairPool, rsa_encrypt, rsa_decrypt,
+                        aes_encrypt, CryptoSession)
+
+KEY, NONCE = bytes(range(16)), bytes(range(8))
+
+
+def test_x25519_both_ends_agree():
+    a_pub, a_priv = generate_x25519_keypair()
+    b_pub, b_priv = generate_x25519_keypair()
+    context = a_pub + b_pub
+    key = x25519_shared_key(a_priv, b_pub, context)
+    assert len(key) == 16
+    assert key == x25519_shared_key(b_priv, a_pub, context)
+
+def test_x25519_key_is_bound_to_the_context():
+    a_pub, a_priv = generate_x25519_keypair()
+    b_pub, b_priv = generate_x25519_keypair()
+    assert x25519_shared_key(a_priv, b_pub, b"one") != x25519_shared_key(b_priv, a_pub, b"two")
+
+def test_x25519_rejects_an_invalid_public_key():
+    _pub, priv = generate_x25519_keypair()
+    with pytest.raises(ValueError):
+        x25519_shared_key(priv, b"short")
+
+def test_keypair_pool_hands_out_working_distinct_pairs():
+    pool = KeypairPool(size=1, bits=1024)
+    (pub1, priv1), (pub2, _priv2) = pool.take(), pool.take()
+    assert pub1 != pub2
+    assert rsa_decrypt(rsa_encrypt(b"sym key", pub1), priv1) == b"sym key"
+
+
+def test_session_crypt_matches_aes_ctr():
+    session = CryptoSession(KEY)
+    for n in (0, 1, 15, 16, 17, 5000):
+        data = bytes(range(256)) * (n // 256) + bytes(range(n % 256))
+        assert session.crypt(data, NONCE) == aes_encrypt(data, KEY, NONCE)
+
+def test_session_grows_past_its_scratch_buffers():
+    session = CryptoSession(KEY)
+    data = bytes(64 * 16 * 3 + 5)
+    assert session.crypt(data, NONCE) == aes_encrypt(data, KEY, NONCE)
+    assert session.crypt(b"abc", NONCE) == aes_encrypt(b"abc", KEY, NONCE)
+
+def test_session_crypt_into_an_output_buffer():
+    session = CryptoSession(KEY)
+    out = bytearray(5)
+    assert session.crypt(b"hello", NONCE, out) is out
+    assert bytes(out) == aes_encrypt(b"hello", KEY, NONCE)
+
+def test_message_nonce_is_direction_and_sequence():
+    assert CryptoSession.message_nonce(1, 7) == bytes([1, 0, 0, 0, 0, 0, 0, 7])
+    assert CryptoSession.message_nonce(0, 2 ** 32 + 7) == CryptoSession.message_nonce(0, 7)
+
+def test_each_end_decrypts_what_the_other_encrypts():
+    client, server = CryptoSession(KEY, direction=0), CryptoSession(KEY, direction=1)
+    assert server.decrypt(client.encrypt(b"up", 3), 3) == b"up"
+    assert client.decrypt(server.encrypt(b"down", 3), 3) == b"down"
+
+def test_no_keystream_is_reused_across_directions_or_messages():
+    client, server = CryptoSession(KEY, direction=0), CryptoSession(KEY, direction=1)
+    zeros = bytes(32)
+    streams = {client.encrypt(zeros, 1), client.encrypt(zeros, 2), server.encrypt(zeros, 1)}
+    assert len(streams) == 3
+    assert client.decrypt(client.encrypt(b"same", 1), 1) != b"same"      # own direction: wrong nonce
+
+def test_batched_crypt_matches_one_at_a_time():
+    session = CryptoSession(KEY, direction=0)
+    messages = [(seq, bytes([seq]) * size) for seq, size in enumerate((0, 1, 16, 33, 700))]
+    outputs = [None, None, bytearray(16), None, bytearray(700)]
+    batch = session.encrypt_many(messages, outputs)
+    assert [bytes(b) for b in batch] == [session.encrypt(data, seq) for seq, data in messages]
+    assert batch[2] is outputs[2]
+    peer = CryptoSession(KEY, direction=1)
+    assert peer.decrypt_many([(seq, bytes(b)) for (seq, _data), b in zip(messages, batch)]) == \
+        [data for _seq, data in messages]
+    # crypt_many must leave the counter blocks as crypt expects them.
+    assert session.crypt(bytes(100), NONCE) == aes_encrypt(bytes(100), KEY, NONCE)
@@ -0,0 +1,52 @@
+# Both server engines against the load generator's real-protocol clients.
+import argparse, asyncio, socket, threading, time
+import pytest
+import protocol
+import loadgen
+from server import Server
+from aio_server import AsyncServer
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start(engine) -> int:
+    server = engine()
+    server.metrics_port = server.udp_port = 0
+    port = free_port()
+    threading.Thread(target=server.serve_forever, args=("127.0.0.1", port), daemon=True).start()
+    deadline = time.monotonic() + 5
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return port
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+def options(port: int, **overrides) -> argparse.Namespace:
+    opts = dict(host="127.0.0.1", port=port, room_size=3, video_senders=1, viewers=0, fps=10,
+                frame_bytes=20_000, audio_ms=20, audio_bytes=640, chat_every=0.2, duration=0.5,
+                wire=protocol.WIRE_V4, room_key=False, kex="x25519", concurrency=8)
+    return argparse.Namespace(**{**opts, **overrides})
+
+
+@pytest.fixture(scope="module", params=[Server, AsyncServer], ids=["threaded", "asyncio"])
+def port(request):
+    return start(request.param)
+
+@pytest.mark.parametrize("wire, room_key, kex", [
+    (protocol.WIRE_V1, False, "rsa"),
+    (protocol.WIRE_V2, True, "x25519"),
+    (protocol.WIRE_V4, False, "x25519"),
+])
+def test_rooms_relay_media_and_chat(port, wire, room_key, kex):
+    result = asyncio.run(loadgen._run_rooms(options(port, wire=wire, room_key=room_key, kex=kex), rooms=2))
+    assert result["failed"] == 0
+    assert len(result["setup"]) == 6
+    # Each message a member sends reaches the other two members of its room.
+    assert result["received"] >= result["sent"]
+    assert result["latency"]["frame"] and result["latency"]["audio"]
@@ -0,0 +1,109 @@
+import asyncio, socket
+import pytest
+from framing import FrameReader, PREFIX, MAX_FRAME, send_all
+import protocol
+
+
+class ChunkedSocket:
+    """
+    recv_into that hands out `data` at most `chunk` bytes at a time, then EOF.
+    """
+    def __init__(self, data: bytes, chunk: int):
+        self.data, self.chunk, self.calls = data, chunk, 0
+
+    def recv_into(self, view) -> int:
+        self.calls += 1
+        n = min(self.chunk, len(view), len(self.data))
+        view[:n], self.data = self.data[:n], self.data[n:]
+        return n
+
+class SlowSocket:
+    """
+    sendmsg that accepts at most `limit` bytes per call.
+    """
+    def __init__(self, limit: int):
+        self.limit, self.out, self.calls = limit, bytearray(), 0
+
+    def sendmsg(self, buffers) -> int:
+        self.calls += 1
+        data = b"".join(bytes(b) for b in buffers)[:self.limit]
+        self.out += data
+        return len(data)
+
+def prefixed(payload: bytes) -> bytes:
+    return PREFIX.pack(len(payload)) + payload
+
+
+@pytest.mark.parametrize("chunk", [1, 3, 7, 1000])
+def test_frames_survive_any_split(chunk):
+    payloads = [b"a", b"", b"b" * 300, b"c" * 5]
+    reader = FrameReader(ChunkedSocket(b"".join(map(prefixed, payloads)), chunk), size=64)
+    assert [bytes(reader.read_prefixed()) for _ in payloads] == payloads
+    with pytest.raises(ConnectionError):
+        reader.read_prefixed()
+
+def test_one_recv_serves_several_frames():
+    sock = ChunkedSocket(b"".join(prefixed(b"x" * 10) for _ in range(20)), 1 << 16)
+    reader = FrameReader(sock)
+    for _ in range(20):
+        reader.read_prefixed()
+    assert reader.reads == 1
+
+def test_buffer_grows_for_a_big_frame_and_old_views_stay_valid():
+    sock = ChunkedSocket(prefixed(b"small") + prefixed(b"B" * 5000), 100)
+    reader = FrameReader(sock, size=64)
+    first = reader.read_prefixed()
+    assert bytes(reader.read_prefixed()) == b"B" * 5000
+    assert bytes(first) == b"small"
+
+def test_oversized_length_is_refused_before_reading_it():
+    sock = ChunkedSocket(PREFIX.pack(MAX_FRAME + 1) + b"x" * 100, 1000)
+    with pytest.raises(ValueError):
+        FrameReader(sock).read_prefixed()
+
+def test_header_frames_and_pending_bytes():
+    frame = protocol.pack({"type": "chat", "text": "hi"}, bytes(16), bytes(8), protocol.WIRE_V2)
+    reader = FrameReader(ChunkedSocket(bytes(frame) + b"rest", 1000))
+    header, whole = reader.read_frame(protocol.HEADER)
+    assert bytes(whole) == bytes(frame) and header[-1] == len(frame) - protocol.HEADER.size
+    assert reader.pending() == b"rest"
+
+def test_a_handed_over_reader_starts_with_the_pending_bytes():
+    reader = FrameReader(ChunkedSocket(b"yz", 1000), pending=PREFIX.pack(2) + b"ab" + PREFIX.pack(2))
+    assert bytes(reader.read_prefixed()) == b"ab"
+    assert bytes(reader.read_prefixed()) == b"yz"
+
+def test_send_all_finishes_partial_writes_in_order():
+    sock = SlowSocket(limit=7)
+    buffers = [b"hello ", b"vectored ", b"world"]
+    calls = send_all(sock, buffers)
+    assert bytes(sock.out) == b"hello vectored world"
+    assert calls == sock.calls == 3
+    assert buffers == [b"hello ", b"vectored ", b"world"]     # the caller's list is left alone
+
+def test_send_all_one_call_when_it_fits():
+    a, b = socket.socketpair()
+    try:
+        assert send_all(a, [b"one", b"two", b"three"]) == 1
+        assert b.recv(100) == b"onetwothree"
+    finally:
+        a.close()
+        b.close()
+
+
+# The asyncio engine reads with StreamReader.readexactly and must bound lengths the same way.
+
+def test_asyncio_engine_refuses_oversized_frames():
+    import aio_server
+
+    async def recv(data: bytes):
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await aio_server._recv(reader)
+
+    assert asyncio.run(recv(prefixed(b'{"type": "ok"}'))) == {"type": "ok"}
+    with pytest.raises(ConnectionError):
+        asyncio.run(recv(PREFIX.pack(MAX_FRAME + 1)))
+    with pytest.raises(ConnectionError):
+        asyncio.run(recv(prefixed(b'{"type": "ok"}')[:-1]))
@@ -0,0 +1,79 @@
+from jitter import JitterBuffer, AUDIO_FRESH
+
+DELAY = 0.06
+
+
+class Frame:
+    """
+    Stands in for a decoded image: all the buffer looks at is nbytes.
+    """
+    def __init__(self, name: str, nbytes: int = 100):
+        self.name, self.nbytes = name, nbytes
+
+
+def names(due) -> list[tuple[str, str]]:
+    return [(sender, frame.name) for sender, frame in due]
+
+
+def test_frame_waits_for_its_playout_time():
+    jb = JitterBuffer(DELAY)
+    jb.push("a", 100.0, Frame("f"), now=100.0)
+    lag = jb.lag("a", now=100.0)
+    assert jb.due(now=100.0 + lag - 0.001) == []
+    assert names(jb.due(now=100.0 + lag)) == [("a", "f")]
+    assert jb.stats()["shown"] == 1
+
+def test_unknown_sender_plays_at_the_default_delay():
+    assert JitterBuffer(DELAY).lag("nobody", now=1.0) == DELAY
+
+def test_only_the_newest_due_frame_is_shown():
+    jb = JitterBuffer(DELAY)
+    for i in range(3):
+        jb.push("a", 100.0 + i / 100, Frame(f"f{i}"), now=100.0 + i / 100)
+    assert names(jb.due(now=200.0)) == [("a", "f2")]
+    assert jb.late == 2 and jb.bytes == 0
+
+def test_frames_older_than_the_last_shown_are_late():
+    jb = JitterBuffer(DELAY)
+    jb.push("a", 100.0, Frame("f"), now=100.0)
+    jb.due(now=200.0)
+    jb.push("a", 99.0, Frame("old"), now=200.0)
+    assert jb.late == 1 and jb.due(now=300.0) == []
+
+def test_out_of_order_frames_are_sorted():
+    jb = JitterBuffer(DELAY)
+    jb.push("a", 100.02, Frame("late"), now=100.02)
+    jb.push("a", 100.01, Frame("early"), now=100.02)
+    lag = jb.lag("a", now=100.02)
+    assert names(jb.due(now=100.01 + lag)) == [("a", "early")]
+
+def test_audio_drives_the_clock_while_it_is_fresh():
+    jb = JitterBuffer(DELAY)
+    jb.push("a", 100.0, Frame("f"), now=100.0)
+    jb.audio("a", 0.5, now=100.0)
+    assert jb.lag("a", now=100.0) == 0.5
+    assert jb.due(now=100.4) == []
+    assert names(jb.due(now=100.5)) == [("a", "f")]
+    assert jb.lag("a", now=100.0 + AUDIO_FRESH) != 0.5     # stale audio: back to video timing
+
+def test_per_sender_frame_limit_drops_the_oldest():
+    jb = JitterBuffer(DELAY, max_frames=2)
+    for i in range(3):
+        jb.push("a", 100.0 + i, Frame(f"f{i}"), now=100.0)
+    assert jb.overflow == 1 and jb.stats()["frames"] == 2
+
+def test_memory_limit_drops_the_oldest_across_senders():
+    jb = JitterBuffer(DELAY, max_bytes=250)
+    jb.push("a", 100.0, Frame("a0"), now=100.0)
+    jb.push("b", 100.5, Frame("b0"), now=100.5)
+    jb.push("a", 101.0, Frame("a1"), now=101.0)
+    assert jb.overflow == 1 and jb.bytes == 200
+    assert sorted(names(jb.due(now=200.0))) == [("a", "a1"), ("b", "b0")]
+
+def test_forget_frees_frames_and_clocks():
+    jb = JitterBuffer(DELAY)
+    jb.push("a", 100.0, Frame("f"), now=100.0)
+    jb.audio("a", 0.5, now=100.0)
+    jb.forget("a")
+    assert jb.bytes == 0 and jb.stats()["senders"] == 0
+    assert jb.lag("a", now=100.0) == DELAY
@@ -0,0 +1,51 @@
+import argparse, asyncio, math, socket
+import loadgen
+import protocol
+from loadgen import Stats, _pct
+
+
+def test_latency_samples_are_kept_until_the_cap(monkeypatch):
+    monkeypatch.setattr(loadgen, "SAMPLE_CAP", 10)
+    stats = Stats()
+    for i in range(10):
+        stats.add_latency("frame", i)
+    assert stats.latency["frame"] == list(range(10))
+
+def test_reservoir_stays_at_the_cap_and_takes_newer_samples(monkeypatch):
+    monkeypatch.setattr(loadgen, "SAMPLE_CAP", 10)
+    stats = Stats()
+    for i in range(1000):
+        stats.add_latency("audio", i)
+    samples = stats.latency["audio"]
+    assert len(samples) == 10 and stats._seen["audio"] == 1000
+    assert max(samples) >= 10                      # not just the first ten
+    assert stats.latency["frame"] == []
+
+def test_merge_adds_exported_counters_and_samples():
+    a, b = Stats(), Stats()
+    a.sent, a.received, a.setup = 3, 5, [0.1]
+    a.add_latency("frame", 0.01)
+    b.sent, b.failed, b.setup = 2, 1, [0.2, 0.3]
+    b.add_latency("frame", 0.02)
+    b.add_latency("audio", 0.03)
+    a.merge(b.export())
+    assert (a.sent, a.received, a.failed) == (5, 5, 1)
+    assert a.setup == [0.1, 0.2, 0.3]
+    assert a.latency == {"frame": [0.01, 0.02], "audio": [0.03]}
+
+def test_percentiles_are_in_milliseconds():
+    samples = [i / 1000 for i in range(100)]
+    assert _pct(samples, .5) == 50
+    assert _pct(samples, .99) == 99
+    assert _pct(samples, 1) == 99                  # clamped to the last sample
+    assert math.isnan(_pct([], .5))
+
+def test_unreachable_server_counts_failed_rooms():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]           # nothing listens here once it is closed
+    opts = argparse.Namespace(host="127.0.0.1", port=port, room_size=2, video_senders=1, viewers=2,
+                              fps=10, frame_bytes=1000, audio_ms=20, audio_bytes=640, chat_every=0,
+                              duration=0.1, wire=protocol.WIRE_V4, room_key=False, kex="x25519", concurrency=4)
+    result = asyncio.run(loadgen._run_rooms(opts, rooms=3))
+    assert result["failed"] == 3 and result["sent"] == 0 and result["setup"] == []
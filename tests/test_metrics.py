@@ -0,0 +1,42 @@
+import threading
+from metrics import Metrics
+
+MESSAGES = "zoombo_messages_total"
+
+
+def in_thread(fn):
+    t = threading.Thread(target=fn)
+    t.start()
+    t.join()
+
+
+def test_shards_are_summed():
+    m = Metrics()
+    m.inc(MESSAGES, ("A", "chat"))
+    in_thread(lambda: m.inc(MESSAGES, ("A", "chat"), 2))
+    counters, _hists = m.collect()
+    assert counters[MESSAGES, ("A", "chat")] == 3
+
+def test_scrape_leaves_live_shards_to_their_owner():
+    m = Metrics()
+    m.inc(MESSAGES, ("gone", "chat"))
+    m.inc(MESSAGES, ("live", "chat"))
+    m.observe("zoombo_codec_seconds", 0.001, ("json",))
+    counters, hists = m.collect(live_rooms={"live"})
+    assert (MESSAGES, ("gone", "chat")) not in counters
+    assert counters[MESSAGES, ("live", "chat")] == 1
+    assert ("zoombo_codec_seconds", ("json",)) in hists
+    shard = m._local.shard[0]
+    assert (MESSAGES, ("gone", "chat")) in shard          # untouched by the scrape
+    m.inc(MESSAGES, ("live", "chat"))
+    assert (MESSAGES, ("gone", "chat")) not in shard      # dropped by its owner
+    assert shard[MESSAGES, ("live", "chat")] == 2
+
+def test_finished_threads_are_retired_and_pruned():
+    m = Metrics()
+    in_thread(lambda: m.inc(MESSAGES, ("A", "chat")))
+    in_thread(lambda: m.inc(MESSAGES, ("B", "chat")))
+    counters, _hists = m.collect(live_rooms={"A"})
+    assert counters == {(MESSAGES, ("A", "chat")): 1}
+    counters, _hists = m.collect()
+    assert counters == {(MESSAGES, ("A", "chat")): 1}
@@ -0,0 +1,83 @@
+import numpy as np
+import protocol
+from mixer import RoomMixer, CHUNK
+
+
+def tone(value: int) -> bytes:
+    return np.full(CHUNK, value, dtype=np.int16).tobytes()
+
+def samples(pcm: bytes) -> np.ndarray:
+    return np.frombuffer(pcm, dtype=np.int16)
+
+
+class Member:
+    def __init__(self, user_id: str):
+        self.user_id, self.sent = user_id, []
+
+    def send(self, msg: dict):
+        self.sent.append(msg)
+
+class Room:
+    def __init__(self, *members: Member):
+        self._members = list(members)
+
+    def members(self):
+        return self._members
+
+
+def test_everyone_hears_everyone_but_themselves():
+    mixer = RoomMixer(None)
+    mixer.push("a", tone(100))
+    mixer.push("b", tone(20))
+    out = mixer.mix(["a", "b", "c"])
+    assert samples(out["a"])[0] == 20
+    assert samples(out["b"])[0] == 100
+    assert samples(out["c"])[0] == 120
+
+def test_a_lone_speaker_gets_nothing_back():
+    mixer = RoomMixer(None)
+    mixer.push("a", tone(100))
+    assert set(mixer.mix(["a", "b"])) == {"b"}
+
+def test_silence_mixes_nothing():
+    mixer = RoomMixer(None)
+    mixer.push("a", b"-1")              # mute marker
+    assert mixer.mix(["a", "b"]) == {}
+    assert mixer.stats()["ticks"] == 0
+
+def test_one_frame_per_speaker_per_tick():
+    mixer = RoomMixer(None)
+    mixer.push("a", tone(1))
+    mixer.push("a", tone(2))
+    assert samples(mixer.mix(["b"])["b"])[0] == 1
+    assert samples(mixer.mix(["b"])["b"])[0] == 2
+    assert mixer.mix(["b"]) == {}
+
+def test_pending_is_bounded_oldest_first():
+    mixer = RoomMixer(None, max_pending=2)
+    for value in (1, 2, 3):
+        mixer.push("a", tone(value))
+    assert samples(mixer.mix(["b"])["b"])[0] == 2
+
+def test_loud_mix_is_scaled_not_clipped():
+    mixer = RoomMixer(None)
+    for uid in ("a", "b", "c"):
+        mixer.push(uid, tone(20000))
+    out = samples(mixer.mix(["d"])["d"])
+    assert out.max() == 32767 and out.min() == 32767
+
+def test_forget_drops_a_speaker():
+    mixer = RoomMixer(None)
+    mixer.push("a", tone(100))
+    mixer.forget("a")
+    assert mixer.mix(["b"]) == {}
+
+def test_tick_sends_each_member_the_mix():
+    a, b = Member("a"), Member("b")
+    mixer = RoomMixer(Room(a, b))
+    mixer.push("a", tone(50))
+    mixer.tick()
+    assert a.sent == []
+    [msg] = b.sent
+    assert msg["from"] == protocol.MIX_SENDER and msg["stream_id"] == protocol.MIX_STREAM_ID
+    assert samples(msg["data"])[0] == 50
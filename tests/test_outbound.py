@@ -0,0 +1,130 @@
+import pytest
+from outbound import OutboundQueue
+
+
+def msg(kind: str, n: int = 0, size: int = 0) -> dict:
+    return {"type": kind, "n": n, "data": bytes(size)}
+
+def drain(q: OutboundQueue) -> list[tuple[str, int]]:
+    out = []
+    while (m := q.get_nowait()) is not None:
+        out.append((m["type"], m["n"]))
+    return out
+
+
+def test_priority_order_and_fifo_within_a_class():
+    q = OutboundQueue()
+    for kind, n in [("chat", 0), ("frame", 1), ("audio", 2), ("status", 3), ("audio", 4), ("frame", 5)]:
+        q.put(msg(kind, n))
+    assert drain(q) == [("status", 3), ("audio", 2), ("audio", 4), ("frame", 1), ("frame", 5), ("chat", 0)]
+
+def test_prioritize_off_keeps_arrival_order():
+    q = OutboundQueue(prioritize=False)
+    for kind, n in [("chat", 0), ("frame", 1), ("status", 2)]:
+        q.put(msg(kind, n))
+    assert drain(q) == [("chat", 0), ("frame", 1), ("status", 2)]
+
+def test_unknown_policy_is_refused():
+    with pytest.raises(ValueError):
+        OutboundQueue(policy="random")
+
+def test_video_first_evicts_oldest_frame():
+    q = OutboundQueue(maxsize=3)
+    q.put(msg("frame", 0))
+    q.put(msg("audio", 1))
+    q.put(msg("frame", 2))
+    assert q.put(msg("audio", 3))
+    assert q.dropped == {"frame": 1}
+    assert drain(q) == [("audio", 1), ("audio", 3), ("frame", 2)]
+
+def test_video_first_lets_protected_traffic_overflow_to_the_hard_limit():
+    q = OutboundQueue(maxsize=2, hard_limit=3)
+    assert q.put(msg("audio", 0)) and q.put(msg("audio", 1))
+    assert not q.put(msg("frame", 2))         # nothing to evict for a frame
+    assert q.put(msg("status", 3))            # over maxsize, under hard_limit
+    assert not q.put(msg("audio", 4))         # at hard_limit
+    assert q.dropped == {"frame": 1, "audio": 1}
+    assert len(q) == 3
+
+def test_oldest_policy_evicts_across_classes():
+    q = OutboundQueue(maxsize=2, policy="oldest")
+    q.put(msg("audio", 0))
+    q.put(msg("status", 1))
+    assert q.put(msg("chat", 2))
+    assert q.dropped == {"audio": 1}
+    assert drain(q) == [("status", 1), ("chat", 2)]
+
+def test_newest_policy_refuses_the_incoming_message():
+    q = OutboundQueue(maxsize=1, policy="newest")
+    q.put(msg("frame", 0))
+    assert not q.put(msg("status", 1))
+    assert q.dropped == {"status": 1}
+    assert drain(q) == [("frame", 0)]
+
+def test_resumed_rest_goes_next_in_its_class_and_is_never_evicted():
+    q = OutboundQueue(maxsize=2)
+    q.put(msg("frame", 0))
+    first = q.get_nowait()
+    q.resume({"type": "frame", "n": first["n"], "fragments": [[b"x"]], "size": 1})
+    q.put(msg("frame", 1))
+    q.put(msg("audio", 2))                    # full: evicts frame 1, not the resumed rest
+    assert q.dropped == {"frame": 1}
+    assert drain(q) == [("audio", 2), ("frame", 0)]
+    assert len(q) == 0 and q.queued_bytes == 0
+
+def test_drop_resumed_forgets_the_rest():
+    q = OutboundQueue()
+    q.resume({"type": "frame", "n": 0, "fragments": [[b"xy"]], "size": 2})
+    q.drop_resumed()
+    assert len(q) == 0 and q.queued_bytes == 0
+    assert q.get_nowait() is None
+
+def test_get_many_batches_up_to_its_limits():
+    q = OutboundQueue()
+    for i in range(5):
+        q.put(msg("audio", i, size=100))
+    assert [m["n"] for m in q.get_many(max_msgs=3)] == [0, 1, 2]
+    assert [m["n"] for m in q.get_many(max_bytes=100)] == [3]
+    assert [m["n"] for m in q.get_many()] == [4]
+    assert q.get_many(timeout=0.01) == []
+
+def test_get_many_stops_after_a_message_to_split():
+    q = OutboundQueue()
+    q.put(msg("frame", 0, size=5000))
+    q.put(msg("frame", 1, size=10))
+    assert [m["n"] for m in q.get_many(split=1000)] == [0]
+
+def test_closed_queue_drains_then_returns_nothing():
+    q = OutboundQueue()
+    q.put(msg("status", 0))
+    q.close()
+    assert not q.put(msg("status", 1))
+    assert [m["n"] for m in q.get_many()] == [0]
+    assert q.get_many() == [] and q.get() is None
+
+def test_requeue_goes_ahead_of_its_class_in_order():
+    q = OutboundQueue()
+    for i in range(3):
+        q.put(msg("status", i))
+    taken = q.get_many(max_msgs=2)
+    q.put(msg("status", 3))
+    q.requeue(taken)
+    assert drain(q) == [("status", 0), ("status", 1), ("status", 2), ("status", 3)]
+
+def test_requeue_keeps_priority_and_accounting():
+    q = OutboundQueue()
+    q.put(msg("chat", 0, size=10))
+    taken = q.get_many()
+    q.put(msg("audio", 1, size=5))
+    q.requeue(taken)
+    assert len(q) == 2 and q.queued_bytes == 15
+    assert drain(q) == [("audio", 1), ("chat", 0)]
+    assert len(q) == 0 and q.queued_bytes == 0
+
+def test_requeue_after_close_is_ignored():
+    q = OutboundQueue()
+    q.put(msg("status"))
+    taken = q.get_many()
+    q.close()
+    q.requeue(taken)
+    assert len(q) == 0
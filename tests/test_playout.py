@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+from playout import PlayoutMixer, SILENCE, CHUNK
+
+DELAY = 0.06
+
+
+def tone(value: int) -> bytes:
+    return np.full(CHUNK, value, dtype=np.int16).tobytes()
+
+def samples(pcm: bytes) -> np.ndarray:
+    return np.frombuffer(pcm, dtype=np.int16)
+
+
+def test_silence_when_nobody_talks():
+    assert PlayoutMixer(DELAY).mix(now=100.0) == SILENCE
+
+def test_not_a_frame_is_ignored():
+    mixer = PlayoutMixer(DELAY)
+    assert not mixer.push("a", b"-1", 100.0, now=100.0)
+    assert mixer.mix(now=200.0) == SILENCE
+
+def test_frame_waits_for_the_playout_delay():
+    mixer = PlayoutMixer(DELAY)
+    mixer.push("a", tone(1000), 100.0, now=100.01)
+    assert mixer.mix(now=100.01 + DELAY - 0.001) == SILENCE
+    assert samples(mixer.mix(now=100.01 + DELAY))[0] == 1000
+
+def test_sum_saturates_instead_of_wrapping():
+    mixer = PlayoutMixer(DELAY)
+    for sender in "ab":
+        mixer.push(sender, tone(20000), 100.0, now=100.0)
+    mixer.push("c", tone(-30000), 100.0, now=100.0)
+    mixer.push("d", tone(-30000), 100.0, now=100.0)
+    assert samples(mixer.mix(now=101.0))[0] == -20000
+    for sender in "ab":
+        mixer.push(sender, tone(20000), 100.02, now=100.02)
+    assert samples(mixer.mix(now=101.0))[0] == 32767
+
+def test_gain_and_mute():
+    mixer = PlayoutMixer(DELAY)
+    mixer.set_gain("a", 0.5)
+    mixer.set_gain("b", 0)
+    mixer.set_gain("c", 100)
+    assert mixer.gain("c") == 4.0
+    mixer.push("a", tone(20000), 100.0, now=100.0)
+    mixer.push("b", tone(20000), 100.0, now=100.0)
+    assert samples(mixer.mix(now=101.0))[0] == 10000
+
+def test_one_frame_per_sender_per_tick():
+    mixer = PlayoutMixer(DELAY)
+    for i in range(3):
+        mixer.push("a", tone(100 * (i + 1)), 100.0 + 0.02 * i, now=100.0 + 0.02 * i)
+    assert [samples(mixer.mix(now=101.0))[0] for _ in range(4)] == [100, 200, 300, 0]
+
+def test_buffer_is_bounded():
+    mixer = PlayoutMixer(DELAY, max_pending=3)
+    for i in range(5):
+        mixer.push("a", tone(i + 1), 100.0 + 0.02 * i, now=100.0 + 0.02 * i)
+    assert mixer.dropped == 2
+    assert [samples(mixer.mix(now=101.0))[0] for _ in range(3)] == [3, 4, 5]
+
+@pytest.mark.parametrize("skew", [-5.0, -0.2, 0.04, 0.2, 5.0])
+def test_skewed_sender_clock_still_plays(skew):
+    # The sender's clock is `skew` seconds ahead of ours; 10 ms network delay.
+    mixer = PlayoutMixer(DELAY)
+    played, now = 0, 1000.0
+    for i in range(100):
+        now += 0.02
+        mixer.push("a", tone(1000), now - 0.01 + skew, now=now)
+        played += samples(mixer.mix(now=now))[0] == 1000
+    assert mixer.dropped == 0
+    assert played >= 95
+    assert mixer.lag("a") == pytest.approx(DELAY + 0.01 - skew)
+
+def test_transit_floor_follows_late_arrivals_slowly():
+    mixer = PlayoutMixer(DELAY)
+    mixer.push("a", tone(1), 100.0, now=100.01)
+    mixer.push("a", tone(1), 100.02, now=100.13)      # one packet 100 ms late
+    assert mixer.lag("a") < DELAY + 0.01 + 0.01
+    mixer.push("a", tone(1), 100.04, now=100.045)     # an earlier transit lowers the floor at once
+    assert mixer.lag("a") == pytest.approx(DELAY + 0.005)
+
+def test_levels_and_forget():
+    mixer = PlayoutMixer(DELAY)
+    mixer.push("a", tone(10000), 100.0, now=100.0)
+    mixer.mix(now=101.0)
+    levels = mixer.levels()
+    assert levels["a"] > 0 and levels[None] > 0
+    mixer.forget("a")
+    mixer.mix(now=101.0)
+    assert "a" not in mixer.levels()
+    assert mixer.lag("a") == DELAY
@@ -0,0 +1,150 @@
+import pytest
+import protocol
+from encryption import CryptoSession
+from protocol import HEADER, FLAG_MORE, FLAG_ROOM_KEY
+
+KEY, NONCE = bytes(range(16)), bytes(8)
+MEDIA_KEY = bytes(range(16, 32))
+
+
+def split(frame) -> tuple[tuple, bytes]:
+    return HEADER.unpack_from(frame), bytes(frame[HEADER.size:])
+
+def sessions() -> tuple[CryptoSession, CryptoSession]:
+    # (client end, server end)
+    return CryptoSession(KEY, NONCE, protocol.TO_SERVER), CryptoSession(KEY, NONCE, protocol.TO_CLIENT)
+
+
+def test_negotiate_picks_the_highest_common_version():
+    assert protocol.negotiate(None) == protocol.WIRE_V1
+    assert protocol.negotiate([1, 2, 3, 4, 99]) == protocol.WIRE_V4
+    assert protocol.negotiate([2]) == protocol.WIRE_V2
+    assert protocol.negotiate([99]) == protocol.WIRE_V1
+
+def test_v1_round_trip_with_media():
+    msg = {"type": "audio", "data": b"\x00\x01pcm", "ts": 1.5}
+    frame = protocol.pack(msg, KEY, NONCE)
+    assert protocol.unpack_v1(frame[4:], KEY, NONCE) == msg
+
+def test_v1_rejects_other_envelopes():
+    with pytest.raises(ValueError):
+        protocol.unpack_v1(b'{"type": "chat"}', KEY, NONCE)
+
+def test_v2_json_round_trip():
+    msg = {"type": "chat", "text": "hi"}
+    header, payload = split(protocol.pack(msg, KEY, NONCE, protocol.WIRE_V2, stream_id=7, seq=3))
+    assert header[:5] == (protocol.WIRE_V2, protocol.KIND_JSON, 0, 7, 3)
+    assert header[-1] == len(payload)
+    assert b"hi" not in payload
+    assert protocol.unpack_v2(header, payload, KEY, NONCE) == msg
+
+def test_v2_media_carries_header_fields():
+    msg = {"type": "frame", "data": b"jpeg" * 10, "ts": 12.25}
+    header, payload = split(protocol.pack(msg, KEY, NONCE, protocol.WIRE_V2, stream_id=5, seq=9))
+    assert header[1] == protocol.KIND_FRAME and header[5] == 12.25
+    out = protocol.unpack_v2(header, payload, KEY, NONCE)
+    assert out == {"type": "frame", "stream_id": 5, "ts": 12.25, "data": msg["data"]}
+
+def test_simulcast_layer_rides_in_the_flags():
+    msg = {"type": "frame", "data": b"jpeg", "ts": 1.0, "layer": 1, "layers": 3}
+    header, payload = split(protocol.pack(msg, KEY, NONCE, protocol.WIRE_V2))
+    out = protocol.unpack_v2(header, payload, KEY, NONCE)
+    assert (out["layer"], out["layers"]) == (1, 3)
+    single = protocol.pack({**msg, "layer": 0, "layers": 1}, KEY, NONCE, protocol.WIRE_V2)
+    assert "layers" not in protocol.unpack_v2(*split(single), KEY, NONCE)
+
+def test_audio_level_rides_in_the_flags():
+    msg = {"type": "audio", "data": b"pcm", "ts": 1.0, "level": 42}
+    header, payload = split(protocol.pack(msg, KEY, NONCE, protocol.WIRE_V2))
+    assert protocol.unpack_v2(header, payload, KEY, NONCE)["level"] == 42
+
+def test_v3_uses_a_nonce_per_message():
+    client, server = sessions()
+    msg = {"type": "chat", "text": "same"}
+    a = protocol.pack(msg, KEY, NONCE, protocol.WIRE_V3, seq=1, session=client)
+    b = protocol.pack(msg, KEY, NONCE, protocol.WIRE_V3, seq=2, session=client)
+    assert HEADER.unpack_from(a)[0] == protocol.WIRE_V3
+    assert a[HEADER.size:] != b[HEADER.size:]
+    for frame in (a, b):
+        assert protocol.unpack_v2(*split(frame), KEY, NONCE, session=server) == msg
+
+def test_v3_needs_a_session():
+    with pytest.raises(ValueError):
+        protocol.pack({"type": "chat"}, KEY, NONCE, protocol.WIRE_V3)
+    frame = protocol.pack({"type": "chat"}, KEY, NONCE, protocol.WIRE_V3, session=sessions()[0])
+    with pytest.raises(ValueError):
+        protocol.unpack_v2(*split(frame), KEY, NONCE)
+
+def test_room_key_media_is_sealed_with_the_room_key():
+    msg = {"type": "audio", "data": b"pcm" * 5, "ts": 3.0}
+    frame = protocol.pack(msg, KEY, NONCE, protocol.WIRE_V3, stream_id=4, seq=8, media_key=MEDIA_KEY,
+                          session=sessions()[0])
+    header, payload = split(frame)
+    assert header[0] == protocol.WIRE_V2 and header[2] & FLAG_ROOM_KEY
+    assert protocol.unpack_v2(header, payload, b"", b"", MEDIA_KEY)["data"] == msg["data"]
+    with pytest.raises(ValueError):
+        protocol.unpack_v2(header, payload, KEY, NONCE)
+
+def test_unknown_version_is_refused():
+    header, payload = split(protocol.pack({"type": "chat"}, KEY, NONCE, protocol.WIRE_V2))
+    with pytest.raises(ValueError):
+        protocol.unpack_v2((9,) + header[1:], payload, KEY, NONCE)
+
+def test_media_frame_round_trip():
+    msg = {"type": "frame", "data": b"jpeg", "ts": 2.0}
+    assert protocol.read_media_frame(protocol.media_frame(msg, 3, 1))["data"] == b"jpeg"
+    sealed = protocol.media_frame(msg, 3, 1, MEDIA_KEY)
+    assert "sealed" in protocol.read_media_frame(sealed)
+    assert protocol.read_media_frame(sealed, MEDIA_KEY)["data"] == b"jpeg"
+    with pytest.raises(ValueError):
+        protocol.read_media_frame(sealed[:-1])
+
+
+# v4 fragments
+
+def feed(pieces) -> list:
+    partials, out = {}, []
+    for header_bytes, piece in pieces:
+        whole = protocol.reassemble(partials, HEADER.unpack(header_bytes), header_bytes, bytes(piece))
+        if whole is not None:
+            out.append(whole)
+    assert not partials
+    return out
+
+def test_fragments_flag_all_but_the_last():
+    frame = protocol.pack({"type": "frame", "data": bytes(range(250)), "ts": 1.0}, KEY, NONCE,
+                          protocol.WIRE_V2, stream_id=2, seq=6)
+    pieces = protocol.fragments(frame, 100)
+    flags = [HEADER.unpack(h)[2] & FLAG_MORE for h, _piece in pieces]
+    assert flags == [FLAG_MORE, FLAG_MORE, 0]
+    assert [HEADER.unpack(h)[-1] for h, _piece in pieces] == [100, 100, 50]
+
+def test_reassemble_restores_the_frame():
+    msg = {"type": "frame", "data": bytes(range(250)), "ts": 1.0}
+    frame = protocol.pack(msg, KEY, NONCE, protocol.WIRE_V2, stream_id=2, seq=6)
+    [(header, raw, payload)] = feed(protocol.fragments(frame, 64))
+    assert raw == bytes(frame[:HEADER.size])
+    assert bytes(payload) == bytes(frame[HEADER.size:])
+    assert protocol.unpack_v2(header, payload, KEY, NONCE) == {**msg, "stream_id": 2}
+
+def test_unfragmented_frame_passes_through():
+    frame = protocol.pack({"type": "chat", "text": "x"}, KEY, NONCE, protocol.WIRE_V2)
+    header, payload = split(frame)
+    assert protocol.reassemble({}, header, frame[:HEADER.size], payload) == (header, frame[:HEADER.size], payload)
+
+def test_other_streams_interleave_with_fragments():
+    a = protocol.fragments(protocol.pack({"type": "frame", "data": b"a" * 30, "ts": 1.0}, KEY, NONCE,
+                                         protocol.WIRE_V2, stream_id=1), 10)
+    b = protocol.fragments(protocol.pack({"type": "frame", "data": b"b" * 30, "ts": 1.0}, KEY, NONCE,
+                                         protocol.WIRE_V2, stream_id=2), 10)
+    out = feed([a[0], b[0], a[1], b[1], b[2], a[2]])
+    assert [(header[3], len(payload)) for header, _raw, payload in out] == [(2, 30), (1, 30)]
+
+def test_oversized_reassembly_is_refused(monkeypatch):
+    monkeypatch.setattr(protocol, "MAX_FRAME", 25)
+    frame = protocol.pack({"type": "frame", "data": bytes(40), "ts": 1.0}, KEY, NONCE, protocol.WIRE_V2)
+    pieces = protocol.fragments(frame, 10)
+    partials = {}
+    with pytest.raises(ValueError):
+        for header_bytes, piece in pieces:
+            protocol.reassemble(partials, HEADER.unpack(header_bytes), header_bytes, bytes(piece))
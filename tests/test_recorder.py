@@ -0,0 +1,118 @@
+import shutil, threading
+import numpy as np
+import pytest
+import protocol
+import recorder
+from recorder import RoomRecorder, read_index, seek, records, FLAG_GAP, MAGIC
+from mixer import FRAME_BYTES
+
+MEDIA_KEY = bytes(range(16))
+T0 = 1_700_000_000.0
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    The recorder's wall clock, advanced by hand.
+    """
+    now = [T0]
+    monkeypatch.setattr(recorder.time, "time", lambda: now[0])
+    return now
+
+def audio(sender: str, i: int) -> dict:
+    return {"type": "audio", "from": sender, "name": sender.upper(), "ts": i / 50,
+            "data": bytes([i % 256]) * FRAME_BYTES}
+
+def frame(sender: str, i: int, layer: int = 0) -> dict:
+    return {"type": "frame", "from": sender, "name": sender.upper(), "ts": i / 50, "layer": layer,
+            "data": b"jpeg%d" % i}
+
+def sealed(msg: dict) -> dict:
+    view = protocol.read_media_frame(protocol.media_frame(msg, 7, 0, MEDIA_KEY))
+    return {**view, "from": msg["from"], "name": msg["name"]}
+
+
+def test_round_trip_with_segment_rollover_and_seek(tmp_path, clock):
+    rec = RoomRecorder("ROOM", MEDIA_KEY, str(tmp_path), segment_seconds=2)
+    sent = []
+    for i in range(20):                            # 5 s of media, 4 messages a second
+        clock[0] = T0 + i / 4
+        msg = audio("a", i) if i % 2 else frame("b", i)
+        assert rec.offer(sealed(msg) if i % 5 == 0 else msg)
+        sent.append((clock[0], msg))
+        assert rec.offer(frame("b", i, layer=1))   # simulcast layers are not kept
+    rec.stop()
+    rec.run_forever()                              # drains the queue, then returns
+    assert rec.stats()["written"] == 20 and rec.dropped == 0
+
+    assert sorted(p.name for p in tmp_path.glob("ROOM-*/seg-*.zrec")) == [
+        "seg-00000.zrec", "seg-00001.zrec", "seg-00002.zrec"]
+    path = str(next(tmp_path.glob("ROOM-*")))
+    senders, marks, gaps = read_index(path)
+    assert {s["user_id"] for s in senders.values()} == {"a", "b"} and gaps == []
+    assert [(m["segment"], m["t"] - T0) for m in marks] == [(0, 0), (0, 1), (1, 2), (1, 3), (2, 4)]
+
+    got = list(records(path))
+    assert [(arrival, payload) for arrival, *_, payload in got] == [(t, m["data"]) for t, m in sent]
+    kinds = {protocol.KIND_AUDIO: "audio", protocol.KIND_FRAME: "frame"}
+    assert [(kinds[kind], senders[s]["user_id"]) for _, _, kind, _, s, _ in got] == [
+        (m["type"], m["from"]) for _, m in sent]
+
+    # Reading from a seek point starts at the last one at or before that time.
+    start = seek(marks, T0 + 3.1)
+    assert start == (1, marks[3]["offset"]) and marks[3]["t"] == T0 + 3.0
+    assert [arrival for arrival, *_ in records(path, start)] == [t for t, _ in sent if t >= T0 + 3.0]
+    assert seek(marks, T0 - 10) == (0, len(MAGIC))
+
+def test_full_queue_drops_and_marks_a_gap(tmp_path, clock):
+    rec = RoomRecorder("ROOM", MEDIA_KEY, str(tmp_path), queue_size=2)
+    assert rec.offer(audio("a", 0)) and rec.offer(audio("a", 1))
+    # The writer is behind: the fan-out thread is told so at once instead of waiting.
+    assert rec.offer(audio("a", 2)) is False
+    assert rec.offer(audio("a", 3)) is False
+    assert rec.dropped == 2
+
+    writer = threading.Thread(target=rec.run_forever)
+    writer.start()
+    for _ in range(200):
+        if rec.written == 2:
+            break
+        threading.Event().wait(0.01)
+    clock[0] = T0 + 1
+    assert rec.offer(audio("a", 4))
+    rec.stop()
+    writer.join(timeout=2)
+    assert not writer.is_alive()
+
+    path = str(next(tmp_path.glob("ROOM-*")))
+    _senders, _marks, gaps = read_index(path)
+    assert gaps == [{"t": T0 + 1, "dropped": 2}]
+    assert [flags & FLAG_GAP for _, _, _, flags, _, _ in records(path)] == [0, 0, FLAG_GAP]
+
+def test_a_record_cut_short_ends_its_segment(tmp_path, clock):
+    rec = RoomRecorder("ROOM", MEDIA_KEY, str(tmp_path))
+    for i in range(3):
+        rec.offer(audio("a", i))
+    rec.stop()
+    rec.run_forever()
+    seg = next(tmp_path.glob("ROOM-*/seg-00000.zrec"))
+    seg.write_bytes(seg.read_bytes()[:-10])        # the writer crashed mid-record
+    assert len(list(records(str(seg.parent)))) == 2
+
+
+def test_export_renders_video_and_mixed_audio(tmp_path, clock):
+    cv2 = pytest.importorskip("cv2")
+    if not shutil.which("ffmpeg"):
+        pytest.skip("ffmpeg is not on the PATH")
+    rec = RoomRecorder("ROOM", MEDIA_KEY, str(tmp_path))
+    jpeg = cv2.imencode(".jpg", np.full((90, 160, 3), 200, np.uint8))[1].tobytes()
+    for i in range(10):
+        clock[0] = T0 + i / 10
+        rec.offer({**frame("b", i), "data": jpeg})
+        rec.offer(audio("a", i))
+    rec.stop()
+    rec.run_forever()
+    out = tmp_path / "meeting.mp4"
+    files = recorder.export(str(next(tmp_path.glob("ROOM-*"))), str(out), fps=10, tile=(160, 90))
+    assert files == [str(out)] and out.stat().st_size > 0
+    assert not (tmp_path / "meeting.wav").exists()      # muxed in, then removed
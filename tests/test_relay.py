@@ -0,0 +1,90 @@
+# A broadcast room on an origin server, its viewers redirected to a relay node.
+import argparse, asyncio, socket, threading, time
+import pytest
+import protocol
+import loadgen
+import server
+from aio_server import AsyncServer
+from encryption import generate_rsa_keypair
+from relay import RelayServer
+
+SECRET = "test-relay-secret"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start(srv, port: int):
+    threading.Thread(target=srv.serve_forever, args=("127.0.0.1", port), daemon=True).start()
+    deadline = time.monotonic() + 5
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+@pytest.mark.parametrize("mix", [False, True], ids=["forwarded", "mixed"])
+def test_viewers_are_served_by_the_relay(monkeypatch, mix):
+    # A mixing origin still forwards each presenter's audio to relays, which don't mix.
+    monkeypatch.setattr(server, "RELAY_SECRET", SECRET)
+    monkeypatch.setitem(server.SETTINGS, "AUDIO_MIX_MODE", mix)
+    origin_port, relay_port = free_port(), free_port()
+    origin = server.Server()
+    origin.metrics_port = origin.udp_port = 0
+    origin.relays = [("127.0.0.1", relay_port)]
+    start(origin, origin_port)
+    relay = RelayServer(("127.0.0.1", origin_port), ("127.0.0.1", relay_port), SECRET)
+    subscribed = []
+    subscribe = relay.subscribe
+    monkeypatch.setattr(relay, "subscribe", lambda code: subscribed.append(code) or subscribe(code))
+    start(relay, relay_port)
+
+    opts = argparse.Namespace(host="127.0.0.1", port=origin_port, room_size=1, video_senders=1, viewers=4,
+                              fps=10, frame_bytes=5000, audio_ms=20, audio_bytes=640, chat_every=0,
+                              duration=0.5, wire=protocol.WIRE_V4, room_key=True, kex="x25519", concurrency=8)
+    result = asyncio.run(loadgen._run_rooms(opts, rooms=1))
+    assert result["failed"] == 0
+    # Every viewer was redirected, and the relay subscribed to the room on the origin once.
+    assert len(subscribed) == opts.viewers and len(set(subscribed)) == 1
+    # The relay fanned the sender's media out to the viewers.
+    assert result["latency"]["frame"] and result["latency"]["audio"]
+    assert result["received"] >= 3 * result["sent"]
+
+
+@pytest.mark.parametrize("engine", [server.Server, AsyncServer], ids=["threaded", "asyncio"])
+def test_only_presenter_token_holders_present(engine):
+    # No relays: the origin seats its viewers itself.
+    port = free_port()
+    origin = engine()
+    origin.metrics_port = origin.udp_port = 0
+    start(origin, port)
+    opts = argparse.Namespace(host="127.0.0.1", port=port, viewers=1, wire=protocol.WIRE_V4,
+                              room_key=False, kex="x25519")
+    keypair, stats = generate_rsa_keypair(), loadgen.Stats()
+
+    async def join(code, token=None, viewer=False):
+        p = loadgen.Participant(opts, keypair, stats)
+        p.presenter_token = token
+        await p.connect(code, viewer)
+        return p
+
+    async def scenario():
+        creator = loadgen.Participant(opts, keypair, stats)
+        code = await creator.connect(None)
+        token = creator.presenter_token
+        for forged in (True, "yes", "0" * len(token)):
+            with pytest.raises(ConnectionError, match="Not a presenter"):
+                await join(code, forged)
+        people = [creator, await join(code, token), await join(code, viewer=True)]
+        room = origin.rooms[code]
+        assert [room.clients[p.user_id].viewer for p in people] == [False, False, True]
+        for p in people:
+            p.writer.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,56 @@
+import time
+import pytest
+import resume
+
+TICKET_KEY = bytes(range(16))
+SYM_KEY = bytes(range(16, 32))
+
+
+def test_ticket_round_trip():
+    fields = resume.open_ticket(TICKET_KEY, resume.issue(TICKET_KEY, "u1", "ROOM", SYM_KEY))
+    assert (fields["user_id"], fields["room_code"]) == ("u1", "ROOM")
+    assert bytes.fromhex(fields["secret"]) == resume.session_secret(SYM_KEY, "u1")
+
+def test_tickets_are_opaque_and_unique():
+    a = resume.issue(TICKET_KEY, "u1", "ROOM", SYM_KEY)
+    b = resume.issue(TICKET_KEY, "u1", "ROOM", SYM_KEY)
+    assert a != b
+    assert "ROOM".encode().hex() not in a
+
+def test_tampered_ticket_is_rejected():
+    raw = bytearray.fromhex(resume.issue(TICKET_KEY, "u1", "ROOM", SYM_KEY))
+    for i in (0, 20, len(raw) - 1):                # nonce, body, tag
+        forged = bytearray(raw)
+        forged[i] ^= 1
+        with pytest.raises(ValueError):
+            resume.open_ticket(TICKET_KEY, forged.hex())
+
+def test_ticket_under_another_key_is_rejected():
+    ticket = resume.issue(bytes(16), "u1", "ROOM", SYM_KEY)
+    with pytest.raises(ValueError):
+        resume.open_ticket(TICKET_KEY, ticket)
+
+def test_expired_ticket_is_rejected(monkeypatch):
+    ticket = resume.issue(TICKET_KEY, "u1", "ROOM", SYM_KEY)
+    later = time.time() + resume.LIFETIME + 1
+    monkeypatch.setattr(resume.time, "time", lambda: later)
+    with pytest.raises(ValueError, match="expired"):
+        resume.open_ticket(TICKET_KEY, ticket)
+
+def test_both_ends_derive_the_same_key_and_proof():
+    secret = resume.session_secret(SYM_KEY, "u1")
+    client_random, server_random = bytes(16), bytes(range(16))
+    key = resume.session_key(secret, client_random, server_random)
+    assert len(key) == 16
+    assert key != resume.session_key(secret, server_random, client_random)
+    assert resume.proof(secret, client_random, server_random) != resume.proof(
+        resume.session_secret(bytes(16), "u1"), client_random, server_random)
+
+def test_server_turns_bad_resume_requests_away():
+    import server
+    ticket = resume.issue(server.TICKET_KEY, "u1", "ROOM", SYM_KEY)
+    forged = ticket[:-2] + ("01" if ticket.endswith("00") else "00")
+    assert server.resume_keys({"ticket": ticket, "client_random": "00" * 16}) is not None
+    for first in ({}, {"ticket": ticket}, {"ticket": "zz", "client_random": "00"},
+                  {"ticket": forged, "client_random": "00" * 16}, {"ticket": None}):
+        assert server.resume_keys(first) is None
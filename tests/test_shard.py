@@ -0,0 +1,85 @@
+import socket, threading
+import pytest
+import protocol
+import server
+from encryption import CryptoSession
+from framing import FrameReader
+from shard import ShardServer, owner_of
+
+WORKERS = 3
+
+
+@pytest.fixture
+def inboxes():
+    pairs = [socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM) for _ in range(WORKERS)]
+    yield pairs
+    for a, b in pairs:
+        a.close()
+        b.close()
+
+def shards(inboxes) -> list[ShardServer]:
+    workers = [ShardServer(i, WORKERS, inboxes) for i in range(WORKERS)]
+    for w in workers:
+        w.metrics_port = w.udp_port = 0
+    return workers
+
+
+def test_routing_is_deterministic_and_spread():
+    codes = [f"ROOM{i:02d}" for i in range(60)]
+    owners = [owner_of(code, WORKERS) for code in codes]
+    assert owners == [owner_of(code, WORKERS) for code in codes]
+    assert set(owners) == set(range(WORKERS))
+    assert all(owner_of(code, 1) == 0 for code in codes)
+
+def test_workers_only_hand_out_codes_they_own(inboxes):
+    for w in shards(inboxes):
+        for _ in range(20):
+            code = w.new_room_code()
+            assert w.owns(code) and owner_of(code, WORKERS) == w.index
+
+def test_stream_id_ranges_are_disjoint(inboxes):
+    ids = [{w.next_stream_id() for _ in range(50)} for w in shards(inboxes)]
+    for i in range(WORKERS):
+        for j in range(i + 1, WORKERS):
+            assert not ids[i] & ids[j]
+
+def test_a_join_is_handed_to_the_owning_worker(inboxes):
+    here, owner = shards(inboxes)[:2]
+    code = owner.new_room_code()
+    owner.get_room(code, create=True)
+    threading.Thread(target=owner._accept_handoffs, daemon=True).start()
+
+    ours, theirs = socket.socketpair()
+    try:
+        # A client mid-join on the wrong worker, as _handshake leaves it.
+        cl = server.Client(theirs, ("test", 0), here)
+        cl.user_id, cl.name, cl.stream_id = "u1", "Alice", here.next_stream_id()
+        cl.sym_key, cl.wire = bytes(range(16)), protocol.WIRE_V4
+        cl.crypto = CryptoSession(cl.sym_key, cl.nonce, protocol.TO_CLIENT)
+        cl.reader = FrameReader(theirs)
+        assert not here.owns(code)
+        here.hand_off(cl, {"type": "join", "room_code": code.lower()})
+        theirs.close()                             # as Client.run does; the owner has its own fd
+
+        ours.settimeout(5)
+        reply = protocol.recv(FrameReader(ours), cl.sym_key, cl.nonce, cl.wire,
+                              session=CryptoSession(cl.sym_key, cl.nonce, protocol.TO_SERVER))
+        assert (reply["type"], reply["room_code"], reply["user_id"]) == ("room_joined", code, "u1")
+        assert (here.handoffs_out, owner.handoffs_in) == (1, 1)
+        assert [c.user_id for c in owner.rooms[code].members()] == ["u1"]
+    finally:
+        ours.close()
+
+
+@pytest.mark.parametrize("settings, expected", [
+    ({}, "threaded"),
+    ({"SERVER_ENGINE": "asyncio"}, "asyncio"),
+    ({"WORKERS": 4}, "sharded"),
+    ({"WORKERS": 1, "SERVER_ENGINE": "asyncio"}, "asyncio"),
+])
+def test_engine_choice(settings, expected):
+    assert server.engine(settings) == expected
+
+def test_workers_refuse_the_asyncio_engine():
+    with pytest.raises(SystemExit, match="threaded"):
+        server.engine({"WORKERS": 4, "SERVER_ENGINE": "asyncio"})
@@ -0,0 +1,67 @@
+import numpy as np
+from speakers import audio_level, SpeakerTracker, HOLD
+
+
+def tone(value: int, n: int = 320) -> bytes:
+    return np.full(n, value, dtype=np.int16).tobytes()
+
+def talk(tracker: SpeakerTracker, user_id: str, now: float, packets: int = 30) -> bool:
+    changed = False
+    for _ in range(packets):
+        changed |= tracker.update(user_id, 120, now)
+    return changed
+
+
+def test_audio_level_scale():
+    assert audio_level(b"") == 0
+    assert audio_level(tone(0)) == 0
+    assert audio_level(tone(-32768)) == 127
+    assert 106 <= audio_level(tone(3277)) <= 107      # -20 dB
+    assert audio_level(tone(1000) + b"\x00") == audio_level(tone(1000))   # odd byte ignored
+
+def test_newcomers_join_at_the_back():
+    tracker = SpeakerTracker()
+    for uid in ("a", "b", "a"):
+        tracker.add(uid)
+    assert tracker.recent == ["a", "b"]
+
+def test_a_speaker_moves_to_the_front():
+    tracker = SpeakerTracker()
+    tracker.add("a")
+    tracker.add("b")
+    assert talk(tracker, "b", now=10.0)
+    assert tracker.recent == ["b", "a"]
+    assert not talk(tracker, "b", now=20.0)      # already in front
+
+def test_quiet_packets_never_switch():
+    tracker = SpeakerTracker()
+    tracker.add("a")
+    tracker.add("b")
+    for _ in range(100):
+        assert not tracker.update("b", 40, now=10.0)
+    assert tracker.recent == ["a", "b"]
+
+def test_hold_keeps_the_front_speaker_briefly():
+    tracker = SpeakerTracker()
+    for uid in ("a", "b", "c"):
+        tracker.add(uid)
+    talk(tracker, "b", now=10.0)
+    assert not talk(tracker, "c", now=10.0 + HOLD / 2)
+    assert talk(tracker, "c", now=10.0 + HOLD)
+    assert tracker.recent == ["c", "b", "a"]
+
+def test_visible_for_skips_self_and_puts_the_pin_first():
+    tracker = SpeakerTracker()
+    for uid in ("a", "b", "c", "d"):
+        tracker.add(uid)
+    assert tracker.visible_for("a", 2) == ["b", "c"]
+    assert tracker.visible_for("a", 2, pinned="d") == ["d", "b"]
+    assert tracker.visible_for("a", 2, pinned="a") == ["b", "c"]
+    assert tracker.visible_for("a", 2, pinned="gone") == ["b", "c"]
+
+def test_remove():
+    tracker = SpeakerTracker()
+    tracker.add("a")
+    assert tracker.remove("a")
+    assert not tracker.remove("a")
+    assert tracker.recent == []
@@ -0,0 +1,119 @@
+import pytest
+import protocol
+from udp import ReplayWindow, UdpRelay, seal, unseal, peek_stream, UP, DOWN, PROBE
+
+KEY = bytes(range(16))
+
+
+def test_replay_window_accepts_each_seq_once():
+    w = ReplayWindow()
+    assert w.accept(0) and w.accept(1)
+    assert not w.accept(1) and not w.accept(0)
+
+def test_replay_window_tolerates_reordering_within_its_size():
+    w = ReplayWindow(size=8)
+    assert w.accept(10)
+    assert w.accept(7) and w.accept(3)
+    assert not w.accept(7)
+    assert not w.accept(2)                     # 8 behind the top: out of the window
+    assert w.accept(11) and w.accept(9)
+
+def test_replay_window_big_jump_forgets_the_past():
+    w = ReplayWindow(size=8)
+    for seq in range(5):
+        w.accept(seq)
+    assert w.accept(1000)
+    assert not w.accept(4)                     # now far outside the window
+    assert w.accept(995) and not w.accept(995)
+
+def test_seal_round_trip_and_direction():
+    datagram = seal(KEY, UP, 7, 42, b"inner")
+    assert peek_stream(datagram) == 7
+    assert unseal(KEY, UP, datagram) == (7, 42, b"inner")
+    with pytest.raises(ValueError):
+        unseal(KEY, DOWN, datagram)            # a reflected datagram doesn't authenticate
+
+def test_tampered_prefix_is_rejected():
+    datagram = bytearray(seal(KEY, UP, 7, 42, b"inner"))
+    datagram[4] ^= 1                           # stream id, authenticated as AAD
+    with pytest.raises(ValueError):
+        unseal(KEY, UP, bytes(datagram))
+
+def test_peek_rejects_short_and_unknown_datagrams():
+    with pytest.raises(ValueError):
+        peek_stream(b"\x01" * 10)
+    datagram = bytearray(seal(KEY, UP, 7, 1, PROBE))
+    datagram[0] = 9
+    with pytest.raises(ValueError):
+        peek_stream(bytes(datagram))
+
+
+class Room:
+    def __init__(self):
+        self.relayed = []
+
+    def broadcast(self, msg, exclude_client_id=None):
+        self.relayed.append((msg, exclude_client_id))
+
+class Server:
+    def __init__(self):
+        self.rooms = {"ROOM": Room()}
+
+class Client:
+    def __init__(self, stream_id: int):
+        self.user_id, self.name, self.stream_id = "u1", "Ann", stream_id
+        self.room_code, self.room_keyed, self.udp = "ROOM", False, None
+        self.sent = []
+
+    def send(self, msg):
+        self.sent.append(msg)
+
+
+@pytest.fixture
+def relay():
+    relay = UdpRelay(Server(), 0)
+    relay.out = []
+    relay.sendto = lambda data, addr: relay.out.append((data, addr))
+    return relay
+
+def test_relay_learns_the_address_and_relays_media(relay):
+    cl = Client(5)
+    offer = relay.offer(cl)
+    key = bytes.fromhex(offer["key"])
+    relay.handle(seal(key, UP, 5, 0, PROBE), ("10.0.0.1", 4000))
+    assert cl.sent == [{"type": "udp_ready"}]
+    assert unseal(key, DOWN, relay.out[0][0])[2] == PROBE
+    frame = protocol.media_frame({"type": "audio", "data": b"pcm", "ts": 1.0}, 5, 1)
+    relay.handle(seal(key, UP, 5, 1, frame), ("10.0.0.1", 4000))
+    [(msg, excluded)] = relay.server.rooms["ROOM"].relayed
+    assert (msg["from"], msg["data"], excluded) == ("u1", b"pcm", "u1")
+
+def test_relay_drops_replays_forgeries_and_spoofed_streams(relay):
+    cl = Client(5)
+    key = bytes.fromhex(relay.offer(cl)["key"])
+    frame = protocol.media_frame({"type": "audio", "data": b"pcm", "ts": 1.0}, 5, 1)
+    datagram = seal(key, UP, 5, 1, frame)
+    relay.handle(datagram, ("10.0.0.1", 4000))
+    relay.handle(datagram, ("10.0.0.1", 4000))                                   # replay
+    relay.handle(seal(bytes(16), UP, 5, 2, frame), ("10.0.0.1", 4000))           # wrong key
+    other = protocol.media_frame({"type": "audio", "data": b"pcm", "ts": 1.0}, 6, 3)
+    relay.handle(seal(key, UP, 5, 3, other), ("10.0.0.1", 4000))                 # someone else's stream
+    assert len(relay.server.rooms["ROOM"].relayed) == 1
+
+def test_send_needs_a_live_peer(relay):
+    cl = Client(5)
+    msg = {"type": "audio", "data": b"pcm", "ts": 1.0, "stream_id": 6}
+    assert not relay.send(cl, msg)
+    key = bytes.fromhex(relay.offer(cl)["key"])
+    assert not relay.send(cl, msg)                   # no authenticated datagram yet
+    relay.handle(seal(key, UP, 5, 0, PROBE), ("10.0.0.1", 4000))
+    assert relay.send(cl, msg)
+    assert not relay.send(cl, {"type": "chat", "text": "hi"})
+    _stream_id, _seq, inner = unseal(key, DOWN, relay.out[-1][0])
+    assert protocol.read_media_frame(inner)["data"] == b"pcm"
+
+def test_forget(relay):
+    cl = Client(5)
+    relay.offer(cl)
+    relay.forget(cl)
+    assert cl.udp is None and relay.peers == {}
@@ -0,0 +1,278 @@
+"""
+udp.py – optional UDP media path next to the TCP control connection.
+
+Audio and video on TCP share one byte stream with chat and control, so a
+single lost segment holds up every audio packet behind it. With the UDP
+path each media message is one datagram; a lost one is just gone.
+
+Negotiation (after room_joined, over TCP):
+    client → {"type": "udp_request"}
+    server → {"type": "udp_offer", "port": P, "key": hex}       (port 0: not available)
+    client → probe datagrams to port P until the server answers
+    server → {"type": "udp_ready"} once an authenticated probe arrived
+If nothing comes back within PROBE_TIMEOUT the client stays on TCP. Either
+side drops back to TCP when keepalives stop for LIVENESS seconds; the
+client then sends {"type": "udp_close"}.
+
+Datagram:
+    PREFIX (version, stream id, seq) + AES-GCM(inner) + tag
+The prefix is authenticated as AAD. The key is the participant's own, issued
+in udp_offer, so the server knows who sent a datagram from the stream id and
+the tag proves it. The nonce is direction + seq, and a sliding window drops
+replays. Inner is a v2 media frame (protocol.media_frame). Room-key media
+stays sealed inside, so the server forwards it without decrypting.
+"""
+
+import socket, struct, threading, time, itertools, secrets
+import protocol
+from encryption import gcm_encrypt, gcm_decrypt
+
+UDP_VERSION = 1
+PREFIX = struct.Struct("!BIQ")        # version, stream id, seq
+UP, DOWN = 0, 1                       # nonce direction byte: client→server, server→client
+PROBE = b""                           # empty inner: probe / keepalive
+MAX_DATAGRAM = 65_000                 # larger media falls back to TCP
+PROBE_INTERVAL = 0.2
+PROBE_TIMEOUT = 3.0
+KEEPALIVE = 1.0
+LIVENESS = 5.0
+
+
+def seal(key: bytes, direction: int, stream_id: int, seq: int, inner: bytes) -> bytes:
+    prefix = PREFIX.pack(UDP_VERSION, stream_id, seq)
+    return prefix + gcm_encrypt(inner, key, struct.pack("!B3xQ", direction, seq), prefix)
+
+def peek_stream(datagram: bytes) -> int:
+    """
+    Stream id from a datagram's prefix, to find its key; not yet authenticated.
+    """
+    if len(datagram) < PREFIX.size + 16:
+        raise ValueError("Short datagram")
+    version, stream_id, _seq = PREFIX.unpack_from(datagram)
+    if version != UDP_VERSION:
+        raise ValueError(f"Unsupported UDP version {version}")
+    return stream_id
+
+def unseal(key: bytes, direction: int, datagram: bytes) -> tuple[int, int, bytes]:
+    """
+    :returns: (stream id, seq, inner). Raises ValueError if not authentic.
+    """
+    prefix = datagram[:PREFIX.size]
+    _version, stream_id, seq = PREFIX.unpack(prefix)
+    inner = gcm_decrypt(datagram[PREFIX.size:], key, struct.pack("!B3xQ", direction, seq), prefix)
+    return stream_id, seq, inner
+
+
+class ReplayWindow:
+    """
+    Accepts each seq once, tolerating reordering within the last `size` packets.
+    """
+    def __init__(self, size: int = 64):
+        self.size, self.top, self.seen = size, -1, 0
+
+    def accept(self, seq: int) -> bool:
+        if seq > self.top:
+            shift = seq - self.top
+            self.seen = ((self.seen << shift) | 1) & ((1 << self.size) - 1)
+            self.top = seq
+            return True
+        offset = self.top - seq
+        if offset >= self.size or self.seen >> offset & 1:
+            return False
+        self.seen |= 1 << offset
+        return True
+
+
+class UdpPeer:
+    """
+    Server-side UDP state of one participant.
+    """
+    def __init__(self):
+        self.key = secrets.token_bytes(16)
+        self.addr = None                 # learned from the first authentic datagram
+        self.seen = 0.0
+        self.replay = ReplayWindow()
+        self._seq = itertools.count()
+
+    @property
+    def live(self) -> bool:
+        return self.addr is not None and time.monotonic() - self.seen < LIVENESS
+
+
+class UdpRelay:
+    """
+    Server-side UDP endpoint, shared by every participant of this process.
+    `sendto` is provided by the engine's driver (a socket or an asyncio transport).
+    """
+    def __init__(self, server, port: int):
+        self.server, self.port = server, port
+        self.peers = {}                  # stream id -> server-side client
+        self.sendto = None
+
+    def offer(self, cl) -> dict:
+        cl.udp = UdpPeer()
+        self.peers[cl.stream_id] = cl
+        return {"type": "udp_offer", "port": self.port, "key": cl.udp.key.hex()}
+
+    def forget(self, cl):
+        if self.peers.get(cl.stream_id) is cl:
+            del self.peers[cl.stream_id]
+        cl.udp = None
+
+    def handle(self, datagram: bytes, addr):
+        """
+        One datagram from `addr`: authenticate, then relay it into the sender's room.
+        """
+        try:
+            cl = self.peers.get(peek_stream(datagram))
+            if cl is None or cl.udp is None:
+                return
+            stream_id, seq, inner = unseal(cl.udp.key, UP, datagram)
+        except ValueError:
+            return                       # forged, corrupt or for a peer that has left
+        peer = cl.udp
+        if not peer.replay.accept(seq):
+            return
+        first = peer.addr is None
+        peer.addr, peer.seen = addr, time.monotonic()   # follows NAT rebinding
+        if first:
+            cl.send({"type": "udp_ready"})
+        if inner == PROBE:
+            self.sendto(seal(peer.key, DOWN, 0, next(peer._seq), PROBE), addr)
+            return
+        try:
+            msg = protocol.read_media_frame(inner)
+        except (ValueError, struct.error):
+            return
+        if msg["stream_id"] != stream_id or ("sealed" in msg and not cl.room_keyed):
+            return
+        msg["from"], msg["name"] = cl.user_id, cl.name
+        room = self.server.rooms.get(cl.room_code)
+        if room is not None:
+            room.broadcast(msg, exclude_client_id=cl.user_id)
+
+    def send(self, cl, msg: dict) -> bool:
+        """
+        Send a media message to `cl` over UDP.
+        :returns: False if it must go over TCP instead.
+        """
+        peer = cl.udp
+        if peer is None or msg.get("type") not in protocol.MEDIA_KINDS or not peer.live:
+            return False
+        if "sealed" in msg and cl.room_keyed:
+            inner = msg["sealed"]
+        else:
+            if "sealed" in msg:
+                msg = protocol.open_sealed(msg, cl.media_key)
+            inner = protocol.media_frame(msg, msg.get("stream_id", 0), 0)
+        if len(inner) > MAX_DATAGRAM:
+            return False
+        try:
+            self.sendto(seal(peer.key, DOWN, msg.get("stream_id", 0), next(peer._seq), inner), peer.addr)
+        except OSError:
+            return False
+        return True
+
+    # ── drivers: one per server engine ──────────────────
+    def serve_forever(self, host: str):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((host, self.port))
+        self.sendto = sock.sendto
+        while True:
+            datagram, addr = sock.recvfrom(1 << 16)
+            self.handle(datagram, addr)
+
+
+class UdpLink:
+    """
+    Client side of the UDP path. Media goes out through `send`; media that
+    arrives is decoded and handed to `on_msg` from the link's own thread.
+    """
+    def __init__(self, host: str, port: int, key: bytes, stream_id: int,
+                 media_key: bytes | None, on_msg, on_down):
+        self.key, self.stream_id, self.media_key = key, stream_id, media_key
+        self.on_msg, self.on_down = on_msg, on_down
+        self.ready = False
+        self.seen = time.monotonic()
+        self.received = 0
+        self._seq = itertools.count()
+        self._replay = ReplayWindow()
+        self._closed = False
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.connect((host, port))
+        self.sock.settimeout(PROBE_INTERVAL)
+        threading.Thread(target=self._recv_loop, daemon=True).start()
+        threading.Thread(target=self._probe_loop, daemon=True).start()
+
+    def send(self, msg: dict, inner_seq: int) -> bool:
+        """
+        :param inner_seq: Sequence number for the media frame's own header (room-key nonce).
+        :returns: False if `msg` should go over TCP instead.
+        """
+        if not self.ready or msg.get("type") not in protocol.MEDIA_KINDS:
+            return False
+        inner = protocol.media_frame(msg, self.stream_id, inner_seq, self.media_key)
+        if len(inner) > MAX_DATAGRAM:
+            return False
+        try:
+            self.sock.send(seal(self.key, UP, self.stream_id, next(self._seq), inner))
+        except OSError:
+            return False
+        return True
+
+    def _probe_loop(self):
+        started = time.monotonic()
+        while not self._closed:
+            try:
+                self.sock.send(seal(self.key, UP, self.stream_id, next(self._seq), PROBE))
+            except OSError:
+                pass
+            now = time.monotonic()
+            if not self.ready and now - started > PROBE_TIMEOUT:
+                break                      # UDP looks blocked: stay on TCP
+            if self.ready and now - self.seen > LIVENESS:
+                break                      # path died: back to TCP
+            time.sleep(KEEPALIVE if self.ready else PROBE_INTERVAL)
+        if not self._closed:
+            self.close()
+            self.on_down()
+
+    def _recv_loop(self):
+        while not self._closed:
+            try:
+                datagram = self.sock.recv(1 << 16)
+                _sid, seq, inner = unseal(self.key, DOWN, datagram)
+            except socket.timeout:
+                continue
+            except ValueError:
+                continue
+            except OSError:
+                # Closed, or ICMP port unreachable; the probe loop decides when to give up.
+                if self._closed:
+                    break
+                time.sleep(PROBE_INTERVAL)
+                continue
+            if not self._replay.accept(seq):
+                continue
+            self.seen = time.monotonic()
+            self.ready = True
+            if inner == PROBE:
+                continue
+            self.received += 1
+            try:
+                self.on_msg(protocol.read_media_frame(inner, self.media_key))
+            except (ValueError, struct.error):
+                continue
+
+    def mark_ready(self):
+        # The server confirmed over TCP that our probes arrive.
+        self.seen = time.monotonic()
+        self.ready = True
+
+    def close(self):
+        self._closed = True
+        self.ready = False
+        try:
+            self.sock.close()
+        except OSError:
+            pass